@@ -3,6 +3,8 @@
 """
   default on_heartbeat handler to clean the cache.
   by invoking parent.cache.save() it will only write out the values that are still relevant.
+  the number of entries is logged, and with cache_stat, the memory they use
+  (parent.cache.memory(), which walks all the entries of the default store).
 
 """
 from sarra.sr_util import nowflt
@@ -28,8 +30,8 @@ class Hb_Cache(object):
            now       = nowflt()
            new_count = parent.cache.count
 
-           self.logger.info("hb_cache was %d, but since %5.2f sec, increased up to %d, now saved %d entries" % 
-                           ( self.last_count, now-self.last_time, count, new_count))
+           self.logger.info("hb_cache was %d, but since %5.2f sec, increased up to %d, now saved %d entries (%d bytes)" % 
+                           ( self.last_count, now-self.last_time, count, new_count, parent.cache.memory()))
 
            self.last_time  = now
            self.last_count = new_count
@@ -37,7 +39,7 @@ class Hb_Cache(object):
         else :
 
            parent.cache.save()
-           self.logger.info("hb_cache saved (%d)" % len(parent.cache.cache_dict))
+           self.logger.info("hb_cache saved (%d entries)" % parent.cache.count)
 
         return True
 
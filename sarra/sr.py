@@ -33,6 +33,7 @@ import psutil
 import re
 import shutil
 import signal
+import sqlite3
 import subprocess
 import sys
 import time
@@ -393,6 +394,13 @@ class sr_GlobalState:
                                      except Exception as ex:
                                              #print( 'info reading statefile %p gone before it was read: %s' % (p, ex) )
                                              pass
+                            elif pathname[-13:] == '.retry.sqlite':
+                                try:
+                                    db = sqlite3.connect(pathname)
+                                    self.states[c][cfg]['retry_queue'] += db.execute("SELECT COUNT(*) FROM retry").fetchone()[0]
+                                    db.close()
+                                except Exception as ex:
+                                    pass
 
                         os.chdir('..')
                 os.chdir('..')
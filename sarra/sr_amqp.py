@@ -33,6 +33,8 @@
 #
 
 import amqp
+import collections
+import socket
 
 from sarra.sr_util import *
 from urllib.parse import unquote
@@ -261,6 +263,15 @@ class Consumer:
 
         self.exchange_type = 'topic'
 
+        # batch mode (batch > 0) : messages are pushed by the broker (basic_consume)
+        # into a local deque and acknowledged cumulatively (multiple=True)
+        self.batch = 0
+        self.batch_timeout = 0.1
+        self.consumer_tag = None
+        self.delivered = collections.deque()
+        self.unacked_tag = None
+        self.unacked_count = 0
+
         self.hc.add_build(self.build)
 
         self.retry_msg = raw_message(self.logger)
@@ -274,6 +285,14 @@ class Consumer:
         #  add_* would 'add' some value to a list, btw why would we need a setter
         self.prefetch = prefetch
 
+    def set_batch(self, batch):
+        """Turn on batch consumption of up to batch messages per wakeup (0 means one basic_get per message)."""
+        self.batch = batch
+
+    def is_batch(self):
+        # pika delivers through its own ioloop, batch mode only for amqp and amqplib
+        return self.batch > 0 and not self.hc.use_pika
+
     def build(self):
         self.logger.debug("building consumer")
         self.channel = self.hc.new_channel()
@@ -283,7 +302,23 @@ class Consumer:
             a_global = False  # only apply here
             self.channel.basic_qos(prefetch_size, self.prefetch, a_global)
 
+        # deliveries and delivery tags belong to the previous channel, the broker
+        # requeues whatever was not acknowledged on it.
+        self.consumer_tag = None
+        self.delivered.clear()
+        self.unacked_tag = None
+        self.unacked_count = 0
+
     def ack(self, msg):
+        if self.is_batch():
+            # delivery tags increase monotonically on a channel and messages are processed
+            # in delivery order, so acking the last one with multiple=True acks the whole batch.
+            self.unacked_tag = msg.delivery_tag
+            self.unacked_count += 1
+            if self.unacked_count >= self.batch or not self.delivered:
+                self.ack_batch()
+            return
+
         self.logger.debug("--------------> ACK")
         self.logger.debug("--------------> %s" % msg.delivery_tag)
         # TODO 1. figure out if there is a risk of delivery_tag being 0 as we ack only single messages
@@ -301,8 +336,29 @@ class Consumer:
             self.hc.reconnect()
             self.logger.debug( "reconnected after failed basic_ack" )
 
+    def ack_batch(self):
+        """Acknowledge every message processed since the last cumulative ack."""
+        if self.unacked_tag is None:
+            return
+
+        self.logger.debug("--------------> ACK multiple up to %s (%d messages)" % (self.unacked_tag, self.unacked_count))
+        unacked_tag = self.unacked_tag
+        self.unacked_tag = None
+        self.unacked_count = 0
+
+        try:
+            self.channel.basic_ack(unacked_tag, multiple=True)
+        except Exception as err: # cannot recover failed ack, only applies within connection.
+            self.logger.warning("sr_amqp/basic_ack could not ack multiple in: %s" % (err) )
+            self.logger.debug('Exception details: ', exc_info=True)
+            self.hc.reconnect()
+            self.logger.debug( "reconnected after failed basic_ack" )
+
     def consume(self, queuename):
 
+        if self.is_batch():
+            return self.consume_batch(queuename)
+
         msg = None
 
         while True: 
@@ -332,6 +388,46 @@ class Consumer:
             self.hc.reconnect()
             self.logger.debug("consume resume ok")
 
+    def consume_batch(self, queuename):
+        """Return the next message pushed by the broker, waiting at most batch_timeout for new ones.
+
+        When the local deque is empty, pending acks are sent, then up to batch messages are
+        drained from the connection in one wakeup.
+        """
+
+        while True:
+            try:
+                if self.consumer_tag is None:
+                    self.consumer_tag = self.channel.basic_consume(queuename, callback=self.delivered.append)
+                    self.logger.debug("consume batch of %d started with consumer_tag %s" % (self.batch, self.consumer_tag))
+
+                if not self.delivered:
+                    self.ack_batch()
+                    self.drain(self.batch_timeout)
+
+                if not self.delivered:
+                    return None
+
+                msg = self.delivered.popleft()
+                msg.isRetry = False
+                return msg
+
+            except Exception as err:
+                self.logger.warning("sr_amqp/consume_batch: could not consume in queue %s: %s" % (queuename, err))
+                self.logger.debug('Exception details: ', exc_info=True)
+
+            self.hc.reconnect()
+            self.logger.debug("consume resume ok")
+
+    def drain(self, timeout):
+        """Wait up to timeout for a delivery, then collect those already received, up to batch."""
+        try:
+            self.hc.connection.drain_events(timeout=timeout)
+            while len(self.delivered) < self.batch:
+                self.hc.connection.drain_events(timeout=0)
+        except socket.timeout:
+            pass
+
 
 # ==========
 # Publisher
@@ -349,13 +445,132 @@ class Publisher:
         self.restore_queue = None
         self.channel = None
 
+        # pipelining: with confirm_window > 0 (amqp only), publisher confirms replace tx_commit and
+        # up to confirm_window messages may be unconfirmed. Otherwise, in tx mode, one tx_commit
+        # is done every tx_batch messages or tx_interval seconds, whichever comes first.
+        self.confirm_window = 0
+        self.tx_batch = 1
+        self.tx_interval = 1.0
+        self.tx_last_commit = wallflt()
+        self.publish_seq = 0
+        self.unconfirmed = collections.OrderedDict()
+        self.uncommitted = []
+        self.failed = []
+
+    def set_confirm_window(self, window):
+        self.confirm_window = window
+
+    def set_tx_batch(self, count, interval=1.0):
+        self.tx_batch = count
+        self.tx_interval = interval
+
+    def is_confirming(self):
+        return self.confirm_window > 0 and self.hc.use_amqp
+
     def build(self):
         self.channel = self.hc.new_channel()
         if self.hc.use_pika:
             self.channel.confirm_delivery()
+        elif self.is_confirming():
+            self.channel.events['basic_ack'].add(self.__on_ack__)
+            self.channel.events['basic_nack'].add(self.__on_nack__)
+            self.channel.confirm_select()
         else:
             self.channel.tx_select()
 
+        # whatever was not confirmed or committed on the previous channel is lost with it.
+        self.failed.extend(self.unconfirmed.values())
+        self.failed.extend(self.uncommitted)
+        self.unconfirmed.clear()
+        self.uncommitted = []
+        self.publish_seq = 0
+        self.tx_last_commit = wallflt()
+
+    def __on_ack__(self, delivery_tag, multiple):
+        for seq in self.__confirmed__(delivery_tag, multiple):
+            del self.unconfirmed[seq]
+
+    def __on_nack__(self, delivery_tag, multiple):
+        for seq in self.__confirmed__(delivery_tag, multiple):
+            self.logger.warning("sr_amqp/publish: broker refused message %d: %s %s"
+                                % (seq, self.unconfirmed[seq][0], self.unconfirmed[seq][1]))
+            self.failed.append(self.unconfirmed.pop(seq))
+
+    def __confirmed__(self, delivery_tag, multiple):
+        if not multiple:
+            return [delivery_tag] if delivery_tag in self.unconfirmed else []
+        # unconfirmed is ordered by sequence number.
+        return [seq for seq in self.unconfirmed if seq <= delivery_tag]
+
+    def __committed__(self, exchange_name, exchange_key, message, mheaders, mexp):
+        """Record a message just published: as unconfirmed, or commit the tx batch if it is due."""
+        confirming = self.is_confirming()
+        if not confirming and self.tx_batch <= 1:
+            self.channel.tx_commit()
+            return
+
+        # callers reuse their headers dict for the next message, keep a copy for re-publishing.
+        entry = (exchange_name, exchange_key, message, dict(mheaders) if mheaders else mheaders, mexp)
+        if confirming:
+            self.publish_seq += 1
+            self.unconfirmed[self.publish_seq] = entry
+            return
+
+        # the current message is not recorded until committed: if the commit raises,
+        # publish() retries it and build() hands the earlier ones to failed.
+        if len(self.uncommitted) + 1 >= self.tx_batch or wallflt() - self.tx_last_commit >= self.tx_interval:
+            self.tx_commit()
+        else:
+            self.uncommitted.append(entry)
+
+    def tx_commit(self):
+        self.channel.tx_commit()
+        self.uncommitted = []
+        self.tx_last_commit = wallflt()
+
+    def wait_confirms(self, window):
+        """Block until fewer than window messages are unconfirmed, or raise after iotime seconds."""
+        deadline = wallflt() + self.iotime
+        while len(self.unconfirmed) >= window:
+            timeout = deadline - wallflt()
+            if timeout <= 0:
+                raise TimeoutException("no publisher confirms for %d messages after %d seconds"
+                                       % (len(self.unconfirmed), self.iotime))
+            try:
+                self.hc.connection.drain_events(timeout=timeout)
+            except socket.timeout:
+                pass
+
+    def flush(self, force=False):
+        """Process confirms already received and commit a due tx batch.
+
+        With force, wait for every pending confirm and commit whatever is pending.
+        Messages that could not be confirmed end up in failed (see get_failed).
+        """
+        if self.channel is None or self.hc.use_pika:
+            return
+        try:
+            if self.is_confirming():
+                if force:
+                    self.wait_confirms(1)
+                elif self.unconfirmed:
+                    self.hc.connection.drain_events(timeout=0)
+            elif self.uncommitted:
+                if force or wallflt() - self.tx_last_commit >= self.tx_interval:
+                    self.tx_commit()
+        except socket.timeout:
+            pass
+        except Exception as err:
+            self.logger.error("sr_amqp/flush: %s, reconnecting" % err)
+            self.logger.debug('Exception details: ', exc_info=True)
+            self.hc.reconnect()
+
+    def get_failed(self):
+        """Return (exchange, key, message, headers, expiry) of messages refused or lost since last call."""
+        failed = self.failed
+        self.failed = []
+        return failed
+
     def is_alive(self):
         # FIXME: is_alive is dead code, it caused problems and so was removed.
         #  there are two is_alive's not sure which one is the problem.
@@ -367,6 +582,8 @@ class Publisher:
         try:
             if self.hc.use_pika:
                 self.channel.confirm_delivery()
+            elif self.is_confirming():
+                self.channel.confirm_select()
             else:
                 self.channel.tx_select()
         except Exception as err:
@@ -393,8 +610,10 @@ class Publisher:
                                        expiration=expms)
                 else:
                     msg = amqp.Message(message, content_type=ct, application_headers=mheaders)
+                if self.is_confirming():
+                    self.wait_confirms(self.confirm_window)
                 self.channel.basic_publish(msg, exchange_name, exchange_key)
-                self.channel.tx_commit()
+                self.__committed__(exchange_name, exchange_key, message, mheaders, mexp)
             elif self.hc.use_amqplib:
                 self.logger.debug("publish AMQPLIB is used")
                 if mexp:
@@ -404,7 +623,7 @@ class Publisher:
                 else:
                     msg = amqplib_0_8.Message(message, content_type=ct, application_headers=mheaders)
                 self.channel.basic_publish(msg, exchange_name, exchange_key)
-                self.channel.tx_commit()
+                self.__committed__(exchange_name, exchange_key, message, mheaders, mexp)
             elif self.hc.use_pika:
                 self.logger.debug("publish PIKA is used")
                 if mexp:
@@ -31,7 +31,13 @@
 #
 #
 
+import hashlib
+import heapq
 import os
+import sqlite3
+import sys
+
+from array import array
 
 import urllib.parse
 
@@ -46,11 +52,29 @@ import urllib.parse
 # cache_dict : {}  
 #              cache_dict[sum] = {path1*part1: time1, path2*part2: time2, ...}
 #
-from sarra.sr_util import nowflt
+# expiry     : min-heap of (time, sum, path*part) in the order entries will expire,
+#              an item is stale (skipped) when cache_dict holds a newer time for it.
+#              a line with time 0 in cache_file removes the entry (see delete_path)
+#
+# cache_store : selects the implementation, sr_cache(parent) returns an instance of
+#              the class registered in cache_stores for parent.cache_store
+#              (or for the store argument, when given).
+#              text   : the above, entirely in memory (default)
+#              sqlite : sr_cache_sqlite, entries stay on disk in an indexed table
+#              compact: sr_cache_compact, entries reduced to 64 bit digests in arrays
+#              shared : sr_cache_shared, one sqlite table for all instances of a config
+#
+from sarra.sr_util import nowflt, wallflt
 
 
 class sr_cache():
-    def __init__(self, parent ):
+    def __new__(cls, parent, store=None ):
+        if cls is sr_cache :
+           if store is None : store = getattr(parent,'cache_store','text')
+           cls = cache_stores.get(store, sr_cache)
+        return super().__new__(cls)
+
+    def __init__(self, parent, store=None ):
         parent.logger.debug("sr_cache init")
 
         self.parent        = parent
@@ -59,6 +83,7 @@ class sr_cache():
         self.expire        = parent.caching
 
         self.cache_dict    = {}
+        self.expiry        = []
         self.cache_file    = None
         self.cache_hit     = None
         self.fp            = None
@@ -80,32 +105,25 @@ class sr_cache():
 
         # set time and value
         now   = nowflt()
-        relpath = self.__get_relpath(path)
+        relpath, value = self.entry(key, path, part)
         qpath = urllib.parse.quote(relpath)
 
-     
-        #override part, when using n because n should be same regardless of size.
-        if (key[0] == 'n' ) and (part[0] not in [ 'p', 'i' ]):
-             value = '%s' % (relpath)
-        else:
-             value = '%s*%s' % (relpath, part)
+        kdict = self.lookup(key)
 
-        if key not in self.cache_dict :
+        if kdict is None :
            self.logger.debug("adding a new entry in cache")
            kdict = {}
            kdict[value] = now
-           self.cache_dict[key] = kdict
-           self.fp.write("%s %f %s %s\n"%(key,now,qpath,part))
+           self.record(key, kdict, value, now, qpath, part)
            self.count += 1
            return True
 
         self.logger.debug("sum already in cache: key value={}".format(value))
-        kdict   = self.cache_dict[key]
         present = value in kdict
         kdict[value] = now
 
         # differ or newer, write to file
-        self.fp.write("%s %f %s %s\n"%(key,now,qpath,part))
+        self.record(key, kdict, value, now, qpath, part)
         self.count += 1
 
         if present:
@@ -154,6 +172,28 @@ class sr_cache():
 
         return True
 
+    def entry(self, key, path, part):
+        """ return the relpath (per cache_basis) and the cache value for an entry """
+        relpath = self.__get_relpath(path)
+
+        #override part, when using n because n should be same regardless of size.
+        if (key[0] == 'n' ) and (part[0] not in [ 'p', 'i' ]):
+             value = '%s' % (relpath)
+        else:
+             value = '%s*%s' % (relpath, part)
+
+        return relpath, value
+
+    def lookup(self, key):
+        """ return the {value: time} dict of entries for key, None if key is not in cache """
+        return self.cache_dict.get(key)
+
+    def record(self, key, kdict, value, now, qpath, part):
+        """ store kdict (in which value was just set to now) for key """
+        self.cache_dict[key] = kdict
+        heapq.heappush(self.expiry, (now, key, value))
+        self.fp.write("%s %f %s %s\n"%(key,now,qpath,part))
+
     def check_msg(self, msg):
         self.logger.debug("sr_cache check_msg")
 
@@ -184,6 +224,7 @@ class sr_cache():
 
         now        = nowflt()
         new_dict   = {}
+        expiry     = []
         self.count = 0
 
         if delpath is not None:
@@ -213,6 +254,7 @@ class sr_cache():
                 if qpath == qdelpath  : continue
 
                 ndict[value] = t
+                expiry.append((t, key, value))
                 self.count  += 1
 
                 if persist:
@@ -223,6 +265,23 @@ class sr_cache():
         # set cleaned cache_dict
         self.cache_dict = new_dict
 
+        heapq.heapify(expiry)
+        self.expiry = expiry
+
+    def clean_expired(self):
+        """ remove expired entries, popping them from the expiry heap (no full scan) """
+        self.logger.debug("sr_cache clean_expired")
+
+        limit = nowflt() - self.expire
+
+        while self.expiry and self.expiry[0][0] < limit :
+              t, key, value = heapq.heappop(self.expiry)
+              kdict = self.cache_dict.get(key)
+              if kdict is None or kdict.get(value) != t : continue
+              del kdict[value]
+              self.count -= 1
+              if not kdict : del self.cache_dict[key]
+
     def close(self, unlink=False):
         self.logger.debug("sr_cache close")
         try:
@@ -240,23 +299,36 @@ class sr_cache():
                 self.logger.warning("did not unlink: cache_file={}: err={}".format(self.cache_file, err))
                 self.logger.debug('Exception details:', exc_info=True)
         self.cache_dict = {}
+        self.expiry     = []
         self.count      = 0
 
     def delete_path(self, delpath):
         self.logger.debug("sr_cache delete_path")
 
-        # close,remove file, open new empty file
-        self.fp.close()
-        if os.path.exists( self.cache_file ):
-            os.unlink( self.cache_file )
-        self.fp = open(self.cache_file,'w')
+        # remove entries for delpath, appending a removal line (time 0) for each
+        # to the cache file, it is compacted at the next save.
+        # their items left in expiry are stale and skipped.
+
+        for key in list(self.cache_dict.keys()) :
+            kdict = self.cache_dict[key]
+
+            for value in list(kdict.keys()) :
+                parts = value.split('*')
+                if parts[0] != delpath : continue
 
-        # clean cache removing delpath
-        self.clean(persist=True, delpath=delpath)
+                if len(parts) > 1: part = parts[1]
+                else:              part = None
+
+                del kdict[value]
+                self.count -= 1
+                self.fp.write("%s %f %s %s\n"%(key,0,urllib.parse.quote(parts[0]),part))
+
+            if not kdict : del self.cache_dict[key]
 
     def free(self):
         self.logger.debug("sr_cache free")
         self.cache_dict = {}
+        self.expiry     = []
         self.count      = 0
         try:
             os.unlink(self.cache_file)
@@ -268,6 +340,7 @@ class sr_cache():
     def load(self):
         self.logger.debug("sr_cache load")
         self.cache_dict = {}
+        self.expiry     = []
         self.count      = 0
 
         # create file if not existing
@@ -304,10 +377,16 @@ class sr_cache():
                   else:
                       value = '%s*%s' % (path, part)
 
-                  # skip expired entry
+                  # skip expired entry, remove entry on a later removal line
 
                   ttl   = now - ctime
-                  if ttl > self.expire : continue
+                  if ttl > self.expire :
+                     kdict = self.cache_dict.get(key)
+                     if kdict and value in kdict :
+                        del kdict[value]
+                        self.count -= 1
+                        if not kdict : del self.cache_dict[key]
+                     continue
 
               except Exception as err:
                   err_msg_fmt = "load corrupted: lineno={}, cache_file={}, err={}"
@@ -324,7 +403,9 @@ class sr_cache():
 
               kdict[value]         = ctime
               self.cache_dict[key] = kdict
+              self.expiry.append((ctime, key, value))
 
+        heapq.heapify(self.expiry)
 
     def open(self, cache_file = None):
 
@@ -354,6 +435,17 @@ class sr_cache():
             self.logger.warning("did not clean: cache_file={}, err={}".format(self.cache_file, err))
             self.logger.debug('Exception details:', exc_info=True)
 
+    def memory(self):
+        """ approximate bytes used by the cache entries (walks them all) """
+        size = sys.getsizeof(self.cache_dict) + sys.getsizeof(self.expiry)
+        for key, kdict in self.cache_dict.items():
+            size += sys.getsizeof(key) + sys.getsizeof(kdict)
+            for value, t in kdict.items():
+                size += sys.getsizeof(value) + sys.getsizeof(t)
+        # heap items share the strings and floats above
+        size += len(self.expiry) * sys.getsizeof((0.0, '', ''))
+        return size
+
     def check_expire(self):
         self.logger.debug("sr_cache check_expire")
         now = nowflt()
@@ -361,5 +453,407 @@ class sr_cache():
         elapse = now - self.last_expire
         if elapse > self.expire :
            self.last_expire = now
-           self.clean()
+           self.clean_expired()
+
+
+
+class sr_cache_sqlite(sr_cache):
+    """
+    same semantics as sr_cache, but entries are kept in an indexed sqlite table
+    instead of an in memory dict rewritten as a text log at every save.
+
+    check   : one indexed lookup on key, one update or insert
+    clean   : expired entries removed through the time index
+    save    : commit, nothing rewritten
+    count   : counted once when opened, then kept up to date from the rows inserted and deleted
+    """
+
+    def __init__(self, parent, store=None ):
+        super().__init__(parent)
+        self.db          = None
+        self.last_commit = wallflt()
+
+    def connect(self):
+        return sqlite3.connect(self.cache_file)
+
+    def lookup(self, key):
+        rows = self.db.execute("SELECT value, time FROM cache WHERE key = ?", (key,)).fetchall()
+        if not rows : return None
+        return dict(rows)
+
+    def record(self, key, kdict, value, now, qpath, part):
+        cur = self.db.execute("UPDATE cache SET time = ? WHERE key = ? AND value = ?", (now, key, value))
+        if cur.rowcount == 0 :
+           self.db.execute("INSERT OR REPLACE INTO cache (key, value, path, time) VALUES (?,?,?,?)",
+                           (key, value, value.split('*')[0], now))
+        else :
+           # check counts every entry recorded, this one was already there
+           self.count -= 1
+        self.commit()
+
+    def commit(self, force=False):
+        now = wallflt()
+        if not force and now - self.last_commit < 1.0 : return
+        self.last_commit = now
+        self.db.commit()
+
+    def clean(self, persist=False, delpath=None):
+        self.logger.debug("sr_cache_sqlite clean")
+
+        now = nowflt()
+        self.count -= self.db.execute("DELETE FROM cache WHERE time < ?", (now - self.expire,)).rowcount
+        if delpath is not None:
+            self.count -= self.db.execute("DELETE FROM cache WHERE path = ?", (delpath,)).rowcount
+        self.commit(force=True)
+
+    def recount(self):
+        self.count = self.db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def clean_expired(self):
+        self.clean()
+
+    def close(self, unlink=False):
+        self.logger.debug("sr_cache_sqlite close")
+        try:
+            self.db.commit()
+            self.db.close()
+        except Exception as err:
+            self.logger.warning('did not close: cache_file={}, err={}'.format(self.cache_file, err))
+            self.logger.debug('Exception details:', exc_info=True)
+        self.db = None
+
+        if unlink:
+            for f in [ self.cache_file, self.cache_file + '-wal', self.cache_file + '-shm' ]:
+                if not os.path.exists(f) : continue
+                try:
+                    os.unlink(f)
+                except Exception as err:
+                    self.logger.warning("did not unlink: cache_file={}: err={}".format(f, err))
+                    self.logger.debug('Exception details:', exc_info=True)
+        self.count = 0
+
+    def delete_path(self, delpath):
+        self.logger.debug("sr_cache_sqlite delete_path")
+        self.clean(delpath=delpath)
+
+    def free(self):
+        self.logger.debug("sr_cache_sqlite free")
+        self.db.execute("DELETE FROM cache")
+        self.db.commit()
+        self.count = 0
+
+    def load(self):
+        self.logger.debug("sr_cache_sqlite load")
+
+        fresh   = not os.path.isfile(self.cache_file)
+        self.db = self.connect()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS cache ( key TEXT, value TEXT, path TEXT, time REAL, "
+                        "PRIMARY KEY (key, value) ) WITHOUT ROWID")
+        self.db.execute("CREATE INDEX IF NOT EXISTS cache_time ON cache (time)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS cache_path ON cache (path)")
+
+        # first use : take over the entries of a text cache left by a previous run
+        text_file = self.cache_file[:-len('.sqlite')] + '.cache'
+        if fresh and self.cache_file.endswith('.sqlite') and os.path.isfile(text_file):
+           self.logger.info("sr_cache_sqlite importing %s" % text_file)
+           text = sr_cache(self.parent, 'text')
+           text.open(text_file)
+           for key, kdict in text.cache_dict.items():
+               for value, t in kdict.items():
+                   self.db.execute("INSERT OR REPLACE INTO cache (key, value, path, time) VALUES (?,?,?,?)",
+                                   (key, value, value.split('*')[0], t))
+           text.close(unlink=True)
+
+        self.recount()
+        self.clean()
+
+    def open(self, cache_file = None):
+
+        self.cache_file = cache_file
+
+        if cache_file is None :
+           self.cache_file  = self.parent.user_cache_dir + os.sep
+           self.cache_file += 'recent_files_%.3d.sqlite' % self.parent.instance
+
+        self.load()
+
+    def memory(self):
+        """ bytes of the sqlite database, mostly on disk """
+        page_count = self.db.execute("PRAGMA page_count").fetchone()[0]
+        page_size  = self.db.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    def save(self):
+        self.logger.debug("sr_cache_sqlite save")
+        self.clean()
+
+
+class sr_cache_compact(sr_cache):
+    """
+    entries reduced to a 64 bit digest of sum and value (see entry()), for large caches.
+    The digests live in an open addressing table (linear probing, 0 is an empty slot)
+    with the entry time and a digest of its relpath (for delete_path) in parallel arrays.
+    Entries are logged in the order they were stored (time ordered), so clean_expired
+    only touches the expired ones. About 50 bytes per entry.
+
+    values themselves are not kept: a part is matched on its value without block count
+    and remainder, as check intends, every other entry on its exact value.
+
+    cache_file : recent_files_NNN.compact, the three table arrays as written by array.tofile
+    """
+
+    def __init__(self, parent, store=None ):
+        super().__init__(parent)
+        self.reset()
+
+    def digest(self, text):
+        d = int.from_bytes(hashlib.blake2b(text.encode('utf-8','surrogateescape'), digest_size=8).digest(), 'little')
+        return d or 1
+
+    def reset(self, capacity=1 << 16):
+        """ empty table of capacity slots (a power of 2) """
+        self.capacity  = capacity
+        self.mask      = capacity - 1
+        self.digests   = array('Q', [0]) * capacity
+        self.times     = array('d', [0.0]) * capacity
+        self.paths     = array('Q', [0]) * capacity
+        self.count     = 0
+
+        self.log_digests = array('Q')
+        self.log_times   = array('d')
+        self.log_head    = 0
+
+    def grow(self, capacity):
+        """ move the entries to a table of capacity slots, rebuilding the log in time order """
+        entries = sorted( (t, d, p) for d, t, p in zip(self.digests, self.times, self.paths) if d )
+        self.reset(capacity)
+        for t, d, p in entries :
+            self.store(d, t, p)
+
+    def find(self, d):
+        """ return the slot of digest d, or the empty slot where it would go """
+        i = d & self.mask
+        while True :
+            slot = self.digests[i]
+            if slot == d or slot == 0 : return i
+            i = (i + 1) & self.mask
+
+    def store(self, d, t, p):
+        i = self.find(d)
+        if self.digests[i] == 0 :
+           self.digests[i] = d
+           self.paths[i]   = p
+           self.count     += 1
+        self.times[i] = t
+        self.log_digests.append(d)
+        self.log_times.append(t)
+
+        if self.count * 2 > self.capacity : self.grow(self.capacity * 2)
+
+    def remove(self, i):
+        """ empty slot i, shifting back the entries of its probe sequence """
+        mask = self.mask
+        j    = i
+        while True :
+            j = (j + 1) & mask
+            d = self.digests[j]
+            if d == 0 : break
+            home = d & mask
+            # leave entries whose home lies cyclically in (i, j]
+            if (i <= j and i < home <= j) or (i > j and (home > i or home <= j)) : continue
+            self.digests[i] = d
+            self.times[i]   = self.times[j]
+            self.paths[i]   = self.paths[j]
+            i = j
+        self.digests[i] = 0
+        self.times[i]   = 0.0
+        self.paths[i]   = 0
+        self.count     -= 1
+
+    def check(self, key, path, part):
+        self.logger.debug("sr_cache_compact check key0=%s" % key[0] )
+
+        self.cache_hit = None
+
+        now            = nowflt()
+        relpath, value = self.entry(key, path, part)
+
+        if part is not None and part[0] in "pi" :
+           # without block_count and remainder (ptoken 2 and 3)
+           ptoken = part.split(',')
+           if len(ptoken) >= 4 :
+              value = value[:-len(part)] + ','.join(ptoken[:2] + ptoken[4:])
+
+        d = self.digest(key + ' ' + value)
+        present = self.digests[self.find(d)] == d
+        self.store(d, now, self.digest(relpath))
+
+        if present :
+           self.logger.debug("updated time of old entry: value={}".format(value))
+           self.cache_hit = value
+           return False
+
+        self.logger.debug("added value={}".format(value))
+        return True
+
+    def clean(self, persist=False, delpath=None):
+        self.logger.debug("sr_cache_compact clean")
+
+        self.clean_expired()
+        if delpath is not None : self.delete_path(delpath)
+
+    def clean_expired(self):
+        self.logger.debug("sr_cache_compact clean_expired")
+
+        limit = nowflt() - self.expire
+        head  = self.log_head
+        last  = len(self.log_times)
+
+        while head < last and self.log_times[head] < limit :
+              d = self.log_digests[head]
+              i = self.find(d)
+              if self.digests[i] == d and self.times[i] == self.log_times[head] :
+                 self.remove(i)
+              head += 1
+
+        # drop the consumed part of the log once it is the larger part
+        if head > 1024 and head * 2 > last :
+           del self.log_digests[:head]
+           del self.log_times[:head]
+           head = 0
+
+        self.log_head = head
+
+    def close(self, unlink=False):
+        self.logger.debug("sr_cache_compact close")
+
+        if unlink and os.path.exists(self.cache_file):
+           try:
+               os.unlink(self.cache_file)
+           except Exception as err:
+               self.logger.warning("did not unlink: cache_file={}: err={}".format(self.cache_file, err))
+               self.logger.debug('Exception details:', exc_info=True)
+        self.reset()
+
+    def delete_path(self, delpath):
+        self.logger.debug("sr_cache_compact delete_path")
+
+        p = self.digest(delpath)
+        i = 0
+        while i < self.capacity :
+              # removal shifts the next entry into slot i, look at it again
+              if self.digests[i] and self.paths[i] == p :
+                 self.remove(i)
+                 continue
+              i += 1
+
+    def free(self):
+        self.logger.debug("sr_cache_compact free")
+        self.reset()
+
+    def load(self):
+        self.logger.debug("sr_cache_compact load")
+        self.reset()
+
+        if not os.path.isfile(self.cache_file) : return
+
+        try:
+            capacity = os.path.getsize(self.cache_file) // 24
+            digests, times, paths = array('Q'), array('d'), array('Q')
+            with open(self.cache_file,'rb') as fp :
+                 digests.fromfile(fp, capacity)
+                 times.fromfile(fp, capacity)
+                 paths.fromfile(fp, capacity)
+        except Exception as err:
+            self.logger.error("load corrupted: cache_file={}, err={}".format(self.cache_file, err))
+            self.logger.debug('Exception details:', exc_info=True)
+            return
+
+        limit   = nowflt() - self.expire
+        entries = sorted( (t, d, p) for d, t, p in zip(digests, times, paths) if d and t >= limit )
+
+        capacity = 1 << 16
+        while len(entries) * 2 > capacity : capacity *= 2
+        self.reset(capacity)
+        for t, d, p in entries :
+            self.store(d, t, p)
+
+    def memory(self):
+        """ bytes used by the table and the expiry log """
+        size  = sum( a.itemsize * len(a) for a in (self.digests, self.times, self.paths) )
+        size += sum( a.itemsize * len(a) for a in (self.log_digests, self.log_times) )
+        return size
+
+    def open(self, cache_file = None):
+
+        self.cache_file = cache_file
+
+        if cache_file is None :
+           self.cache_file  = self.parent.user_cache_dir + os.sep
+           self.cache_file += 'recent_files_%.3d.compact' % self.parent.instance
+
+        self.load()
+
+    def save(self):
+        self.logger.debug("sr_cache_compact save")
+
+        self.clean_expired()
+        tmpfile = self.cache_file + '.tmp'
+        try:
+            with open(tmpfile,'wb') as fp :
+                 self.digests.tofile(fp)
+                 self.times.tofile(fp)
+                 self.paths.tofile(fp)
+            os.replace(tmpfile, self.cache_file)
+        except Exception as err:
+            self.logger.warning("did not save: cache_file={}, err={}".format(self.cache_file, err))
+            self.logger.debug('Exception details:', exc_info=True)
+
+
+class sr_cache_shared(sr_cache_sqlite):
+    """
+    one sr_cache_sqlite database, recent_files_shared.sqlite, used by all the instances of
+    a configuration on a host, so they suppress each other's duplicates while consuming
+    from a single queue.
+
+    check runs in an immediate (write locked) transaction, making the lookup and the
+    insert atomic across processes: of instances receiving the same entry at the same time,
+    exactly one sees it as new. The database pages are memory mapped by every instance.
+
+    the other instances add and remove entries too : the count is the table's only
+    when counted again, at every clean with cache_stat.
+    """
+
+    def connect(self):
+        # autocommit, but for the check transaction
+        db = sqlite3.connect(self.cache_file, timeout=30, isolation_level=None)
+        db.execute("PRAGMA mmap_size=%d" % (256 * 1024 * 1024))
+        return db
+
+    def clean(self, persist=False, delpath=None):
+        super().clean(persist, delpath)
+        if self.parent.cache_stat : self.recount()
+        elif self.count < 0       : self.count = 0
+
+    def commit(self, force=False):
+        pass
+
+    def check(self, key, path, part):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            return super().check(key, path, part)
+        finally:
+            self.db.execute("COMMIT")
+
+    def open(self, cache_file = None):
+
+        if cache_file is None :
+           cache_file  = self.parent.user_cache_dir + os.sep
+           cache_file += 'recent_files_shared.sqlite'
+
+        super().open(cache_file)
+
 
+cache_stores = { 'text': sr_cache, 'sqlite': sr_cache_sqlite, 'compact': sr_cache_compact, 'shared': sr_cache_shared }
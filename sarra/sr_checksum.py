@@ -18,8 +18,10 @@ The API of a checksum class (in calling sequence order):
    __init__      -- initialize the value of a checksum for a part.
    get_value     -- return the current calculated checksum value.
    registered_as -- return the letter or string under which this checksum is named in post message
+   registered_as_v03 -- return the integrity method name of this checksum in v03 messages
    set_path      -- identify the checksumming algorithm to be used by update.
    update        -- given this chunk of the file, update the checksum for the part
+   reads_data    -- False when update ignores the data, so there is no need to read it
 
 The API allows for checksums to be calculated while transfer is in progress 
 rather than after the fact as a second pass through the data.  
@@ -40,9 +42,15 @@ class sr_checksum(object):
       def get_value(self):
           return self.value
 
+      def reads_data(self):
+          return type(self).update != sr_checksum.update
+
       def registered_as(self):
           return None
 
+      def registered_as_v03(self):
+          return None
+
       def set_path(self,path):
           pass
 
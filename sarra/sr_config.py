@@ -331,15 +331,17 @@ class sr_config:
            ( self.inflight, self.events, self.use_pika, self.topic_prefix, self.dry_run) )
         self.logger.info( "\tinline=%s events=%s use_amqplib=%s topic_prefix=%s" % \
            ( self.inline, self.events, self.use_amqplib, self.topic_prefix) )
-        self.logger.info( "\tsuppress_duplicates=%s basis=%s retry_mode=%s retry_ttl=%sms tls_rigour=%s" % \
-           ( self.caching, self.cache_basis, self.retry_mode, self.retry_ttl, self.tls_rigour ) )
-        self.logger.info( "\texpire=%sms reset=%s message_ttl=%s prefetch=%s accept_unmatch=%s delete=%s poll_without_vip=%s" % \
-           ( self.expire, self.reset, self.message_ttl, self.prefetch, self.accept_unmatch, self.delete, self.poll_without_vip ) )
+        self.logger.info( "\tsuppress_duplicates=%s basis=%s store=%s retry_mode=%s retry_store=%s retry_ttl=%sms tls_rigour=%s" % \
+           ( self.caching, self.cache_basis, self.cache_store, self.retry_mode, self.retry_store, self.retry_ttl, self.tls_rigour ) )
+        self.logger.info( "\tretry_backoff_min=%s retry_backoff_max=%s json_codec=%s" % \
+           ( self.retry_backoff_min, self.retry_backoff_max, json_codec.name ) )
+        self.logger.info( "\texpire=%sms reset=%s message_ttl=%s prefetch=%s consume_batch=%s transfer_concurrency=%s range_streams=%s range_threshold=%s resume=%s sftp_window=%s accept_unmatch=%s delete=%s poll_without_vip=%s" % \
+           ( self.expire, self.reset, self.message_ttl, self.prefetch, self.consume_batch, self.transfer_concurrency, self.range_streams, self.range_threshold, self.resume, self.sftp_window, self.accept_unmatch, self.delete, self.poll_without_vip ) )
         self.logger.info( "\theartbeat=%s sanity_log_dead=%s default_mode=%03o default_mode_dir=%03o default_mode_log=%03o discard=%s durable=%s" % \
            ( self.heartbeat, self.sanity_log_dead, self.chmod, self.chmod_dir, self.chmod_log, self.discard, self.durable ) )
         self.logger.info( "\tdeclare_queue=%s declare_exchange=%s bind_queue=%s" % ( self.declare_queue, self.declare_exchange, self.bind_queue ) )
-        self.logger.info( "\tpost_on_start=%s preserve_mode=%s preserve_time=%s realpath_post=%s base_dir=%s follow_symlinks=%s" % \
-           ( self.post_on_start, self.preserve_mode, self.preserve_time, self.realpath_post, self.base_dir, self.follow_symlinks ) )
+        self.logger.info( "\tpost_on_start=%s post_snapshot=%s walk_threads=%s event_settle=%s event_queue_max=%s preserve_mode=%s preserve_time=%s realpath_post=%s base_dir=%s follow_symlinks=%s" % \
+           ( self.post_on_start, self.post_snapshot, self.walk_threads, self.event_settle, self.event_queue_max, self.preserve_mode, self.preserve_time, self.realpath_post, self.base_dir, self.follow_symlinks ) )
         self.logger.info( "\tmirror=%s flatten=%s realpath_post=%s strip=%s base_dir=%s report_back=%s log_reject=%s" % \
            ( self.mirror, self.flatten, self.realpath_post, self.strip, self.base_dir, self.reportback, self.log_reject ) )
 
@@ -347,6 +349,8 @@ class sr_config:
             self.logger.info( "\tpost_base_dir=%s post_base_url=%s post_topic_prefix=%s post_version=%s sum=%s blocksize=%s " % \
                ( self.post_base_dir, self.post_base_url, self.post_topic_prefix, 
                  self.post_version, self.sumflg, self.blocksize ) )
+            self.logger.info( "\tpost_confirm_window=%s post_tx_batch=%s post_tx_interval=%s" % \
+               ( self.post_confirm_window, self.post_tx_batch, self.post_tx_interval ) )
 
         self.logger.info('\tPlugins configured:')
 
@@ -661,6 +665,10 @@ class sr_config:
         self.file_time_limit      = self.duration_from_str("60d")
         self.destination_timezone = 'UTC'
         self.retry_mode           = True
+        self.retry_store          = 'files'
+        self.json_codec           = 'json'
+        self.retry_backoff_min    = 30
+        self.retry_backoff_max    = 900
         self.retry_ttl            = None
 
         self.remote_config_url    = None
@@ -717,6 +725,12 @@ class sr_config:
         self.reset                = False
         self.message_ttl          = None
         self.prefetch             = 25
+        self.consume_batch        = 0
+        self.transfer_concurrency = 1
+        self.range_streams        = 1
+        self.resume               = False
+        self.sftp_window          = self.chunksize_from_str('4M')
+        self.range_threshold      = self.chunksize_from_str('64M')
         self.max_queue_size       = 25000
         self.set_passwords        = True
 
@@ -738,6 +752,7 @@ class sr_config:
         self.cache                = None
         self.caching              = False
         self.cache_basis         = 'path'
+        self.cache_store         = 'text'
         self.cache_stat           = False
 
         # save/restore
@@ -788,11 +803,14 @@ class sr_config:
         self.discard              = False
 
         self.events               = 'create|delete|link|modify'
+        self.event_settle         = 0
+        self.event_queue_max      = 100000
         self.event                = 'create|delete|modify'
 
         self.flatten              = '/'
         self.follow_symlinks      = False
         self.force_polling        = False
+        self.polling_rescan       = 0
 
         self.gateway_for          = []
         self.mirror               = False
@@ -804,7 +822,12 @@ class sr_config:
         self.post_exchange        = None
         self.post_exchange_suffix = None
         self.post_exchange_split  = 0
+        self.post_confirm_window  = 0
+        self.post_tx_batch        = 1
+        self.post_tx_interval     = 1.0
         self.post_on_start        = True
+        self.post_snapshot        = False
+        self.walk_threads         = 1
         self.preserve_mode        = True
         self.preserve_time        = True
         self.pump_flag            = False
@@ -1197,6 +1220,11 @@ class sr_config:
                    self.logger.error("sum file %s did not execute" % p)
                    continue
 
+                # the algorithm needs a module that is not installed
+                if self.add_sumalgo is False:
+                   self.logger.debug("sum file %s add_sumalgo not available" % p)
+                   continue
+
                 # verify that it is an instance of sr_checksum
                 if not isinstance(self.add_sumalgo,sr_checksum):
                    self.logger.error("sum file %s add_sumalgo is not inherited from class sr_checksum" % p)
@@ -1215,10 +1243,13 @@ class sr_config:
                    self.logger.error("sum file %s add_sumalgo with a checksum letter/name already set, skipped" % p)
                    continue
 
-                # add the sumalgo 
+                # add the sumalgo, and its name in v03 messages
                 self.logger.debug("sum file %s add_sumalgo with a checksum letter/name %s" % (p,register_name))
                 self.sumalgos[register_name] = self.add_sumalgo
 
+                try   : sum_algo_register(register_name, self.add_sumalgo.registered_as_v03())
+                except: pass
+
         # setting default to 'd'
         self.set_sumalgo('d')
          
@@ -1703,6 +1734,16 @@ class sr_config:
 
                         n = 2
 
+                elif words0 in [ 'suppress_duplicates_store', 'sds', 'cache_store', 'cs' ] : # See: sr_subscribe.1
+                        known_stores = [ 'compact', 'shared', 'sqlite', 'text' ]
+                        if words1 in known_stores:
+                            self.cache_store = words1
+                        else:
+                            self.logger.error("unknown store for duplicate suppression: %s, should be one of: %s (default: %s)" % \
+                                ( words1, known_stores, self.cache_store ) )
+
+                        n = 2
+
                 elif words0 == 'cache_stat'   : # FIXME! what is this?
                      if (words1 is None) or words[0][0:1] == '-' : 
                         self.cache_stat = True
@@ -1711,6 +1752,10 @@ class sr_config:
                         self.cache_stat = self.isTrue(words1)
                         n = 2
 
+                elif words0 == 'consume_batch': # See: sr_subscribe.1 (Nbr of messages consumed and acked at once)
+                     self.consume_batch = int(words1)
+                     n = 2
+
                 elif words0 in [ 'chmod', 'default_mode', 'dm']:    # See: sr_config.7.rst
                      self.chmod = int(words1,8)
                      n = 2
@@ -1900,6 +1945,16 @@ class sr_config:
                      self.events = words1
                      n = 2
 
+                elif words0 in ['event_settle','es'] : # See: sr_watch.1
+                     self.event_settle = self.duration_from_str(words1,'s')
+                     if self.event_settle < 0 : self.event_settle = 0
+                     n = 2
+
+                elif words0 in ['event_queue_max','eqm'] : # See: sr_watch.1
+                     self.event_queue_max = int(words1)
+                     if self.event_queue_max < 0 : self.event_queue_max = 0
+                     n = 2
+
                 elif words0 in ['exchange','ex'] : # See: sr_config.7 ++ everywhere fixme?
                      self.exchange = words1
                      n = 2
@@ -1958,6 +2013,11 @@ class sr_config:
                         self.force_polling = self.isTrue(words1)
                         n = 2
 
+                elif words0 in ['polling_rescan','pr'] : # See: sr_watch.1
+                     self.polling_rescan = self.duration_from_str(words1,'s')
+                     if self.polling_rescan < 0 : self.polling_rescan = 0
+                     n = 2
+
                 elif words0 in ['header']: # See: sr_config.7
                      kvlist = words1.split('=')
                      key    = kvlist[0]
@@ -2024,6 +2084,14 @@ class sr_config:
 
                      n = 2
 
+                elif words0 in ['json_codec']: # See: sr_subscribe.1
+                     if json_codec.set(words1):
+                        self.json_codec = words1
+                     else:
+                        self.logger.error("json_codec %s not available, should be one of: %s (using: %s)" % \
+                            ( words1, list(json_codec.codecs), json_codec.name ) )
+                     n = 2
+
                 elif words0 in ['inline_max','imx', 'content_max' ]: # See: sr_config.7
                      self.inline_max = int(words1)
                      n = 2
@@ -2353,6 +2421,10 @@ class sr_config:
                         needexit = True
                      n = 2
 
+                elif words0 == 'post_confirm_window' : # See: sr_config.7
+                     self.post_confirm_window = int(words1)
+                     n = 2
+
                 elif words0 in ['post_document_root','pdr']: # See: sr_sarra,sender,shovel,winnow
 
                      if sys.platform == 'win32' and words1.find( '\\' ) :
@@ -2381,6 +2453,19 @@ class sr_config:
                         self.post_on_start = self.isTrue(words1)
                         n = 2
 
+                elif words0 in ['walk_threads','wt'] : # See: sr_watch.1
+                     self.walk_threads = int(words1)
+                     if self.walk_threads < 1 : self.walk_threads = 1
+                     n = 2
+
+                elif words0 in ['post_snapshot','psn'] : # See: sr_watch.1
+                     if (words1 is None) or words[0][0:1] == '-' : 
+                        self.post_snapshot = True
+                        n = 1
+                     else :
+                        self.post_snapshot = self.isTrue(words1)
+                        n = 2
+
                 elif words0 in ['post_topic_prefix', 'ptp' ]: # FIXME: sr_sarra,sender,shovel,winnow 
                      self.post_topic_prefix = words1
                      if 'v03.' in words1:
@@ -2393,6 +2478,14 @@ class sr_config:
                      self.post_exchange_split = int(words1)
                      n = 2
 
+                elif words0 == 'post_tx_batch' : # See: sr_config.7
+                     self.post_tx_batch = int(words1)
+                     n = 2
+
+                elif words0 == 'post_tx_interval' : # See: sr_config.7
+                     self.post_tx_interval = self.duration_from_str(words1,'s')
+                     n = 2
+
                 elif words0 in ['poll_without_vip','pwv'] : # See: sr_config.7
                      if (words1 is None) or words[0][0:1] == '-' : 
                         self.poll_without_vip = True
@@ -2494,6 +2587,40 @@ class sr_config:
                         self.retry_mode = self.isTrue(words1)
                         n = 2
 
+                elif words0 in ['retry_backoff_min']:  # See: sr_subscribe.1
+                     self.retry_backoff_min = self.duration_from_str(words1,'s')
+                     n = 2
+
+                elif words0 in ['retry_backoff_max']:  # See: sr_subscribe.1
+                     self.retry_backoff_max = self.duration_from_str(words1,'s')
+                     n = 2
+
+                elif words0 == 'range_streams': # See: sr_subscribe.1
+                     self.range_streams = int(words1)
+                     if self.range_streams < 1 : self.range_streams = 1
+                     n = 2
+
+                elif words0 == 'range_threshold': # See: sr_subscribe.1
+                     self.range_threshold = self.chunksize_from_str(words1)
+                     n = 2
+
+                elif words0 == 'resume': # See: sr_subscribe.1
+                     if (words1 is None) or words[0][0:1] == '-' : 
+                        self.resume = True
+                        n = 1
+                     else :
+                        self.resume = self.isTrue(words1)
+                        n = 2
+
+                elif words0 in ['retry_store']:  # See: sr_subscribe.1
+                     known_stores = [ 'files', 'sqlite' ]
+                     if words1 in known_stores:
+                        self.retry_store = words1
+                     else:
+                        self.logger.error("unknown retry_store: %s, should be one of: %s (default: %s)" % \
+                            ( words1, known_stores, self.retry_store ) )
+                     n = 2
+
                 elif words0 in ['retry_ttl']:  # FIXME to be documented
                      if words1.lower() == 'none' :
                            self.retry_ttl = None
@@ -2549,6 +2676,10 @@ class sr_config:
                         self.set_passwords = self.isTrue(words1)
                         n = 2
 
+                elif words0 == 'sftp_window': # See: sr_subscribe.1
+                     self.sftp_window = self.chunksize_from_str(words1)
+                     n = 2
+
                 elif words0 == 'sleep': # See: sr_audit.8 sr_poll.1
                      # sleep setting is in sec 
                      self.sleep = self.duration_from_str(words1,'s')
@@ -2629,6 +2760,11 @@ class sr_config:
                      if self.timeout <= 0 : self.timeout = None
                      n = 2
 
+                elif words0 == 'transfer_concurrency': # See: sr_subscribe.1
+                     self.transfer_concurrency = int(words1)
+                     if self.transfer_concurrency < 1 : self.transfer_concurrency = 1
+                     n = 2
+
                 elif words0 == 'to': # See: sr_config.7
                      self.to_clusters = words1
                      n = 2
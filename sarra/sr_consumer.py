@@ -77,6 +77,10 @@ class sr_consumer:
         self.sleep_min = 0.01
         self.sleep_now = self.sleep_min
 
+        # idle sleep (sr_transfer wakes it up when a transfer completes)
+
+        self.idle      = time.sleep
+
         self.build_connection(loop=loop)
         self.build_consumer()
         self.build_queue()
@@ -99,8 +103,17 @@ class sr_consumer:
 
         self.consumer = Consumer(self.hc)
 
+        # each transfer worker holds an unacknowledged message
         if self.parent.prefetch > 0 :
-            self.consumer.add_prefetch(self.parent.prefetch)
+            self.consumer.add_prefetch(max(self.parent.prefetch, self.parent.transfer_concurrency))
+
+        if self.parent.consume_batch > 0 :
+            if self.parent.use_pika :
+                self.logger.warning("consume_batch not supported with use_pika, consuming one message at a time")
+            elif self.parent.transfer_concurrency > 1 :
+                self.logger.warning("consume_batch not supported with transfer_concurrency, consuming one message at a time")
+            else :
+                self.consumer.set_batch(self.parent.consume_batch)
 
         self.consumer.build()
 
@@ -129,15 +142,20 @@ class sr_consumer:
 
     def close(self):
         if self.hc :
+           if self.consumer.is_batch() : self.consumer.ack_batch()
            self.hc.close()
            self.hc = None
         self.retry.close()
 
+    def ack(self):
+        if self.raw_msg is not None and not self.raw_msg.isRetry:
+            self.consumer.ack(self.raw_msg)
+        self.raw_msg = None
+
     def consume(self):
 
         # acknowledge last message... we are done with it since asking for a new one
-        if self.raw_msg is not None and not self.raw_msg.isRetry:
-            self.consumer.ack(self.raw_msg)
+        self.ack()
 
         # consume a new one
         self.get_message()
@@ -157,12 +175,12 @@ class sr_consumer:
 
         if self.raw_msg is None:
             should_sleep = True
-        elif self.raw_msg.isRetry and self.last_msg_failed:
+        elif self.raw_msg.isRetry and self.last_msg_failed and not self.retry.scheduled:
             should_sleep = True
 
         if should_sleep:
             try:
-               time.sleep(self.sleep_now)
+               self.idle(self.sleep_now)
             except:
                self.logger.info("woke from sleep by alarm.. %s " % self.msg.notice)
 
@@ -268,7 +286,11 @@ class sr_consumer:
     def msg_worked(self):
         self.last_msg_failed = False
 
-        if self.raw_msg == None or not self.raw_msg.isRetry : return
+        if self.raw_msg == None : return
+
+        if not self.raw_msg.isRetry :
+           self.retry.destination_worked(self.raw_msg)
+           return
 
         self.retry.add_msg_to_state_file(self.raw_msg,done=True)
 
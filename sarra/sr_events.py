@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+#
+# This file is part of sarracenia.
+# The sarracenia suite is Free and is proudly provided by the Government of Canada
+# Copyright (C) Her Majesty The Queen in Right of Canada, Environment Canada, 2008-2015
+#
+# Questions or bugs report: dps-client@ec.gc.ca
+# Sarracenia repository: https://github.com/MetPX/sarracenia
+# Documentation: https://github.com/MetPX/sarracenia
+#
+# sr_events.py : the file system events caught by sr_watch, waiting to be posted,
+#                one per path.
+#
+########################################################################
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; version 2 of the License.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307  USA
+#
+#
+
+import threading
+
+from collections import OrderedDict
+
+from sarra.sr_util import wallflt
+
+#============================================================
+# sr_events supports/uses :
+#
+# add    : called by the observer thread(s), for each event caught
+# ready  : the events to process (their last event older than settle seconds)
+# remove : an event was processed (unless another event came for its path meanwhile)
+#
+# events are kept one per path, in the order of their last event, merged as they come :
+#
+#    create/modify  after create/modify : one create/modify (the first kind kept)
+#    create/modify  after move to path  : the move (it posts the file as it is)
+#    create/modify  after delete        : the create/modify
+#    delete         after move a -> path: delete of a, and delete of path
+#    delete         after anything else : the delete
+#    move a -> b    after move x -> a   : move x -> b
+#    move a -> b                        : replaces any event of a, and of b
+#
+# at most maxlen paths are kept (0 : no limit). the events for other paths are dropped,
+# and overflow is set : the trees watched need to be walked again to catch up.
+#
+# counters : received, coalesced (merged in an event already queued),
+#            dropped (queue full), processed (removed once done)
+#============================================================
+
+class sr_events():
+
+    def __init__(self, parent, settle=0.0, maxlen=0):
+        self.logger    = parent.logger
+        self.settle    = settle
+        self.maxlen    = maxlen
+
+        self.events    = OrderedDict()
+        self.lock      = threading.Lock()
+        self.seq       = 0
+        self.overflow  = False
+
+        self.received  = 0
+        self.coalesced = 0
+        self.dropped   = 0
+        self.processed = 0
+
+    def __len__(self):
+        return len(self.events)
+
+    # __put__ : (lock held) queue event for path, last in order
+
+    def __put__(self, path, event, src, dst):
+        if path in self.events :
+           self.coalesced += 1
+           del self.events[path]
+        elif self.maxlen and len(self.events) >= self.maxlen :
+           self.dropped  += 1
+           self.overflow  = True
+           return
+        self.seq += 1
+        self.events[path] = ( event, src, dst, wallflt(), self.seq )
+
+    def add(self, event, src, dst=None):
+        with self.lock :
+             self.received += 1
+             prev = self.events.get(src)
+
+             if event == 'move' :
+                if prev and prev[0] == 'move' :
+                   del self.events[src]
+                   self.coalesced += 1
+                   src = prev[1]
+                elif prev :
+                   del self.events[src]
+                   self.coalesced += 1
+                self.__put__(dst, 'move', src, dst)
+                return
+
+             if event == 'delete' :
+                if prev and prev[0] == 'move' and not prev[1] in self.events :
+                   self.__put__(prev[1], 'delete', prev[1], None)
+                self.__put__(src, 'delete', src, None)
+                return
+
+             # create/modify : a move queued for this path is kept (it is queued as its dst)
+
+             path = src
+             if   prev and prev[0] == 'move'   : event, src, dst = prev[0:3]
+             elif prev and prev[0] != 'delete' : event = prev[0]
+             self.__put__(path, event, src, dst)
+
+    def full(self):
+        return self.maxlen > 0 and len(self.events) >= self.maxlen
+
+    def ready(self):
+        upto = wallflt() - self.settle
+        lst  = []
+        with self.lock :
+             for path, ( event, src, dst, last, seq ) in self.events.items() :
+                 if last > upto : break
+                 lst.append( ( path, event, src, dst, seq ) )
+        return lst
+
+    def remove(self, path, seq):
+        with self.lock :
+             self.processed += 1
+             if path in self.events and self.events[path][4] == seq :
+                del self.events[path]
+
+    def stats(self):
+        return "events received %d, coalesced %d, dropped %d, processed %d, queued %d" % \
+               ( self.received, self.coalesced, self.dropped, self.processed, len(self.events) )
+
+    # take_overflow : was the queue full since last call
+
+    def take_overflow(self):
+        with self.lock :
+             overflow      = self.overflow
+             self.overflow = False
+        return overflow
@@ -32,13 +32,22 @@
 #
 #
 
-import os, stat, sys, time
+import errno, os, stat, sys, time
 
 try:
     from sr_util import *
 except:
     from sarra.sr_util import *
 
+try:
+    import fcntl
+except:
+    fcntl = None
+
+# linux ioctl sharing the extents of a file (btrfs, xfs, ...), the number means something else elsewhere
+if sys.platform.startswith('linux') : FICLONE = 0x40049409
+else                                : FICLONE = None
+
 #============================================================
 # file protocol in sarracenia supports/uses :
 #
@@ -66,10 +75,9 @@ class sr_file():
         self.logger      = parent.logger
         self.parent      = parent 
 
-    # cd
+    # cd : remembered, paths are used as is
     def cd(self, path):
         self.logger.debug("sr_file cd %s" % path)
-        os.chdir(path)
         self.path = path
 
     # chmod
@@ -132,6 +140,70 @@ class sr_file():
 
 
 
+# file_copy
+# copy length bytes (the rest of src if 0) from src at src_offset into dst at dst_offset,
+# letting the kernel do it when it can : a reflink for a whole file into an empty one,
+# copy_file_range, sendfile, and a read/write loop otherwise. src and dst are binary
+# file objects, not read or written through their buffers. Returns the bytes copied.
+
+def file_copy( src, dst, src_offset=0, dst_offset=0, length=0, bufsize=1024*1024 ) :
+
+    sfd    = src.fileno()
+    dfd    = dst.fileno()
+    ssize  = os.fstat(sfd).st_size
+    if length == 0 : length = ssize - src_offset
+    copied = 0
+
+    if fcntl and FICLONE and src_offset == 0 and dst_offset == 0 and length == ssize and os.fstat(dfd).st_size == 0 :
+       try :
+               fcntl.ioctl(dfd, FICLONE, sfd)
+               return length
+       except OSError : pass
+
+    # a failing syscall (not supported, cross device...) leaves the rest to the next way
+
+    if hasattr(os,'copy_file_range') :
+       try :
+               while copied < length :
+                     n = os.copy_file_range(sfd, dfd, length-copied, src_offset+copied, dst_offset+copied)
+                     if n == 0 : return copied
+                     copied += n
+               return copied
+       except OSError : pass
+
+    if hasattr(os,'sendfile') :
+       try :
+               os.lseek(dfd, dst_offset+copied, os.SEEK_SET)
+               while copied < length :
+                     n = os.sendfile(dfd, sfd, src_offset+copied, length-copied)
+                     if n == 0 : return copied
+                     copied += n
+               return copied
+       except OSError : pass
+
+    buf  = bytearray(min(bufsize, max(length-copied,1)))
+    view = memoryview(buf)
+    src.seek(src_offset+copied)
+    dst.seek(dst_offset+copied)
+    while copied < length :
+          n = src.readinto(view[:min(len(buf), length-copied)])
+          if not n : break
+          dst.write(view[:n])
+          copied += n
+    dst.flush()
+
+    return copied
+
+# file_sum
+# feed length bytes of path at offset to the checksum, only when the algorithm
+# looks at the data (not for 'n', '0', 'a', ...)
+
+def file_sum( chk, path, offset, length, bufsize ) :
+
+    if not chk.reads_data() or length == 0 : return
+
+    sum_file(chk, path, offset, length, bufsize)
+
 # file_insert
 # called by file_process (general file:// processing)
 
@@ -160,11 +232,12 @@ def file_insert( parent,msg ) :
 def file_insert_part(parent,msg,part_file):
     parent.logger.debug("file_insert_part %s" % part_file)
     chk = msg.sumalgo
+    target_path = os.path.join(msg.new_dir, msg.target_file)
     try :
              # file disappeared ...
              # probably inserted by another process in parallel
              if not os.path.isfile(part_file):
-                parent.logger.dedbug("file doesn't exist %s" % part_file)
+                parent.logger.debug("file doesn't exist %s" % part_file)
                 return False
 
              # file with wrong size
@@ -177,29 +250,22 @@ def file_insert_part(parent,msg,part_file):
 
              # proceed with insertion
              fp = open(part_file,'rb')
-             ft = open(msg.target_file,'r+b')
-             ft.seek(msg.offset,0)
-
-             # no worry with length, read all of part_file
-             # compute onfly_checksum ...
-             bufsize = parent.bufsize
-             if bufsize > msg.length : bufsize = msg.length
-             if chk : chk.set_path(os.path.basename(msg.target_file))
+             ft = open(target_path,'r+b')
 
-             i  = 0
-             while i < msg.length:
-                   buf = fp.read(bufsize)
-                   if not buf: break
-                   ft.write(buf)
-                   if chk : chk.update(buf)
-                   i  += len(buf)
+             # no worry with length, copy all of part_file
+             i  = file_copy(fp, ft, 0, msg.offset, msg.length, parent.bufsize)
 
-             if ft.tell() >= msg.filesize:
-                 ft.truncate()
+             if msg.offset + i >= msg.filesize:
+                 ft.truncate(msg.offset + i)
 
              ft.close() 
              fp.close()
 
+             # compute onfly_checksum ...
+             if chk :
+                chk.set_path(os.path.basename(msg.target_file))
+                file_sum(chk, target_path, msg.offset, i, parent.bufsize)
+
              if i != msg.length :
                 msg.logger.error("file_insert_part file currupted %s" % part_file)
                 msg.logger.error("read up to  %d of %d " % (i,msg.length) )
@@ -241,9 +307,11 @@ def file_insert_part(parent,msg,part_file):
 
 def file_link( msg ) :
 
-    try    : os.unlink(msg.new_file)
+    new_path = os.path.join(msg.new_dir, msg.new_file)
+
+    try    : os.unlink(new_path)
     except : pass
-    try    : os.link(msg.relpath,msg.new_file)
+    try    : os.link(msg.relpath,new_path)
     except : return False
 
     msg.compute_local_checksum()
@@ -281,12 +349,6 @@ def file_process( parent ) :
        parent.logger.warning("%s moved or removed since announced" % msg.relpath)
        return True
 
-    try:    curdir = os.getcwd()
-    except: curdir = None
-
-    if curdir != parent.msg.new_dir:
-       os.chdir(parent.msg.new_dir)
-
     # try link if no inserts
 
     if msg.partflg == '1' or \
@@ -334,19 +396,17 @@ def file_reassemble(parent):
 
     if not hasattr(msg,'target_file') or msg.target_file == None : return False
 
-    try:    curdir = os.getcwd()
-    except: curdir = None
+    # files are relative to new_dir
 
-    if curdir != parent.msg.new_dir:
-       os.chdir(parent.msg.new_dir)
+    target_path = os.path.join(msg.new_dir, msg.target_file)
 
     # target file does not exit yet... check for first partition if it's fully downloaded then create target_file 
 
-    if not os.path.isfile(msg.target_file): 
+    if not os.path.isfile(target_path): 
       msg.current_block = 0
       msg.set_parts('i',msg.chunksize,msg.block_count,msg.remainder,msg.current_block)
       msg.set_suffix()
-      part_file = msg.target_file + msg.suffix
+      part_file = target_path + msg.suffix
 
       if os.path.isfile(part_file):
         lstat    = os.stat(part_file)
@@ -356,7 +416,7 @@ def file_reassemble(parent):
           return False
 
         # Creating empty target file because part 0 is ready to get written
-        ftarget = open(msg.target_file, 'wb')
+        ftarget = open(target_path, 'wb')
         ftarget.close()
         msg.logger.info('Created new target file: %s' %msg.target_file) 
       
@@ -367,7 +427,7 @@ def file_reassemble(parent):
 
     # check target file size and pick starting part from that
 
-    lstat   = os.stat(msg.target_file)
+    lstat   = os.stat(target_path)
     fsiz    = lstat[stat.ST_SIZE] 
     i       = int(fsiz /msg.chunksize) 
 
@@ -380,7 +440,7 @@ def file_reassemble(parent):
 
           # set part file
 
-          part_file = msg.target_file + msg.suffix
+          part_file = target_path + msg.suffix
           if not os.path.isfile(part_file) :
              msg.logger.debug("part file %s not found, stop insertion" % part_file) 
              # break and not return because we want to check the lastchunk processing
@@ -388,7 +448,7 @@ def file_reassemble(parent):
 
           # check for insertion (size may have changed)
 
-          lstat   = os.stat(msg.target_file)
+          lstat   = os.stat(target_path)
           fsiz    = lstat[stat.ST_SIZE] 
           if msg.offset > fsiz :
              msg.logger.debug("part file %s not ready for insertion (fsiz %d, offset %d)" % (part_file,fsiz,msg.offset))
@@ -419,14 +479,14 @@ def file_reassemble(parent):
           i = i + 1
 
     # because of randomize need a better way to check if complete
-    lstat   = os.stat(msg.target_file)
+    lstat   = os.stat(target_path)
     fsiz    = lstat[stat.ST_SIZE] 
 
     if (fsiz == msg.filesize): # Make sure target_relpath and new_baseurl are defined... 
       file_truncate(parent,msg)
 
       partstr = '1,%d,1,0,0' % fsiz
-      sumstr = compute_sumstr(parent, msg.target_file, fsiz, 0)
+      sumstr = compute_sumstr(parent, target_path, fsiz, 0)
 
       msg.new_file = msg.target_file
       msg.set_file(msg.target_relpath, sumstr) 
@@ -455,7 +515,7 @@ def compute_sumstr(parent, path, fsiz, i = 0):
 
   else:
 
-     if not sumflg[0] in ['0','d','n','s','z' ]: sumflg = 'd'
+     if sumflg[0] != 'z' and not sumflg in parent.sumalgos: sumflg = 'd'
 
      parent.set_sumalgo(sumflg)
      sumalgo = parent.sumalgo
@@ -463,16 +523,8 @@ def compute_sumstr(parent, path, fsiz, i = 0):
 
      # compute checksum
 
-     if sumflg in ['d','s'] :
-
-        fp = open(path,'rb')
-        fp.seek(i)
-        while i<fsiz :
-              buf = fp.read(parent.bufsize)
-              if not buf: break
-              sumalgo.update(buf)
-              i  += len(buf)
-        fp.close()
+     if sumalgo.reads_data() and i < fsiz :
+        sum_file(sumalgo, path, i, fsiz-i, parent.bufsize)
 
      # setting sumstr
 
@@ -494,45 +546,33 @@ def file_write_length(req,msg,bufsize,filesize,parent):
     msg.logger.debug("file_write_length chk = %s" % chk)
     if chk : chk.set_path(msg.new_file)
 
+    new_path = os.path.join(msg.new_dir, msg.new_file)
+
     # file should exists
-    if not os.path.isfile(msg.new_file) :
-       fp = open(msg.new_file,'w')
+    if not os.path.isfile(new_path) :
+       fp = open(new_path,'w')
        fp.close()
 
-    # file open read/modify binary
-    fp = open(msg.new_file,'r+b')
-    if msg.local_offset != 0 : fp.seek(msg.local_offset,0)
-
-    nc = int(msg.length/bufsize)
-    r  =     msg.length%bufsize
+    # file open read/modify binary, copy from where req stands
+    fp = open(new_path,'r+b')
 
-    # read/write bufsize "nc" times
-    i  = 0
-    while i < nc :
-          chunk = req.read(bufsize)
-          fp.write(chunk)
-          if chk : chk.update(chunk)
-          i = i + 1
-
-    # remaining
-    if r > 0 :
-       chunk = req.read(r)
-       fp.write(chunk)
-       if chk : chk.update(chunk)
+    length = file_copy(req, fp, req.tell(), msg.local_offset, msg.length, bufsize)
 
-    if fp.tell() >= msg.filesize:
-       fp.truncate()
+    if msg.local_offset + length >= msg.filesize:
+       fp.truncate(msg.local_offset + length)
 
     fp.close()
+
+    if chk : file_sum(chk, new_path, msg.local_offset, length, bufsize)
   
     h = parent.msg.headers
     if parent.preserve_mode and 'mode' in h :
        try   : mod = int( h['mode'], base=8)
        except: mod = 0
-       if mod > 0 : os.chmod(msg.new_file, mod )
+       if mod > 0 : os.chmod(new_path, mod )
 
     if parent.preserve_time and 'mtime' in h and h['mtime'] :
-        os.utime(msg.new_file, times=( timestr2flt( h['atime']), timestr2flt( h[ 'mtime' ] )))
+        os.utime(new_path, times=( timestr2flt( h['atime']), timestr2flt( h[ 'mtime' ] )))
 
     if chk:
         msg.onfly_checksum = "{},{}".format(chk.registered_as(), chk.get_value())
@@ -551,12 +591,14 @@ def file_truncate(parent,msg):
     # whenever that is
     if (not parent.randomize) and (not msg.lastchunk) : return
 
+    target_path = os.path.join(msg.new_dir, msg.target_file)
+
     try :
-             lstat   = os.stat(msg.target_file)
+             lstat   = os.stat(target_path)
              fsiz    = lstat[stat.ST_SIZE] 
 
              if fsiz > msg.filesize :
-                fp = open(msg.target_file,'r+b')
+                fp = open(target_path,'r+b')
                 fp.truncate(msg.filesize)
                 fp.close()
 
@@ -65,33 +65,26 @@ class sr_ftp(sr_proto):
         parent.logger.debug("sr_ftp __init__")
         sr_proto.__init__(self,parent)
         self.user_cache_dir = parent.user_cache_dir
-        # ftp command times out after 20 secs
-        # this setting is different from the computed iotime (sr_proto)
         self.init()
  
     # cd
     def cd(self, path):
         self.logger.debug("sr_ftp cd %s" % path)
 
-        alarm_set(self.iotime)
         self.ftp.cwd(self.originalDir)
         self.ftp.cwd(path)
         self.pwd = path
-        alarm_cancel()
 
     def cd_forced(self,perm,path) :
         self.logger.debug("sr_ftp cd_forced %d %s" % (perm,path))
 
         # try to go directly to path
 
-        alarm_set(self.iotime)
         self.ftp.cwd(self.originalDir)
         try   :
                 self.ftp.cwd(path)
-                alarm_cancel()
                 return
         except: pass
-        alarm_cancel()
 
         # need to create subdir
 
@@ -102,26 +95,18 @@ class sr_ftp(sr_proto):
             if d == ''   : continue
             # try to go directly to subdir
             try   :
-                    alarm_set(self.iotime)
                     self.ftp.cwd(d)
-                    alarm_cancel()
                     continue
             except: pass
 
             # create
-            alarm_set(self.iotime)
             self.ftp.mkd(d)
-            alarm_cancel()
 
             # chmod
-            alarm_set(self.iotime)
             self.ftp.voidcmd('SITE CHMOD ' + "{0:o}".format(perm) + ' ' + d)
-            alarm_cancel()
 
             # cd
-            alarm_set(self.iotime)
             self.ftp.cwd(d)
-            alarm_cancel()
 
     # check_is_connected
 
@@ -151,9 +136,7 @@ class sr_ftp(sr_proto):
     # chmod
     def chmod(self,perm,path):
         self.logger.debug("sr_ftp chmod %s %s" % (str(perm),path))
-        alarm_set(self.iotime)
         self.ftp.voidcmd('SITE CHMOD ' + "{0:o}".format(perm) + ' ' + path)
-        alarm_cancel()
 
     # close
     def close(self):
@@ -164,10 +147,8 @@ class sr_ftp(sr_proto):
         self.init()
 
         try:
-                alarm_set(self.iotime)
                 old_ftp.quit()
         except: pass
-        alarm_cancel()
 
     # connect...
     def connect(self):
@@ -179,11 +160,9 @@ class sr_ftp(sr_proto):
         if not self.credentials() : return False
 
 
-        # timeout alarm 100 secs to connect
-        alarm_set(self.iotime)
+        # every command and data transfer on the connection times out after iotime
         try:
-                expire  = -999
-                if self.parent.timeout : expire = self.parent.timeout
+                expire  = self.iotime
                 if self.port == '' or self.port == None : self.port = 21
 
                 if not self.tls :
@@ -219,14 +198,12 @@ class sr_ftp(sr_proto):
                 if os.path.isfile(self.file_index_cache): self.load_file_index()
                 else: self.init_file_index()
 
-                #alarm_cancel()
                 return True
 
         except:
             self.logger.error("Unable to connect to %s (user:%s)" % ( self.host, self.user ) )
             self.logger.debug('Exception details: ', exc_info=True)
 
-        alarm_cancel()
         return False
 
     # credentials...
@@ -258,11 +235,9 @@ class sr_ftp(sr_proto):
     # delete
     def delete(self, path):
         self.logger.debug( "sr_ftp rm %s" % path)
-        alarm_set(self.iotime)
         # if delete does not work (file not found) run pwd to see if connection is ok
         try   : self.ftp.delete(path)
         except: d = self.ftp.pwd()
-        alarm_cancel()
 
     # get
     def get(self, remote_file, local_file, remote_offset=0, local_offset=0, length=0 ):
@@ -274,9 +249,9 @@ class sr_ftp(sr_proto):
         # initialize sumalgo
         if self.sumalgo : self.sumalgo.set_path(remote_file)
 
-        # download
+        # download (from remote_offset, with REST, in binary mode)
         self.write_chunk_init(dst)
-        if self.binary : self.ftp.retrbinary('RETR ' + remote_file, self.write_chunk, self.bufsize )
+        if self.binary : self.ftp.retrbinary('RETR ' + remote_file, self.write_chunk, self.bufsize, remote_offset or None )
         else           : self.ftp.retrlines ('RETR ' + remote_file, self.write_chunk )
         rw_length = self.write_chunk_end()
 
@@ -286,9 +261,7 @@ class sr_ftp(sr_proto):
 
     # getcwd
     def getcwd(self):
-        alarm_set(self.iotime)
         pwd = self.ftp.pwd()
-        alarm_cancel()
         return pwd
 
     # init
@@ -310,14 +283,11 @@ class sr_ftp(sr_proto):
         self.init_nlst_index = 0
         if self.init_nlst:
             self.ftp.retrlines('LIST', self.ls_file_index )
-        else:
-            alarm_cancel()
         if hasattr(self,'file_index'): self.write_file_index()
 
     # load_file_index
     def load_file_index(self):
         self.logger.debug("sr_ftp load_file_index")
-        alarm_cancel()
         try:
             with open(self.file_index_cache,'r') as fp:
                 index = int(fp.read())
@@ -329,9 +299,7 @@ class sr_ftp(sr_proto):
     def ls(self):
         self.logger.debug("sr_ftp ls")
         self.entries = {}
-        alarm_set(self.iotime)
         self.ftp.retrlines('LIST',self.line_callback )
-        alarm_cancel()
         self.logger.debug("sr_ftp ls = %s" % self.entries )
         return self.entries
 
@@ -339,8 +307,6 @@ class sr_ftp(sr_proto):
     def line_callback(self,iline):
         self.logger.debug("sr_ftp line_callback %s" % iline)
 
-        alarm_cancel()
-
         oline  = iline
         oline  = oline.strip('\n')
         oline  = oline.strip()
@@ -360,14 +326,10 @@ class sr_ftp(sr_proto):
 
         self.entries[fil] = line
 
-        alarm_set(self.iotime)
-
     # ls_file_index
     def ls_file_index(self,iline):
         self.logger.debug("sr_ftp ls_file_index")
 
-        alarm_cancel()
-
         oline = iline
         oline = oline.strip('\n')
         oline = oline.strip()
@@ -390,12 +352,8 @@ class sr_ftp(sr_proto):
     # mkdir
     def mkdir(self, remote_dir):
         self.logger.debug("sr_ftp mkdir %s" % remote_dir)
-        alarm_set(self.iotime)
         self.ftp.mkd(remote_dir)
-        alarm_cancel()
-        alarm_set(self.iotime)
         self.ftp.voidcmd('SITE CHMOD ' + "{0:o}".format(self.parent.chmod_dir) + ' ' + remote_dir)
-        alarm_cancel()
 
     # put
     def put(self, local_file, remote_file, local_offset=0, remote_offset=0, length=0 ):
@@ -416,23 +374,17 @@ class sr_ftp(sr_proto):
     # rename
     def rename(self,remote_old,remote_new) :
         self.logger.debug("sr_ftp rename %s %s" % (remote_old,remote_new))
-        alarm_set(self.iotime)
         self.ftp.rename(remote_old,remote_new)
-        alarm_cancel()
 
     # rmdir
     def rmdir(self, path):
         self.logger.debug("sr_ftp rmdir %s" % path)
-        alarm_set(self.iotime)
         self.ftp.rmd(path)
-        alarm_cancel()
 
     # umask
     def umask(self) :
         self.logger.debug("sr_ftp umask")
-        alarm_set(self.iotime)
         self.ftp.voidcmd('SITE UMASK 777')
-        alarm_cancel()
 
     # write_file_index
     def write_file_index(self):
@@ -32,13 +32,124 @@
 #
 #
 
-import os, sarra, ssl, urllib.request, urllib.error, ssl, sys
+import base64, copy, http.client, os, sarra, ssl, sys, threading, time
+import urllib.parse, urllib.request, urllib.error
+
+from urllib.parse import unquote
 
 try :
          from sr_util            import *
 except :
          from sarra.sr_util      import *
 
+#============================================================
+# keep-alive connections shared by all sr_http instances of the process.
+#
+# connections are kept per server (scheme, host, port and proxy), so that
+# successive requests to the same server reuse the TCP connection and, for
+# https, the TLS session (a new connection to a known server resumes the
+# last session instead of doing a full handshake).  At most maxsize idle
+# connections are kept per server, and those idle for more than idle
+# seconds are closed.
+#============================================================
+
+class http_tls_connection(http.client.HTTPSConnection):
+
+    session = None
+
+    # same as HTTPSConnection.connect, offering the previous TLS session
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+
+        server_hostname = self._tunnel_host if self._tunnel_host else self.host
+
+        try   : self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname, session=self.session)
+        except ValueError :
+                self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname)
+
+class http_pool():
+
+    def __init__(self, maxsize=4, idle=30):
+        self.maxsize  = maxsize
+        self.idle     = idle
+        self.lock     = threading.Lock()
+        self.conns    = {}
+        self.sessions = {}
+
+    # clear : close all idle connections
+    def clear(self):
+        with self.lock :
+             conns      = self.conns
+             self.conns = {}
+        for key in conns :
+            for when, conn in conns[key] : conn.close()
+
+    # resize : keep at most maxsize idle connections per server
+    def resize(self, maxsize):
+        with self.lock :
+             self.maxsize = maxsize
+             evicted = []
+             for idle in self.conns.values() :
+                 while len(idle) > maxsize : evicted.append(idle.pop(0)[1])
+        for conn in evicted : conn.close()
+
+    # get : returns ( key, connection, reused ) for the server of url
+    def get(self, url, tlsctx, timeout=None):
+        port  = url.port if url.port else ( 443 if url.scheme == 'https' else 80 )
+        proxy = urllib.request.getproxies().get(url.scheme)
+        if proxy and urllib.request.proxy_bypass(url.hostname) : proxy = None
+
+        key   = ( url.scheme, url.hostname, port, proxy )
+        now   = time.monotonic()
+
+        with self.lock :
+             idle = self.conns.get(key,[])
+             while idle :
+                   when, conn = idle.pop()
+                   if now - when < self.idle :
+                      conn.timeout = timeout
+                      if conn.sock : conn.sock.settimeout(timeout)
+                      return key, conn, True
+                   conn.close()
+             session = self.sessions.get(key)
+
+        host, hport = url.hostname, port
+        if proxy :
+           purl  = urllib.parse.urlparse(proxy)
+           host  = purl.hostname
+           hport = purl.port if purl.port else ( 443 if purl.scheme == 'https' else 80 )
+
+        if url.scheme == 'https' :
+           conn = http_tls_connection(host, hport, timeout=timeout, context=tlsctx)
+           conn.session = session
+           if proxy : conn.set_tunnel(url.hostname, port)
+        else :
+           conn = http.client.HTTPConnection(host, hport, timeout=timeout)
+
+        return key, conn, False
+
+    # put : give back the connection of a completely read response
+    def put(self, key, conn):
+        if not conn.sock :
+           conn.close()
+           return
+
+        now = time.monotonic()
+
+        with self.lock :
+             if isinstance(conn.sock, ssl.SSLSocket) and conn.sock.session :
+                self.sessions[key] = conn.sock.session
+
+             idle = self.conns.setdefault(key,[])
+             idle.append( (now,conn) )
+
+             # evict the connections idle for too long, and the oldest beyond maxsize
+             while idle and ( len(idle) > self.maxsize or now - idle[0][0] >= self.idle ) :
+                   when, c = idle.pop(0)
+                   c.close()
+
+http_connections = http_pool()
+
 #============================================================
 # http protocol in sarracenia supports/uses :
 #
@@ -68,7 +179,7 @@ class sr_http(sr_proto):
         self.cwd  = os.path.dirname(path)
         self.path = path
 
-    # for compatibility... always new connection with http
+    # connections are kept alive in http_connections
     def check_is_connected(self):
         self.logger.debug("sr_http check_is_connected")
 
@@ -81,6 +192,7 @@ class sr_http(sr_proto):
     # close
     def close(self):
         self.logger.debug("sr_http close")
+        self.__release__()
         self.init()
 
     # connect...
@@ -110,6 +222,19 @@ class sr_http(sr_proto):
 
                 self.bearer_token = details.bearer_token if hasattr(details, 'bearer_token' ) else None
 
+                # authentication headers, resolved once for the destination
+
+                self.headers = { 'user-agent': 'Sarracenia ' + sarra.__version__ }
+
+                if self.bearer_token :
+                   self.logger.debug('bearer_token: %s' % self.bearer_token )
+                   self.headers[ 'Authorization' ] = 'Bearer ' + self.bearer_token
+
+                elif self.user != None :
+                   pw   = unquote(self.password) if self.password != None else ''
+                   cred = ( '%s:%s' % (unquote(self.user), pw) ).encode('utf-8')
+                   self.headers[ 'Authorization' ] = 'Basic ' + base64.b64encode(cred).decode('ascii')
+
                 return True
 
         except:
@@ -127,14 +252,148 @@ class sr_http(sr_proto):
 
         url = self.destination + '/' + self.path + '/' + remote_file
 
+        # a large file is fetched in several range requests at once
+
+        if self.__ranges__(remote_offset, local_offset, length) :
+           return self.get_ranges(remote_file, url, local_file, length)
+
         ok  = self.__open__(url, remote_offset, length )
 
         if not ok : return False
 
+        # writing the whole file at an offset would corrupt it
+
+        if remote_offset != 0 and self.http.status != 206 :
+           self.__release__()
+           raise urllib.error.URLError('no range %d-%d from %s' % (remote_offset,remote_offset+length-1,self.urlstr))
+
         # read from self.http write to local_file
 
         rw_length = self.read_writelocal(remote_file, self.http, local_file, local_offset, length)
 
+        # the server closed the connection before sending all it announced
+
+        if self.http.length and ( length == 0 or rw_length < length ) :
+           self.__release__()
+           raise urllib.error.URLError('incomplete %s, %d bytes missing' % (self.urlstr,self.http.length))
+
+        self.__release__()
+
+        return True
+
+    # get_ranges : get the length bytes of url in range_streams range requests at once,
+    #              the first range here, the others in threads, each written at its offset
+    #              in the preallocated local_file.  The ranges cannot be summed separately
+    #              (md5, sha512... are sequential) : the first range is summed as it arrives,
+    #              the rest of the file once all ranges are written.
+    #              A server ignoring ranges sends the whole file, read as a single stream.
+    def get_ranges(self, remote_file, url, local_file, length):
+        self.logger.debug( "sr_http get_ranges %s %s %d" % (remote_file,local_file,length))
+
+        size   = -(-length // self.parent.range_streams)
+        ranges = [ (offset, min(size, length-offset)) for offset in range(0,length,size) ]
+
+        ok = self.__open__(url, 0, size, True)
+        if not ok : return False
+
+        if self.__range_of__() != ( 0, size, length ) :
+           self.logger.info("sr_http get_ranges: no range from %s, single stream" % self.urlstr)
+           if self.http.status == 206 :
+              ok = self.__open__(url)
+              if not ok : return False
+           self.read_writelocal(remote_file, self.http, local_file, 0, length)
+           self.__release__()
+           return True
+
+        # preallocate local_file
+
+        dst = self.local_write_open(local_file, 0)
+        try    : os.posix_fallocate(dst.fileno(), 0, length)
+        except : dst.truncate(length)
+
+        # the other ranges in threads, each with its own connection
+
+        errors  = []
+        threads = []
+        for offset, count in ranges[1:] :
+            part  = copy.copy(self)
+            part.http = None
+            part.conn = None
+            thread = threading.Thread(target=part.__get_range__, args=(url, local_file, offset, count, length, errors), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        try :
+                if self.sumalgo : self.sumalgo.set_path(remote_file)
+                rw_length = readinto_copy(self.http, dst, self.sumalgo, size, self.bufsize)
+                self.__release__()
+                if rw_length != size :
+                   errors.append(urllib.error.URLError('incomplete range 0-%d of %s' % (size-1,self.urlstr)))
+        except Exception as ex :
+                self.__release__()
+                errors.append(ex)
+        finally :
+                for thread in threads : thread.join()
+
+        # the ranges written are not a prefix of the file : nothing to keep
+
+        if errors :
+           dst.truncate(0)
+           dst.close()
+           raise errors[0]
+
+        # sum the rest of the file
+
+        dst.flush()
+        if self.sumalgo and self.sumalgo.reads_data() :
+           sum_file(self.sumalgo, local_file, size, length-size, self.bufsize)
+
+        dst.seek(length)
+        self.local_write_close(dst)
+
+        return True
+
+    # __get_range__ : (in a thread) get count bytes of url at offset into local_file, at the same offset
+    def __get_range__(self, url, local_file, offset, count, length, errors):
+        try :
+                self.__open__(url, offset, count, True)
+
+                if self.__range_of__() != ( offset, count, length ) :
+                   raise urllib.error.URLError('no range %d-%d from %s' % (offset,offset+count-1,self.urlstr))
+
+                with open(local_file,'r+b') as dst :
+                     dst.seek(offset)
+                     rw_length = readinto_copy(self.http, dst, None, count, self.bufsize)
+
+                if rw_length != count :
+                   raise urllib.error.URLError('incomplete range %d-%d of %s' % (offset,offset+count-1,self.urlstr))
+
+        except Exception as e :
+                errors.append(e)
+
+        self.__release__()
+
+    # __range_of__ : ( offset, count, size ) of the current partial content response, None otherwise
+    def __range_of__(self):
+        if self.http == None or self.http.status != 206 : return None
+
+        try :
+                first, size = self.http.getheader('Content-Range').split(' ')[-1].split('/')
+                start, end  = first.split('-')
+                return ( int(start), int(end) - int(start) + 1, int(size) )
+        except :
+                return None
+
+    # __ranges__ : files of at least range_threshold bytes are downloaded in range_streams ranges.
+    #              not when resuming or writing at an offset, transforming or throttling the data.
+    def __ranges__(self, remote_offset, local_offset, length):
+        parent = self.parent
+
+        if parent.range_streams < 2                                    : return False
+        if length < max(parent.range_threshold, parent.range_streams) : return False
+        if remote_offset != 0 or local_offset != 0                     : return False
+        if parent.on_data_list or self.kbytes_ps                       : return False
+
         return True
 
     # init
@@ -143,7 +402,10 @@ class sr_http(sr_proto):
         self.logger.debug("sr_http init")
         self.connected   = False
         self.http        = None
+        self.conn        = None
+        self.conn_key    = None
         self.details     = None
+        self.headers     = { 'user-agent': 'Sarracenia ' + sarra.__version__ }
         self.seek        = True
 
         self.urlstr      = ''
@@ -172,15 +434,15 @@ class sr_http(sr_proto):
         try :
                  dbuf = None
                  while  True:
-                        alarm_set(self.iotime)
                         chunk = self.http.read(self.bufsize)
-                        alarm_cancel()
                         if not chunk: break
                         if dbuf : dbuf += chunk
                         else    : dbuf  = chunk
 
                  self.data = dbuf.decode('utf-8')
 
+                 self.__release__()
+
                  # invoke parent defined on_html_page ... if any
 
                  for plugin in self.parent.on_html_page_list:
@@ -195,12 +457,13 @@ class sr_http(sr_proto):
         return self.entries
 
     # open
-    def __open__(self, path, remote_offset=0, length=0):
+    def __open__(self, path, remote_offset=0, length=0, ranged=False):
         self.logger.debug( "sr_http open")
 
+        self.__release__()
+
         self.http      = None
         self.connected = False
-        self.req       = None
         self.urlstr    = path
 
         # have noticed that some site does not allow // in path
@@ -210,92 +473,105 @@ class sr_http(sr_proto):
         if path.startswith('https://') and '//' in path[8:] :
            self.urlstr = 'https://' + path[8:].replace('//','/')
 
-        alarm_set(self.iotime)
+        headers = dict(self.headers)
+
+        # set range in byte if needed
+        if remote_offset != 0 or ranged :
+           headers['Range'] = 'bytes=%d-%d'%(remote_offset,remote_offset + length-1)
+           if self.if_range : headers['If-Range'] = self.if_range
+
+        # the connection times out every read or write after iotime
 
         try:
-                # when credentials are needed.
-                headers = { 'user-agent': 'Sarracenia ' + sarra.__version__ }
-                if self.bearer_token :
-                    self.logger.debug('bearer_token: %s' % self.bearer_token )
-                    headers[ 'Authorization' ] = 'Bearer ' + self.bearer_token
-
-                if self.user != None :                          
-                   password_mgr = urllib.request.HTTPPasswordMgrWithDefaultRealm()
-                   # takeaway credentials info from urlstr
-
-                   cred        = self.user + '@'
-                   self.urlstr = self.urlstr.replace(cred,'')
-                   if self.password != None :                          
-                      cred        = self.user + ':' + self.password +'@'
-                      self.urlstr = self.urlstr.replace(cred,'')
-                      pw=unquote(self.password)
-                   else:
-                      pw=None
-
-                   # continue with authentication
-                   password_mgr.add_password(None, self.urlstr,self.user,pw)
-                   auth_handler = urllib.request.HTTPBasicAuthHandler(password_mgr)
-            
-                   #hctx = ssl.create_default_context()
-                   #hctx.check_hostname = False
-                   #hctx.verify_mode = ssl.CERT_NONE
-                   ssl_handler = urllib.request.HTTPSHandler(0,self.tlsctx)
-
-                   # create "opener" (OpenerDirector instance)
-                   opener = urllib.request.build_opener(auth_handler,ssl_handler)
-
-                   # use the opener to fetch a URL
-                   opener.open(self.urlstr)
-
-                   # Install the opener.
-                   urllib.request.install_opener(opener)
-
-                # Now all calls to get the request use our opener.
-                self.req = urllib.request.Request(self.urlstr, headers=headers)
-
-                # set range in byte if needed
-                if remote_offset != 0 :
-                   str_range = 'bytes=%d-%d'%(remote_offset,remote_offset + length-1)
-                   self.req.headers['Range'] = str_range
-
-                # https without user : create/use an ssl context
-                ctx = None
-                if self.user == None and self.urlstr.startswith('https'):
-                   ctx = self.tlsctx
-                   #ctx.check_hostname = False
-                   #ctx.verify_mode = ssl.CERT_NONE
+                # credentials are sent in the headers, take them away from urlstr
+                url = urllib.parse.urlparse(self.urlstr)
+                if url.username != None :
+                   netloc = url.netloc.split('@')[-1]
+                   self.urlstr = urllib.parse.urlunparse(url._replace(netloc=netloc))
+
+                # follow a few redirections, as urllib did
+                for redirect in range(6):
+                    url = urllib.parse.urlparse(self.urlstr)
+                    if url.scheme not in [ 'http', 'https' ] :
+                       raise urllib.error.URLError('unsupported url %s' % self.urlstr)
+
+                    target = url.path if url.path else '/'
+                    if url.query : target += '?' + url.query
+
+                    # a kept alive connection may have been closed by the server : retry on a new one
+                    while True:
+                          key, conn, reused = http_connections.get(url, self.tlsctx, self.iotime)
+                          if key[3] and url.scheme == 'http' : target = self.urlstr
+                          try:
+                                  conn.request('GET', target, headers=headers)
+                                  response = conn.getresponse()
+                                  break
+                          except (http.client.HTTPException, OSError) as e:
+                                  conn.close()
+                                  if reused : continue
+                                  raise urllib.error.URLError(e)
+
+                    self.http     = response
+                    self.conn     = conn
+                    self.conn_key = key
+
+                    if response.status in [ 301, 302, 303, 307, 308 ] and response.getheader('Location') :
+                       response.read()
+                       self.__release__()
+                       location = urllib.parse.urljoin(self.urlstr, response.getheader('Location'))
+                       if urllib.parse.urlparse(location).netloc != url.netloc :
+                          headers.pop('Authorization', None)
+                       self.logger.debug("sr_http redirected to %s" % location)
+                       self.urlstr = location
+                       continue
+
+                    if response.status >= 400 :
+                       response.read()
+                       self.__release__()
+                       raise urllib.error.HTTPError(self.urlstr, response.status, response.reason, response.headers, None)
+
+                    break
+
+                # a strong validator of the source, to resume its download
+                etag = response.getheader('ETag')
+                if etag and etag.startswith('W/') : etag = None
+                self.validator = etag if etag else response.getheader('Last-Modified')
 
                 # open... we are connected
-                if self.timeout == None :
-                   self.http = urllib.request.urlopen(self.req, context=ctx)
-                else :
-                   self.http = urllib.request.urlopen(self.req, timeout=self.timeout, context=ctx)
-
                 self.connected = True
 
-                alarm_cancel()
-
                 return True
 
         except urllib.error.HTTPError as e:
                self.logger.error('Download failed 4 %s ' % self.urlstr)
                self.logger.error('Server couldn\'t fulfill the request. Error code: %s, %s' % (e.code, e.reason))
-               alarm_cancel()
                raise
         except urllib.error.URLError as e:
                self.logger.error('Download failed 5 %s ' % self.urlstr)
                self.logger.error('Failed to reach server. Reason: %s' % e.reason)
-               alarm_cancel()
                raise
         except:
                self.logger.warning("sr_http/__open__: unable to open %s" % self.urlstr)
                self.logger.debug('Exception details: ', exc_info=True)
-               alarm_cancel()
+               self.__release__()
                raise
 
-        alarm_cancel()
         return False
 
+    # release : keep the connection alive if its response was completely read
+    def __release__(self):
+        conn, response = self.conn, self.http
+
+        self.conn = None
+        self.http = None
+
+        if conn == None : return
+
+        if response != None and response.isclosed() and not response.will_close :
+           http_connections.put(self.conn_key, conn)
+        else :
+           conn.close()
+
 #============================================================
 #
 # http_transport inherited from sr_transport
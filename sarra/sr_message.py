@@ -36,9 +36,6 @@ import calendar,os,socket,sys,time,urllib,urllib.parse
 
 from sys import platform as _platform
 
-from codecs import decode,encode
-
-import json
 
 # AMQP limits headers to 'short string', or 255 characters, so truncate and warn.
 amqp_ss_maxlen = 253
@@ -134,9 +131,9 @@ class sr_message():
             return
 
         if self.post_version == 'v03':
-            json_line = json.dumps( ( self.pubtime, self.baseurl, self.relpath, self.headers ), sort_keys=True )
+            json_line = json_codec.dumps( ( self.pubtime, self.baseurl, self.relpath, self.headers ), sort_keys=True )
         else:
-            json_line = json.dumps( ( self.topic, self.headers, self.notice ), sort_keys=True )
+            json_line = json_codec.dumps( ( self.topic, self.headers, self.notice ), sort_keys=True )
 
         print("%s" % json_line, flush=True )
 
@@ -235,20 +232,11 @@ class sr_message():
 
         self.logger.debug("checksum extracted by reading file/calculating")
 
-        bufsize = self.bufsize
-        if self.length < bufsize : bufsize = self.length
-
         self.sumalgo.set_path(os.path.basename(self.new_file))
 
-        fp = open( self.new_dir + '/' + self.new_file,'rb')
-        if self.local_offset != 0 : fp.seek(self.local_offset,0)
-        i  = 0
-        while i<self.length :
-              buf = fp.read(bufsize)
-              if not buf: break
-              self.sumalgo.update(buf)
-              i  += len(buf)
-        fp.close()
+        i = 0
+        if self.length > 0 :
+           i = sum_file(self.sumalgo, self.new_dir + '/' + self.new_file, self.local_offset, self.length, self.bufsize)
 
         if i != self.length :
            self.logger.warning("sr_message compute_local_checksum incomplete reading %d %d" % (i,self.length))
@@ -270,7 +258,7 @@ class sr_message():
     def from_amqplib(self, msg=None ):
         """
             This routine does a minimal decode of raw messages from amqplib
-            raw messages are also decoded by sr_retry/msgToJSON, so must match the two. 
+            the body is decoded by sr_util/decode_body, shared with sr_retry/msgToJSON.
         """
 
         self.start_timer()
@@ -279,66 +267,12 @@ class sr_message():
         if msg :
            self.exchange  = msg.delivery_info['exchange']
            self.topic     = msg.delivery_info['routing_key']
-           self.topic     = self.topic.replace('%20',' ')
-           self.topic     = self.topic.replace('%23','#')
-           if msg.body[0] == '[' :
-               self.logger.debug("from_amqplib transitional v03" )
-               self.pubtime, self.baseurl, self.relpath, self.headers = json.loads(msg.body)
-               self.notice = "%s %s %s" % ( self.pubtime, self.baseurl, self.relpath )
-           elif msg.body[0] == '{' :
-               self.logger.debug("from_amqplib v03 body: %s" % msg.body)
-               self.headers = json.loads(msg.body)
-               self.logger.debug("from_amqplib v03 headers: %s" % self.headers )
-               self.pubtime = self.headers[ "pubTime" ]
-               self.baseurl = self.headers[ "baseUrl" ]
-               self.relpath = self.headers[ "relPath" ]
-               self.notice = "%s %s %s" % ( self.pubtime, self.baseurl, self.relpath )
-               if "integrity" in self.headers.keys():
-                   sum_algo_v3tov2 = { "arbitrary":"a", "md5":"d", "sha512":"s", "md5name":"n", "random":"0", "link":"L", "remove":"R", "cod":"z" }
-                   if type( self.headers[ "integrity" ] ) is str:
-                       self.headers[ "integrity" ] = json.loads( self.headers[ "integrity" ] )
-                   sa = sum_algo_v3tov2[ self.headers[ "integrity" ][ "method" ] ]
-
-                   # transform sum value
-                   if sa in [ '0' ]:
-                       sv = self.headers[ "integrity" ][ "value" ]
-                   elif sa in [ 'z' ]:
-                       sv = sum_algo_v3tov2[ self.headers[ "integrity" ][ "value" ] ]
-                   else:
-                       sv = encode( decode( self.headers[ "integrity" ][ "value" ].encode('utf-8'), "base64" ), 'hex' ).decode('utf-8')
-                   # set event.
-                   if sa == 'L' :
-                       self.event = 'link'
-                   elif sa == 'R':
-                       self.event = 'delete'
-                   else:
-                       self.event = 'modify'
-
-                   self.headers[ "sum" ] = sa + ',' + sv
-                   self.sumstr = self.headers['sum']
-                   del self.headers['integrity']
-               if 'blocks' in self.headers.keys():
-                   parts_map = {'inplace': 'i', 'partitioned': 'p'}
-                   self.set_parts(parts_map[self.headers['blocks']['method']], int(self.headers['blocks']['size']),
-                                      int(self.headers['blocks']['count']), int(self.headers['blocks']['remainder']),
-                                      int(self.headers['blocks']['number']))
-                   del self.headers['blocks']
-               elif 'size' in self.headers.keys():
-                   self.set_parts('1', int(self.headers['size']))
-                   del self.headers['size']
-
+           if '%' in self.topic :
+              self.topic  = self.topic.replace('%20',' ').replace('%23','#')
 
-           else:
-               self.logger.debug("from_amqplib v02" )
-               if 'application_headers' in msg.properties.keys():
-                   self.headers = msg.properties['application_headers']
-
-               if type(msg.body) == bytes: 
-                    self.notice = msg.body.decode("utf-8")
-               else:
-                    self.notice = msg.body
+           self.pubtime, self.baseurl, self.relpath, self.headers, self.notice = \
+               decode_body( msg.body, msg.properties.get('application_headers', self.headers) )
 
-               self.pubtime, self.baseurl, self.relpath = self.notice.split(' ')[0:3]
            self.isRetry   = msg.isRetry
 
         # retransmission case :
@@ -628,22 +562,14 @@ class sr_message():
                self.headers[ "baseUrl" ] = self.baseurl
                self.headers[ "relPath" ] = self.relpath
                
-               sum_algo_map = { "a":"arbitrary", "d":"md5", "s":"sha512", "n":"md5name", "0":"random", "L":"link", "R":"remove", "z":"cod" }
                if 'sum' in self.headers:
-                   sm = sum_algo_map[ self.headers["sum"][0] ]
-                   if sm in [ 'random' ] :
-                       sv = self.headers["sum"][2:]
-                   elif sm in [ 'cod' ] :
-                       sv = sum_algo_map[ self.headers["sum"][2:] ]
-                   else:
-                       sv = encode( decode( self.headers["sum"][2:], 'hex'), 'base64' ).decode('utf-8').strip()
-                   self.headers[ "integrity" ] = { "method": sm, "value": sv }
+                   self.headers[ "integrity" ] = sum_v2tov3( self.headers["sum"] )
 
                if 'parts' in self.headers.keys():
                    self.set_parts_from_str(self.headers['parts'])
                    self.convert_partsv2tov3()
 
-               body = json.dumps({k: self.headers[k] for k in self.headers if k not in ['sum', 'parts']})
+               body = json_codec.dumps({k: self.headers[k] for k in self.headers if k not in ['sum', 'parts']})
 
                for plugin in parent.on_post_list:
                     if not plugin(parent):
@@ -674,7 +600,7 @@ class sr_message():
                    # v02 wants simple strings, cannot have dicts like in v03.
                    if type(self.headers[h]) is dict:
                        self.logger.debug( "dict header flattening to a string: header[ %s ] = %s " % ( h, self.headers[h] ) )
-                       self.headers[h] = json.dumps( self.headers[h] )
+                       self.headers[h] = json_codec.dumps( self.headers[h] )
 
                    if (type(self.headers[h]) is str) and (len(self.headers[h].encode("utf8")) >= amqp_ss_maxlen):
 
@@ -700,6 +626,10 @@ class sr_message():
                else:
                     ok = self.publisher.publish(self.exchange+suffix,self.topic,self.notice,self.headers,self.message_ttl)
 
+           # with pipelined publishing, refusals of earlier messages show up later.
+           if self.publisher.failed :
+              self.post_failed()
+
         self.set_hdrstr()
 
         if ok :
@@ -715,6 +645,26 @@ class sr_message():
 
         return ok
 
+    def post_failed(self):
+        """
+           re-publish messages that the broker refused, or that were lost with the connection
+           before being confirmed or committed (only possible with post_confirm_window or post_tx_batch.)
+        """
+        for exchange, topic, body, headers, ttl in self.publisher.get_failed() :
+            self.logger.warning("re-publishing unconfirmed message exchange %s topic %s" % (exchange,topic) )
+            self.publisher.publish(exchange, topic, body, headers, ttl)
+
+    def post_flush(self, force=False):
+        """
+           complete pending publishes (confirms or tx batch), force waits for all of them.
+        """
+        if self.publisher == None : return
+
+        self.publisher.flush(force)
+        if self.publisher.failed :
+           self.post_failed()
+           if force : self.publisher.flush(force)
+
     def set_exchange(self,name):
         self.exchange = name
 
@@ -1104,14 +1054,7 @@ class sr_message():
                  self.sumalgo = self.parent.sumalgo
 
                  self.sumalgo.set_path(filepath)
-                 fp = open(filepath,'rb')
-                 i  = 0
-                 while i<fsiz :
-                       buf = fp.read(self.bufsize)
-                       if not buf : break
-                       self.sumalgo.update(buf)
-                       i  += len(buf)
-                 fp.close()
+                 i = sum_file(self.sumalgo, filepath, 0, fsiz, self.bufsize) if fsiz > 0 else 0
 
                  if i != fsiz :
                     self.logger.warning("sr_message verify_part_suffix incomplete reading %d %d" % (i,fsiz))
@@ -83,6 +83,7 @@ try:
     from sr_ftp import *
     from sr_http import *
     from sr_message import *
+    from sr_poll_state import *
     from sr_post import *
     from sr_util import *
 except:
@@ -91,6 +92,7 @@ except:
     from sarra.sr_ftp import *
     from sarra.sr_http import *
     from sarra.sr_message import *
+    from sarra.sr_poll_state import *
     from sarra.sr_post import *
     from sarra.sr_util import *
 
@@ -144,21 +146,23 @@ class sr_poll(sr_post):
             self.pulls[maskDir].append(mask)
 
 
-    # find differences between current ls and last ls
+    def close(self):
+        sr_post.close(self)
+
+        if self.ls_state:
+            self.ls_state.close()
+            self.ls_state = None
+
+    # find differences between current ls and last ls (fingerprints of the lines)
     # only the newer or modified files will be kept...
 
 
-    def differ_ls_file(self, ls, lspath):
+    def differ_ls_file(self, ls, fps, old_fps):
 
         # get new list and description
 
         new_lst = sorted(ls.keys())
 
-        # get old list and description
-
-        old_ls = self.load_ls_file(lspath)
-
-        file_within_date_limit = True
         # compare
 
         filelst = []
@@ -166,6 +170,12 @@ class sr_poll(sr_post):
 
         for f in new_lst:
             # self.logger.debug("checking %s (%s)" % (f,ls[f]))
+
+            # unchanged entry (before parsing its date)
+            if f in old_fps and fps[f] == old_fps[f]:
+                continue
+
+            file_within_date_limit = True
             try:
                 line_split = ls[f].split()
                 date = line_split[5] + " " + line_split[6]
@@ -177,24 +187,11 @@ class sr_poll(sr_post):
                 pass
             if file_within_date_limit:
                 self.logger.debug("File should be processed")
-                # execute rest of code
-                # keep a newer entry
-                if not f in old_ls:
-                    # self.logger.debug("IS NEW %s" % f)
-                    filelst.append(f)
-                    desclst[f] = ls[f]
-                    continue
-
-                # keep a modified entry
-                if ls[f] != old_ls[f]:
-                    # self.logger.debug("IS DIFFERENT %s from (%s,%s)" % (f,old_ls[f],ls[f]))
-                    filelst.append(f)
-                    desclst[f] = ls[f]
-                    continue
+                # keep a newer or modified entry
+                filelst.append(f)
+                desclst[f] = ls[f]
             else:
                 self.logger.debug("File should be skipped")
-                # ignore rest of code and re iterate
-            # self.logger.debug("IS IDENTICAL %s" % f)
 
         return filelst, desclst
 
@@ -377,8 +374,10 @@ class sr_poll(sr_post):
 
         self.accept_unmatch = False
 
-    def poll_directory(self, pdir, lspath):
-        self.logger.debug("poll_directory %s %s" % (pdir, lspath))
+        self.ls_state = None
+
+    def poll_directory(self, pdir, lskey):
+        self.logger.debug("poll_directory %s %s" % (pdir, lskey))
         npost = 0
 
         # cd to that directory
@@ -392,12 +391,17 @@ class sr_poll(sr_post):
         ok, file_dict, dir_dict = self.lsdir()
         if not ok: return npost
 
+        # fingerprints of the lines, now and from the last poll
+
+        fps = dict((f, self.ls_state.fingerprint(file_dict[f])) for f in file_dict)
+        old_fps = self.ls_state.load(lskey)
+
         # when not sleeping
 
         if not self.sleeping:
             # get file list from difference in ls
 
-            filelst, desclst = self.differ_ls_file(file_dict, lspath)
+            filelst, desclst = self.differ_ls_file(file_dict, fps, old_fps)
             self.logger.debug("poll_directory: after differ, len=%d" % len(filelst))
 
             # post poll list
@@ -405,9 +409,9 @@ class sr_poll(sr_post):
             n = self.poll_list_post(pdir, desclst, filelst)
             npost += n
 
-        # sleeping or not, write the directory file content
+        # sleeping or not, keep the directory state (the entries changed)
 
-        ok = self.write_ls_file(file_dict, lspath)
+        self.ls_state.update(lskey, old_fps, fps)
 
         # poll in children directory
 
@@ -415,10 +419,10 @@ class sr_poll(sr_post):
         for d in sdir:
             if d == '.' or d == '..': continue
 
-            d_lspath = lspath + '_' + d
+            d_lskey = lskey + '_' + d
             d_pdir = pdir + os.sep + d
 
-            n = self.poll_directory(d_pdir, d_lspath)
+            n = self.poll_directory(d_pdir, d_lskey)
             npost += n
 
         return npost
@@ -560,6 +564,11 @@ class sr_poll(sr_post):
             return True
 
         if hasattr(self.dest, 'file_index'): self.dest_file_index = self.dest.file_index
+
+        # ls files of previous versions, into the poll state (once)
+
+        self.ls_state.migrate(self.user_cache_dir, self.load_ls_file)
+
         # loop on all directories where there are pulls to do
 
         for destDir in self.pulls:
@@ -572,13 +581,17 @@ class sr_poll(sr_post):
             path = path.replace('${', '')
             path = path.replace('}', '')
             path = path.replace('/', '_')
-            lsPath = self.user_cache_dir + os.sep + 'ls' + path
+            lsKey = 'ls' + path
 
             currentDir = self.set_dir_pattern(destDir)
 
             if currentDir == '': currentDir = destDir
 
-            npost += self.poll_directory(currentDir, lsPath)
+            npost += self.poll_directory(currentDir, lsKey)
+
+        # the listings are kept as polled, before sleeping
+
+        self.ls_state.commit(force=True)
 
         # close connection
 
@@ -589,32 +602,6 @@ class sr_poll(sr_post):
 
         return npost > 0
 
-    # write ls file
-
-    def write_ls_file(self, ls, lspath):
-
-        if len(ls) == 0:
-            try:
-                os.unlink(lspath)
-            except:
-                pass
-            return True
-
-        filelst = sorted(ls.keys())
-
-        try:
-            fp = open(lspath, 'w')
-            for f in filelst:
-                fp.write(ls[f] + '\n')
-            fp.close()
-
-            return True
-
-        except:
-            self.logger.error("Unable to write ls to file %s" % lspath)
-
-        return False
-
     def run(self):
         self.logger.debug("sr_poll run")
 
@@ -634,6 +621,15 @@ class sr_poll(sr_post):
                 self.on_heartbeat_list.append(self.on_heartbeat)
                 self.heartbeat_cache_installed = True
 
+        # listings of the directories polled
+
+        if not self.ls_state:
+            self.ls_state = sr_poll_state(self)
+            self.ls_state.open()
+            if self.reset:
+                self.ls_state.migrate(self.user_cache_dir, self.load_ls_file)
+                self.ls_state.reset()
+
         # do pulls instructions
 
         if self.vip: last = self.has_vip()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+#
+# This file is part of sarracenia.
+# The sarracenia suite is Free and is proudly provided by the Government of Canada
+# Copyright (C) Her Majesty The Queen in Right of Canada, Environment Canada, 2008-2015
+#
+# Questions or bugs report: dps-client@ec.gc.ca
+# Sarracenia repository: https://github.com/MetPX/sarracenia
+# Documentation: https://github.com/MetPX/sarracenia
+#
+# sr_poll_state.py : the listings of the remote directories, as last polled by sr_poll,
+#                    to find the files new or modified at the next poll.
+#
+########################################################################
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; version 2 of the License.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307  USA
+#
+#
+
+import hashlib
+import os
+import sqlite3
+
+from sarra.sr_util import wallflt
+
+#============================================================
+# sr_poll_state supports/uses :
+#
+# state_file : default ~/.cache/sarra/poll/'cfg'/poll_state_001.sqlite
+#              one indexed sqlite table : (directory key, file name) -> fingerprint
+#              of the ls line of the file (64 bits of blake2b)
+#
+# the directory key is the name of the ls file sr_poll wrote before
+# ( 'ls' + directory, '/' replaced by '_', + '_' + subdirectory ... )
+#
+# load   : the fingerprints of the entries of a directory
+# update : writes only the entries new or changed, deletes the entries gone
+# migrate: the ls files of the cache directory are loaded once, and removed
+#
+# the table is committed at most every second while polling, at the end of each poll,
+# and on close : a crash reposts, at next start, what was polled during the last second.
+#============================================================
+
+class sr_poll_state():
+
+    def __init__(self, parent):
+        self.parent      = parent
+        self.logger      = parent.logger
+        self.db          = None
+        self.state_file  = None
+        self.migrated    = False
+        self.last_commit = wallflt()
+
+    def close(self):
+        self.logger.debug("sr_poll_state close")
+        if not self.db : return
+
+        try:
+            self.db.commit()
+            self.db.close()
+        except Exception as err:
+            self.logger.warning('did not close: state_file={}, err={}'.format(self.state_file, err))
+            self.logger.debug('Exception details:', exc_info=True)
+        self.db = None
+
+    def commit(self, force=False):
+        now = wallflt()
+        if not force and now - self.last_commit < 1.0 : return
+        self.last_commit = now
+        self.db.commit()
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM ls").fetchone()[0]
+
+    def fingerprint(self, line):
+        return int.from_bytes(hashlib.blake2b(line.encode('utf-8','surrogateescape'), digest_size=8).digest(),
+                              'big', signed=True)
+
+    def load(self, key):
+        return dict(self.db.execute("SELECT name, fp FROM ls WHERE dir = ?", (key,)))
+
+    # migrate : load the ls files (ls_dir/ls*) with load(path) -> { name : line }, then remove them
+
+    def migrate(self, ls_dir, load):
+        if self.migrated : return
+        self.migrated = True
+
+        try   : names = [ f for f in os.listdir(ls_dir) if f.startswith('ls') ]
+        except OSError : return
+
+        for key in names :
+            path = ls_dir + os.sep + key
+            if not os.path.isfile(path) : continue
+            ls   = load(path)
+            self.db.execute("DELETE FROM ls WHERE dir = ?", (key,))
+            self.db.executemany("INSERT INTO ls (dir, name, fp) VALUES (?,?,?)",
+                                [ ( key, name, self.fingerprint(line) ) for name, line in ls.items() ])
+            self.db.commit()
+            os.unlink(path)
+            self.logger.info("sr_poll_state migrated %s (%d entries)" % ( path, len(ls) ))
+
+    def open(self, state_file=None):
+        self.state_file = state_file
+
+        if state_file is None :
+           self.state_file  = self.parent.user_cache_dir + os.sep
+           self.state_file += 'poll_state_%.3d.sqlite' % self.parent.instance
+
+        self.logger.debug("sr_poll_state open %s" % self.state_file)
+
+        self.db = sqlite3.connect(self.state_file)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS ls ( dir TEXT, name TEXT, fp INTEGER, "
+                        "PRIMARY KEY (dir, name) ) WITHOUT ROWID")
+
+    # reset : forget everything, all files will be posted again
+
+    def reset(self):
+        self.db.execute("DELETE FROM ls")
+        self.db.commit()
+
+    # update : the directory key now lists fps { name : fingerprint }, it listed old
+
+    def update(self, key, old, fps):
+        changed = [ ( key, name, fp ) for name, fp in fps.items() if old.get(name) != fp ]
+        gone    = [ ( key, name ) for name in old if not name in fps ]
+
+        if changed : self.db.executemany("INSERT OR REPLACE INTO ls (dir, name, fp) VALUES (?,?,?)", changed)
+        if gone    : self.db.executemany("DELETE FROM ls WHERE dir = ? AND name = ?", gone)
+        if changed or gone : self.commit()
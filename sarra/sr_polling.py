@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+#
+# This file is part of sarracenia.
+# The sarracenia suite is Free and is proudly provided by the Government of Canada
+# Copyright (C) Her Majesty The Queen in Right of Canada, Environment Canada, 2008-2015
+#
+# Questions or bugs report: dps-client@ec.gc.ca
+# Sarracenia repository: https://github.com/MetPX/sarracenia
+# Documentation: https://github.com/MetPX/sarracenia
+#
+# sr_polling.py : the observer of sr_watch when force_polling is set,
+#                 polling the trees watched for changes, directory by directory.
+#
+########################################################################
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; version 2 of the License.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307  USA
+#
+#
+
+import os
+import stat
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+#============================================================
+# sr_polling supports/uses :
+#
+# the same calls as the watchdog observers : schedule, unschedule, start, stop
+# (the events go to parent.on_add, the handler given to schedule is not used)
+#
+# dirs : the snapshot, for each directory of the trees watched :
+#        its mtime (ns) when last listed, and its entries :
+#        name -> ( is_dir, st_dev, st_ino, st_mtime_ns, st_size )
+#
+# at every poll (every parent.sleep seconds) :
+#
+#   hot files   : files modified less than POLL_HOT seconds ago are stat'ed again (modify)
+#   directories : all are stat'ed, and only those whose mtime changed are listed.
+#                 of their entries, only those new (name or inode, from the listing)
+#                 are stat'ed : creates, deletes, and moves (same inode).
+#   rescan      : every polling_rescan seconds (by default 0 : at every poll, as watchdog's
+#                 PollingObserver), all the directories are listed and all the files stat'ed
+#                 again, for the files, not recently modified, rewritten in place.
+#
+# stats are done in parent.walk_threads threads (one directory per thread).
+#
+# a directory with an mtime less than POLL_RACY seconds old is listed again at next poll
+# (file systems with coarse timestamps do not show a second change in the same tick).
+#============================================================
+
+POLL_HOT  = 60
+POLL_RACY = 2
+
+class sr_polling():
+
+    def __init__(self, parent):
+        self.parent     = parent
+        self.logger     = parent.logger
+        self.interval   = max(parent.sleep, 0.1)
+        self.rescan     = parent.polling_rescan
+        self.threads    = parent.walk_threads
+
+        self.dirs       = {}
+        self.hot        = set()
+        self.roots      = []
+        self.lock       = threading.Lock()
+        self.stopped    = threading.Event()
+        self.thread     = None
+        self.pool       = None
+        self.last_full  = time.time()
+
+        if self.threads > 1 :
+           self.pool = ThreadPoolExecutor(self.threads)
+
+    def emit(self, event, src, dst=None):
+        self.parent.on_add(event, src, dst)
+
+    def map(self, f, lst):
+        if self.pool : return list(self.pool.map(f, lst))
+        return list(map(f, lst))
+
+    # recorded : mtime of a directory to keep (-1 when too recent to be trusted)
+
+    def recorded(self, mtime_ns, now):
+        if mtime_ns > (now - POLL_RACY) * 1e9 : return -1
+        return mtime_ns
+
+    # scan : (directory mtime, entries) of path, or None when not a directory anymore.
+    #        old entries are kept as they were when their inode is unchanged (unless full)
+
+    def scan(self, args):
+        path, old, full = args
+        try:
+            mtime   = os.stat(path).st_mtime_ns
+            entries = {}
+            with os.scandir(path) as it :
+                 for e in it :
+                     o = old.get(e.name)
+                     if not full and o and o[2] == e.inode() :
+                        entries[e.name] = o
+                        continue
+                     try:
+                         s = e.stat(follow_symlinks=False)
+                     except OSError :
+                         continue
+                     entries[e.name] = ( stat.S_ISDIR(s.st_mode), s.st_dev, s.st_ino, s.st_mtime_ns, s.st_size )
+            return mtime, entries
+        except OSError :
+            return None
+
+    def mtime(self, path):
+        try   : return os.stat(path).st_mtime_ns
+        except OSError : return None
+
+    def lstat(self, path):
+        try   : return os.lstat(path)
+        except OSError : return None
+
+    # add_tree : list path and all the directories under it, emitting creates when asked
+
+    def add_tree(self, path, emit):
+        now   = time.time()
+        level = [ path ]
+        while level :
+            below = []
+            for d, res in zip(level, self.map(self.scan, [ ( d, {}, True ) for d in level ])) :
+                if res is None : continue
+                mtime, entries  = res
+                self.dirs[d]    = ( self.recorded(mtime, now), entries )
+                for name, e in entries.items() :
+                    p = d + '/' + name
+                    if emit : self.emit('create', p)
+                    if e[0] : below.append(p)
+                    elif e[3] > (now - POLL_HOT) * 1e9 : self.hot.add(p)
+            level = below
+
+    # remove_tree : forget path (a directory) and all under it, emitting deletes when asked
+
+    def remove_tree(self, path, emit):
+        under = [ d for d in self.dirs if d == path or d.startswith(path + '/') ]
+        for d in sorted(under, reverse=True) :
+            mtime, entries = self.dirs.pop(d)
+            for name, e in entries.items() :
+                self.hot.discard(d + '/' + name)
+                if emit and not e[0] : self.emit('delete', d + '/' + name)
+            if emit : self.emit('delete', d)
+
+    # take_tree : forget path (a directory) and all under it, to put_tree them elsewhere
+
+    def take_tree(self, path):
+        dirs = {}
+        for d in [ d for d in self.dirs if d == path or d.startswith(path + '/') ] :
+            dirs[d[len(path):]] = self.dirs.pop(d)
+        hot  = [ p for p in self.hot if p.startswith(path + '/') ]
+        for p in hot : self.hot.discard(p)
+        return dirs, [ p[len(path):] for p in hot ]
+
+    # put_tree : a tree from take_tree is now dst
+
+    def put_tree(self, dst, tree):
+        dirs, hot = tree
+        for d, listing in dirs.items() : self.dirs[dst + d] = listing
+        for p in hot : self.hot.add(dst + p)
+
+    # poll : stat the hot files and all the directories, list the changed ones, emit the events
+
+    def poll(self):
+        with self.lock :
+             now  = time.time()
+             full = now - self.last_full >= self.rescan
+             if full : self.last_full = now
+
+             self.poll_hot(now)
+
+             paths   = list(self.dirs)
+             changed = [ p for p, m in zip(paths, self.map(self.mtime, paths)) \
+                         if m is not None and ( full or m != self.dirs[p][0] ) ]
+
+             created  = {}
+             deleted  = {}
+             previous = {}
+             scans    = self.map(self.scan, [ ( p, self.dirs[p][1], full ) for p in changed ])
+
+             for p, res in zip(changed, scans) :
+                 if res is None : continue
+                 mtime, entries = res
+                 old            = self.dirs[p][1]
+                 previous[p]    = self.dirs[p]
+                 self.dirs[p]   = ( self.recorded(mtime, now), entries )
+
+                 for name, e in entries.items() :
+                     o    = old.get(name)
+                     path = p + '/' + name
+                     if o is None or o[0:3] != e[0:3] :
+                        if o : deleted[path] = o
+                        created[path] = e
+                     elif o[3:] != e[3:] and not e[0] :
+                        self.emit('modify', path)
+                        if e[3] > (now - POLL_HOT) * 1e9 : self.hot.add(path)
+
+                 for name, o in old.items() :
+                     if not name in entries : deleted[p + '/' + name] = o
+
+             # directories replaced (by a file or another directory) : the old tree goes
+             # and the new one comes as a whole, what changed under them is not looked at
+
+             replaced = []
+             for path in sorted(created) :
+                 if not path in deleted or not deleted[path][0] : continue
+                 if any( path.startswith(r + '/') for r in replaced ) : continue
+                 replaced.append(path)
+
+             for r in replaced :
+                 under = r + '/'
+                 for path in [ path for path in created if path.startswith(under) ] : del created[path]
+                 for path in [ path for path in deleted if path.startswith(under) ] : del deleted[path]
+                 for d, listing in previous.items() :
+                     if d == r or d.startswith(under) : self.dirs[d] = listing
+
+             # moves : an inode deleted here, created there
+
+             inodes = {}
+             for path, o in deleted.items() : inodes[ ( o[1], o[2] ) ] = path
+
+             moved = {}
+             for path, e in created.items() :
+                 src = inodes.pop( ( e[1], e[2] ), None )
+                 if src : moved[path] = src
+             sources = set(moved.values())
+
+             # deletes (a file replaced by another file or directory is only created)
+
+             for path, o in deleted.items() :
+                 if path in created or path in sources : continue
+                 if o[0] : self.remove_tree(path, True)
+                 else    :
+                    self.hot.discard(path)
+                    self.emit('delete', path)
+
+             # the trees moved are taken before the replaced ones go, in case one was moved away
+
+             trees = {}
+             for dst, src in moved.items() :
+                 if created[dst][0] : trees[dst] = self.take_tree(src)
+                 else :
+                    self.hot.discard(src)
+                    if created[dst][3] > (now - POLL_HOT) * 1e9 : self.hot.add(dst)
+
+             # a replaced tree is deleted, unless something was moved over it
+
+             for path in replaced :
+                 self.remove_tree(path, not path in moved)
+
+             for dst, src in moved.items() :
+                 if dst in trees : self.put_tree(dst, trees[dst])
+                 self.emit('move', src, dst)
+
+             for path, e in created.items() :
+                 if path in moved : continue
+                 self.emit('create', path)
+                 if e[0] : self.add_tree(path, True)
+                 elif e[3] > (now - POLL_HOT) * 1e9 : self.hot.add(path)
+
+    # poll_hot : stat again the files recently modified
+
+    def poll_hot(self, now):
+        hot = list(self.hot)
+        for path, s in zip(hot, self.map(self.lstat, hot)) :
+            d, name = path.rsplit('/', 1)
+            entries = self.dirs[d][1] if d in self.dirs else {}
+            o       = entries.get(name)
+            if s is None or o is None or s.st_ino != o[2] :
+               self.hot.discard(path)
+               continue
+            if ( s.st_mtime_ns, s.st_size ) != o[3:] :
+               entries[name] = ( o[0], o[1], o[2], s.st_mtime_ns, s.st_size )
+               self.emit('modify', path)
+            if s.st_mtime_ns <= (now - POLL_HOT) * 1e9 :
+               self.hot.discard(path)
+
+    def run(self):
+        while not self.stopped.wait(self.interval) :
+            try:
+                self.poll()
+            except Exception as err:
+                if self.stopped.is_set() : break
+                self.logger.error("sr_polling poll failed: {}".format(err))
+                self.logger.debug("Exception details:", exc_info=True)
+
+    def schedule(self, handler, path, recursive=True):
+        with self.lock :
+             self.add_tree(path, False)
+             self.roots.append(path)
+        self.logger.debug("sr_polling %s: %d directories" % ( path, len(self.dirs) ))
+        return path
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.pool : self.pool.shutdown(wait=False)
+
+    def unschedule(self, path):
+        with self.lock :
+             if not path in self.roots : raise KeyError(path)
+             self.roots.remove(path)
+             self.remove_tree(path, False)
@@ -39,6 +39,8 @@
 
 import json,os,random,sys,time
 
+from concurrent.futures import ThreadPoolExecutor
+
 from sys import platform as _platform
 
 from base64 import b64decode, b64encode
@@ -49,7 +51,6 @@ from random import choice
 from collections import *
 
 from watchdog.observers         import Observer
-from watchdog.observers.polling import PollingObserver
 from watchdog.events            import PatternMatchingEventHandler
 
 try :    
@@ -58,6 +59,9 @@ try :
          from sr_instances       import *
          from sr_message         import *
          from sr_rabbit          import *
+         from sr_events          import *
+         from sr_polling         import *
+         from sr_snapshot        import *
          from sr_util            import *
          from sr_xattr import *
 except : 
@@ -67,6 +71,9 @@ except :
          from sarra.sr_instances import *
          from sarra.sr_message   import *
          from sarra.sr_rabbit    import *
+         from sarra.sr_events    import *
+         from sarra.sr_polling   import *
+         from sarra.sr_snapshot  import *
          from sarra.sr_util      import *
 
 #============================================================
@@ -144,6 +151,7 @@ class sr_post(sr_instances):
            if not plugin(self): break
 
         if self.post_hc :
+           if hasattr(self,'msg') and self.msg : self.msg.post_flush(force=True)
            self.post_hc.close()
            self.post_hc = None
 
@@ -151,6 +159,10 @@ class sr_post(sr_instances):
            self.cache.save()
            self.cache.close()
 
+        if hasattr(self,'snapshot') and self.snapshot :
+           self.snapshot.close()
+           self.snapshot = None
+
         if self.sleep > 0 and len(self.obs_watched):
            for ow in self.obs_watched:
                try:
@@ -196,6 +208,8 @@ class sr_post(sr_instances):
            return
 
         self.publisher = Publisher(self.post_hc)
+        self.publisher.set_confirm_window(self.post_confirm_window)
+        self.publisher.set_tx_batch(self.post_tx_batch, self.post_tx_interval)
         self.publisher.build()
 
         self.logger.info("Output AMQP broker(%s) user(%s) vhost(%s)" % \
@@ -266,7 +280,7 @@ class sr_post(sr_instances):
 
     def on_add(self, event, src, dst):
         #self.logger.debug("%s %s %s" % ( event, src, dst ) )
-        self.new_events['%s %s'%(src,dst)] = ( event, src, dst )
+        self.event_queue.add( event, src, dst )
 
     # =============
     # on_created (for SimpleEventHandler)
@@ -343,14 +357,15 @@ class sr_post(sr_instances):
         self.logger.debug("%s overwrite_defaults" % self.program_name)
 
         self.post_hc       = None
+        self.snapshot      = None
 
         self.obs_watched   = []
         self.watch_handler = None
         self.post_topic_prefix = "v02.post"
 
         self.inl           = OrderedDict()
-        self.new_events    = OrderedDict()
-        self.left_events   = OrderedDict()
+        self.event_queue   = None
+        self.watch_roots   = []
 
         self.blocksize     = 200 * 1024 * 1024
 
@@ -486,6 +501,8 @@ class sr_post(sr_instances):
 
         ok = self.__on_post__()
 
+        if ok and self.snapshot : self.snapshot.delete(path)
+
         return ok
 
     # =============
@@ -517,7 +534,9 @@ class sr_post(sr_instances):
         # if we should send the file in parts
 
         if blksz > 0 and blksz < fsiz :
-           return self.post_file_in_parts(path,lstat)
+           ok = self.post_file_in_parts(path,lstat)
+           if ok and self.snapshot : self.snapshot.record(path, lstat, None)
+           return ok
 
         # post_init (message)
         self.post_init(path,lstat)
@@ -572,6 +591,8 @@ class sr_post(sr_instances):
 
         ok = self.__on_post__()
 
+        if ok and self.snapshot : self.snapshot.record(path, lstat, sumstr)
+
         return ok
 
     def compute_sumstr(self, path, fsiz):
@@ -602,7 +623,7 @@ class sr_post(sr_instances):
         if sumflg[:2] == 'z,' and len(sumflg) > 2:
             sumstr = sumflg
         else:
-            if not sumflg[0] in ['0', 'd', 'n', 's', 'z']: sumflg = 'd'
+            if sumflg[0] != 'z' and not sumflg in self.sumalgos: sumflg = 'd'
 
             self.set_sumalgo(sumflg)
             sumalgo = self.sumalgo
@@ -610,16 +631,8 @@ class sr_post(sr_instances):
 
             # compute checksum
 
-            if sumflg in ['d','s'] :
-
-                fp = open(path,'rb')
-                i  = 0
-                while i<fsiz :
-                    buf = fp.read(self.bufsize)
-                    if not buf: break
-                    sumalgo.update(buf)
-                    i  += len(buf)
-                fp.close()
+            if sumalgo.reads_data() :
+                sum_file(sumalgo, path, 0, fsiz, self.bufsize)
 
             # setting sumstr
             checksum = sumalgo.get_value()
@@ -673,7 +686,7 @@ class sr_post(sr_instances):
 
               else:
                  sumflg = self.sumflg
-                 if not self.sumflg[0] in ['0','d','n','s','z' ]: sumflg = 'd'
+                 if sumflg[0] != 'z' and not sumflg in self.sumalgos: sumflg = 'd'
                  self.set_sumalgo(sumflg)
                  sumalgo = self.sumalgo
                  sumalgo.set_path(path)
@@ -697,18 +710,7 @@ class sr_post(sr_instances):
               # compute checksum if needed
 
               if not self.sumflg in ['0','n','z'] :
-                 bufsize = self.bufsize
-                 if length < bufsize : bufsize = length
-
-                 fp = open(path,'rb')
-                 if offset != 0 : fp.seek(offset,0)
-                 t  = 0
-                 while t<length :
-                       buf = fp.read(bufsize)
-                       if not buf: break
-                       sumalgo.update(buf)
-                       t  += len(buf)
-                 fp.close()
+                 sum_file(sumalgo, path, offset, length, self.bufsize)
 
                  checksum = sumalgo.get_value()
                  sumstr   = '%s,%s' % (sumflg,checksum)
@@ -929,7 +931,7 @@ class sr_post(sr_instances):
     # post1file
     # =============
 
-    def post1file(self,path,lstat):
+    def post1file(self,path,lstat,entry=None):
 
         done = True
 
@@ -941,9 +943,12 @@ class sr_post(sr_instances):
         if os.sep != '/' :  # windows
             path = path.replace( os.sep, '/' )
 
-        # path is a link
+        # path is a link (a DirEntry from the walk knows)
+
+        if entry : is_link = entry.is_symlink()
+        else     : is_link = os.path.islink(path)
 
-        if os.path.islink(path):
+        if is_link:
            ok = self.post_link(path)
 
            if self.follow_symlinks :
@@ -970,7 +975,10 @@ class sr_post(sr_instances):
 
         # path is a file
 
-        if os.path.isfile(path):
+        if entry : is_file = entry.is_file()
+        else     : is_file = os.path.isfile(path)
+
+        if is_file:
            ok = self.post_file(path,lstat)
            return done
 
@@ -1081,43 +1089,51 @@ class sr_post(sr_instances):
     def wakeup(self):
         #self.logger.debug("wakeup")
 
-        # FIXME: Tiny potential for events to be dropped during copy.
-        #     these lists might need to be replaced with watchdog event queues.
-        #     left for later work. PS-20170105
-        #     more details: https://github.com/gorakhargosh/watchdog/issues/392
-
         # on_watch 
 
         ok = self.__on_watch__()
         if not ok:
-            return
+            return 0
 
-        # pile up left events to process
+        # events queued (one per path) and settled : events caught while
+        # processing stay queued (merged in theirs when already there) for the next wakeup
 
-        self.left_events.update(self.new_events)
-        self.new_events = OrderedDict()
+        ndone = 0
 
-        # work with a copy events and keep done events (to delete them)
-
-        self.cur_events  = OrderedDict()
-        self.cur_events.update(self.left_events)
-
-        # loop on all events
-
-        for key in self.cur_events:
-            event, src, dst = self.cur_events[key]
+        for path, event, src, dst, seq in self.event_queue.ready():
             done = False
             try:
                 done = self.process_event(event, src, dst)
             except OSError as err:
                 self.logger.error("could not process event({}): {}".format(event, err))
                 self.logger.debug("Exception details:", exc_info=True)
-                self.left_events.pop(key)
+                done = True
             if done:
-                self.left_events.pop(key)
+                self.event_queue.remove(path, seq)
+                ndone += 1
+
+        # queue was full, events were dropped : walk the watched trees again to catch up
+
+        if self.event_queue.take_overflow():
+           self.logger.warning("sr_watch event queue full (event_queue_max=%d) %s. walking again: %s" % \
+                  ( self.event_queue.maxlen, self.event_queue.stats(), self.watch_roots ) )
+           for d in self.watch_roots :
+               self.walk(d)
+
+        # complete pipelined publishes
+        self.msg.post_flush()
+
+        # what was posted is in the snapshot before sleeping (no sleep while the queue is full)
+        if self.snapshot and not ( ndone and self.event_queue.full() ) :
+           self.snapshot.commit(force=True)
 
-        # heartbeat
+        # heartbeat (with the events counters)
+        last_heartbeat = self.last_heartbeat
         self.heartbeat_check()
+        if self.last_heartbeat != last_heartbeat :
+           self.logger.info("sr_watch %s, posted %d" % ( self.event_queue.stats(), self.publish_count ) )
+
+        return ndone
 
 
 
@@ -1135,18 +1151,79 @@ class sr_post(sr_instances):
            if sys.platform == 'win32':
                src = src.replace('\\','/')
 
-        # walk src directory, this walk is depth first... there could be a lot of time
-        # between *listdir* run, and when a file is visited, if there are subdirectories before you get there.
-        # hence the existence check after listdir (crashed in flow_tests of > 20,000)
-        for x in os.listdir(src):
-            path = src + '/' + x
-            if os.path.isdir(path):
-               self.walk(path)
+        # walk src directory, depth first, posting here, in order.  With walk_threads > 1,
+        # the next subdirectories are read by threads while a directory is posted.
+
+        pool = None
+        if self.walk_threads > 1 : pool = ThreadPoolExecutor(self.walk_threads)
+
+        try     : self.walk_dir(src, self.walk_scan(src), pool)
+        finally :
+                  if pool : pool.shutdown()
+                  if self.snapshot : self.snapshot.commit(force=True)
+
+    # walk_dir : post the entries of a directory, and walk its subdirectories in turn,
+    #            reading up to walk_threads of them ahead.
+    def walk_dir(self, src, entries, pool ):
+
+        subdirs = deque()
+        for entry, is_dir, lstat in entries :
+            if not is_dir : continue
+            path = entry.path
+            if entry.is_symlink() and self.realpath_post :
+               path = os.path.realpath(path)
+               if sys.platform == 'win32':
+                   path = path.replace('\\','/')
+            subdirs.append(path)
+
+        ahead   = deque()
+
+        for entry, is_dir, lstat in entries :
+
+            if pool :
+               while subdirs and len(ahead) < self.walk_threads :
+                     path = subdirs.popleft()
+                     ahead.append( (path, pool.submit(self.walk_scan, path)) )
+
+            if is_dir:
+               if pool :
+                  path, scanned = ahead.popleft()
+                  listing = scanned.result()
+               else :
+                  path    = subdirs.popleft()
+                  listing = self.walk_scan(path)
+               self.walk_dir(path, listing, pool)
                continue
 
-            # add path created
-            if os.path.exists(path):
-                self.post1file(path,os.stat(path))
+            # with post_snapshot, files posted by a previous run and unchanged since are skipped
+
+            if self.snapshot and not entry.is_symlink() and not self.snapshot.changed(entry.path, lstat) :
+               continue
+
+            # there could be a lot of time between the reading of the directory, and
+            # when a file is posted (crashed in flow_tests of > 20,000) : skip the vanished ones
+
+            try :
+                    self.post1file(entry.path, lstat, entry)
+            except FileNotFoundError :
+                    self.logger.debug("walk %s vanished" % entry.path)
+
+    # walk_scan : list a directory : ( DirEntry, is a directory, stat of the others ).
+    #             the entries types are known from the directory itself (no syscall,
+    #             except for links), and each file is stat'ed once.
+    def walk_scan(self, src ):
+        entries = []
+
+        with os.scandir(src) as it:
+             for entry in it :
+                 try :
+                         if entry.is_dir() : entries.append( (entry, True, None) )
+                         else              : entries.append( (entry, False, entry.stat()) )
+                 except OSError :
+                         # vanished, or a broken link
+                         pass
+
+        return entries
 
     # =============
     # original walk_priming
@@ -1212,12 +1289,13 @@ class sr_post(sr_instances):
 
         if self.force_polling :
            self.logger.info("sr_watch polling observer overriding default (slower but more reliable.)")
-           self.observer = PollingObserver()
+           self.observer = sr_polling(self)
         else:
            self.logger.info("sr_watch optimal observer for platform selected (best when it works).")
            self.observer = Observer()
 
         self.obs_watched = []
+        self.watch_roots.append(sld)
 
         self.watch_handler  = SimpleEventHandler(self)
         self.walk_priming(sld)
@@ -1239,9 +1317,15 @@ class sr_post(sr_instances):
 
         last_time = nowflt()
         while True:
-            self.wakeup()
+            ndone = self.wakeup()
             now = nowflt()
             elapse = now - last_time
+
+            # queue full and being worked on : no sleep
+            if ndone and self.event_queue.full():
+                last_time = now
+                continue
+
             if elapse < self.sleep:
                 stime=self.sleep-elapse
                 if stime > 60:  # if sleeping for a long time, debug output is good...
@@ -1385,8 +1469,8 @@ class sr_post(sr_instances):
     def run(self):
         self.logger.info("%s run partflg=%s, sum=%s, caching=%s basis=%s" % \
               ( self.program_name, self.partflg, self.sumflg, self.caching, self.cache_basis ))
-        self.logger.info("%s realpath_post=%s follow_links=%s force_polling=%s"  % \
-              ( self.program_name, self.realpath_post, self.follow_symlinks, self.force_polling ) )
+        self.logger.info("%s realpath_post=%s follow_links=%s force_polling=%s polling_rescan=%s"  % \
+              ( self.program_name, self.realpath_post, self.follow_symlinks, self.force_polling, self.polling_rescan ) )
 
         self.connect()
 
@@ -1402,6 +1486,18 @@ class sr_post(sr_instances):
               self.on_heartbeat_list.append(self.on_heartbeat)
               self.heartbeat_cache_installed = True
 
+        # snapshot of the files posted, for incremental walks
+        if self.post_snapshot and not self.snapshot :
+           self.snapshot = sr_snapshot(self)
+           self.snapshot.open()
+           if self.reset :
+              self.snapshot.reset()
+
+        # events caught by the observers, waiting to be posted
+
+        self.event_queue = sr_events(self, self.event_settle, self.event_queue_max)
+        self.watch_roots = []
+
         pbd = self.post_base_dir
 
         for plugin in self.on_start_list:
@@ -29,8 +29,7 @@
 #  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307  USA
 #
 
-import os,json,sys,time
-from _codecs import decode, encode
+import os,json,sqlite3,sys,time,urllib.parse
 
 try :
          from sr_config          import *
@@ -40,9 +39,25 @@ except :
          from sarra.sr_util      import *
 
 # class sr_retry
+#
+# retry_store : selects the implementation, sr_retry(parent) returns an instance of
+#               the class registered in retry_stores for parent.retry_store
+#               (or for the store argument, when given).
+#               files  : json lines files reshuffled at each heartbeat (default)
+#               sqlite : sr_retry_sqlite, an indexed queue in retry_path.sqlite
 
 class sr_retry:
-    def __init__(self, parent ):
+
+    # retries served by get only when due (otherwise, the consumer slows down on failures)
+    scheduled = False
+
+    def __new__(cls, parent, store=None ):
+        if cls is sr_retry :
+           if store is None : store = getattr(parent,'retry_store','files')
+           cls = retry_stores.get(store, sr_retry)
+        return super().__new__(cls)
+
+    def __init__(self, parent, store=None ):
         parent.logger.debug("sr_retry __init__")
 
         self.logger     = parent.logger
@@ -50,6 +65,13 @@ class sr_retry:
 
         self.retry_ttl  = self.parent.retry_ttl
 
+        # only the sqlite store schedules the retries
+
+        backoff = ( getattr(parent,'retry_backoff_min',30), getattr(parent,'retry_backoff_max',900) )
+        if not self.scheduled and backoff != ( 30, 900 ) :
+           self.logger.warning("retry_backoff_min and retry_backoff_max are ignored with retry_store %s, " \
+                               "set retry_store sqlite to use them" % getattr(parent,'retry_store','files'))
+
         # message to work with
 
         self.message    = raw_message(self.logger)
@@ -100,7 +122,7 @@ class sr_retry:
 
     def msgFromJSON(self, line ):
         try:
-            topic, headers, notice  = json.loads(line)
+            topic, headers, notice  = json_codec.loads(line)
         except ValueError:
             self.logger.error("corrupted line in retry file: %s " % line)
             self.logger.debug("Error information: ", exc_info=True)
@@ -116,54 +138,25 @@ class sr_retry:
         return self.message
 
     def msgToJSON(self, message, done=False ):
+        return json_codec.dumps(self.msgToEntry(message, done), sort_keys=True) + '\n'
+
+    def msgToEntry(self, message, done=False ):
+        """ return the [ topic, headers, notice ] persisted for message """
         self.logger.debug('Encoding msg to json: message={}'.format(vars(message)))
         topic   = message.delivery_info['routing_key']
 
-        if message.body[0] == '[' : # early v03 message to persist, 
-           ( message.pubtime, message.baseurl, message.relpath, headers ) = json.loads( message.body )
-           notice  = "%s %s %s" % ( message.pubtime, message.baseurl, message.relpath )
-        elif message.body[0] == '{' : # late v03 message to persist, 
-           headers = json.loads( message.body )
-           message.version = 'v03'
-           message.pubtime = headers[ "pubTime" ]
-           message.baseurl = headers[ "baseUrl" ]
-           message.relpath = headers[ "relPath" ]
-           notice  = "%s %s %s" % ( message.pubtime, message.baseurl, message.relpath )
-           if 'integrity' in headers.keys():
-               # v3 has no sum, must add it here
-               sum_algo_map = { "a":"arbitrary", "d": "md5", "s": "sha512", "n": "md5name", 
-                                "0": "random", "L": "link", "R": "remove", "z": "cod" }
-               sum_algo_map = {v: k for k, v in sum_algo_map.items()}
-               sumstr = sum_algo_map[headers['integrity']['method']]
-               if sumstr == '0':
-                   sumstr = '{},{}'.format(sumstr, headers['integrity']['value'])
-               elif sumstr == 'z':
-                   sumstr = '{},{}'.format(sumstr, sum_algo_map[headers['integrity']['value']])
-               else:
-                   decoded_value = encode(decode(headers['integrity']['value'].encode('utf-8'), 'base64'),
-                                          'hex').decode('utf-8').strip()
-                   sumstr = '{},{}'.format(sumstr, decoded_value)
-               headers['sum'] = sumstr
-               if sumstr == 'R':
-                  message.event = 'delete'
-               elif sumstr == 'L':
-                  message.event = 'remove'
-               else:
-                  message.event = 'modify'
-
-               del headers['integrity']
-
-           if 'size' in headers.keys():
-               parts_map = {'inplace': 'i', 'partitioned': 'p'}
-               if 'blocks' not in headers.keys():
-                   partstr = "%s,%s,%s,%s,%s" % ('1', headers['size'], '1', '0', '0')
-               else:
-                   partstr = "%s,%s,%s,%s,%s" % (parts_map[headers['blocks']['method']], headers['blocks']['size'],
-                                                 headers['blocks']['count'], headers['blocks']['remainder'],
-                                                 headers['blocks']['number'])
-                   del headers['blocks']
-               del headers['size']
-               headers['parts'] = partstr
+        if message.body[:1] in [ '[', '{' ] : # v03 (or early v03) message to persist
+           ( message.pubtime, message.baseurl, message.relpath, headers, notice ) = decode_body( message.body )
+           if message.body[0] == '{' :
+              message.version = 'v03'
+              if 'sum' in headers:
+                 sumstr = headers['sum']
+                 if sumstr[0] == 'R':
+                    message.event = 'delete'
+                 elif sumstr[0] == 'L':
+                    message.event = 'remove'
+                 else:
+                    message.event = 'modify'
         else:
            headers = message.properties['application_headers']
            if type(message.body) == bytes:
@@ -182,7 +175,10 @@ class sr_retry:
 
         if done:
             headers['_retry_tag_'] = 'done'
-        return json.dumps([topic, headers, notice], sort_keys=True) + '\n'
+        return [topic, headers, notice]
+
+    def destination_worked(self, message):
+        pass
 
     def get(self):
         ok = False
@@ -242,13 +238,16 @@ class sr_retry:
         self.heart_path = self.parent.retry_path + '.heart'
         self.heart_fp   = None
 
-    def in_cache(self,message):
-        relpath = '/'.join(message.body.split()[1:])
-        sumstr  = message.properties['application_headers']['sum']
+    def entry_key(self,headers,notice):
+        relpath = '/'.join(notice.split()[1:])
+        sumstr  = headers['sum']
         partstr = relpath
-        if 'parts' in message.properties['application_headers'] :
-            partstr = message.properties['application_headers']['parts']
-        cache_key = relpath + ' ' + sumstr + ' ' + partstr
+        if 'parts' in headers :
+            partstr = headers['parts']
+        return relpath + ' ' + sumstr + ' ' + partstr
+
+    def in_cache(self,message):
+        cache_key = self.entry_key(message.properties['application_headers'],message.body)
         if cache_key in self.retry_cache : return True
         self.retry_cache[cache_key] = True
         return False
@@ -503,3 +502,234 @@ class sr_retry:
            new_age = os.stat(self.new_path).st_mtime
            if retry_age > new_age : os.unlink(self.new_path)
 
+
+class sr_retry_sqlite(sr_retry):
+    """
+    retries kept in one indexed sqlite table, retry_path.sqlite, instead of the json lines files.
+
+    each row holds the msgToJSON line of a message, under the key of in_cache (relpath sum parts),
+    with its attempt count and the time it is due for its next attempt. A failed message is due
+    again after retry_backoff_min, doubled at every failed attempt up to retry_backoff_max.
+    get_retry serves due messages only, earliest first, so failing retries are not attempted
+    over and over, and the consumer need not slow down.
+
+    failures are also counted per destination (the destination option, or the source host),
+    with the same backoff: the retries for a failing destination wait for it to be due again,
+    without being attempted, until one of its messages works.
+
+    done messages are deleted by key. The heartbeat deletes the expired messages (retry_ttl)
+    through an index, and the served messages that were neither done nor failed again
+    (rejected...), nothing is rewritten.
+
+    existing retry files are imported, then removed, when the database is created.
+    """
+
+    db        = None
+    scheduled = True
+
+    def init(self):
+        super().init()
+
+        self.db_path      = self.parent.retry_path + '.sqlite'
+        self.db           = None
+        self.served       = set()
+        self.destinations = {}
+        self.last_commit  = wallflt()
+
+        self.backoff_min  = getattr(self.parent,'retry_backoff_min',30)
+        self.backoff_max  = getattr(self.parent,'retry_backoff_max',900)
+
+    def open(self):
+        if self.db : return
+
+        fresh   = not os.path.isfile(self.db_path)
+        self.db = sqlite3.connect(self.db_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS retry ( key TEXT PRIMARY KEY, line TEXT, pubtime REAL, "
+                        "destination TEXT, due REAL, attempts INTEGER )")
+        self.db.execute("CREATE INDEX IF NOT EXISTS retry_due ON retry (due)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS retry_pubtime ON retry (pubtime)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS retry_destination ON retry (destination)")
+
+        if fresh : self.import_files()
+
+    def backoff(self, attempts):
+        return min( self.backoff_min * 2 ** (attempts-1), self.backoff_max )
+
+    def commit(self, force=False):
+        now = wallflt()
+        if not force and now - self.last_commit < 1.0 : return
+        self.last_commit = now
+        self.db.commit()
+
+    def destination(self, notice):
+        if getattr(self.parent,'destination',None) : return self.parent.destination
+        return urllib.parse.urlparse(notice.split()[1]).netloc
+
+    def destination_worked(self, message):
+        if not self.destinations : return
+        try:
+           topic, headers, notice = self.msgToEntry(message)
+           self.destinations.pop(self.destination(notice), None)
+        except:
+           self.logger.debug('Exception details:', exc_info=True)
+
+    def import_files(self):
+        """ load the messages of the retry files as the heartbeat would, then remove the files """
+
+        paths = [ self.state_path, self.state_work, self.retry_path, self.retry_work,
+                  self.new_path, self.new_work, self.heart_path ]
+        paths = [ path for path in paths if os.path.isfile(path) ]
+        if not paths : return
+
+        self.logger.info("sr_retry_sqlite importing %s" % paths)
+
+        self.retry_cache = {}
+        N = 0
+        for path in paths :
+            fp = None
+            while True:
+                  fp, message = self.msg_get_from_file(fp, path)
+                  if not message : break
+                  if self.in_cache(message): continue
+                  if not self.is_valid(message): continue
+                  self.put(message, failed=False)
+                  N = N + 1
+            os.unlink(path)
+
+        self.retry_cache = {}
+        self.db.commit()
+        self.logger.info("sr_retry_sqlite imported %d messages" % N)
+
+    def put(self, message, failed=True):
+        """ add message, due now, or when its next attempt is, if it failed """
+        topic, headers, notice = entry = self.msgToEntry(message)
+
+        now         = nowflt()
+        key         = self.entry_key(headers, notice)
+        destination = self.destination(notice)
+        attempts    = 0
+        due         = now
+
+        if failed :
+           row      = self.db.execute("SELECT attempts FROM retry WHERE key = ?", (key,)).fetchone()
+           attempts = row[0] + 1 if row else 1
+           due      = now + self.backoff(attempts)
+
+           # the destination backs off further when it fails once it was due again
+
+           d_due, d_attempts = self.destinations.get(destination, (now, 0))
+           if d_due <= now :
+              d_attempts += 1
+              self.destinations[destination] = ( now + self.backoff(d_attempts), d_attempts )
+
+        self.db.execute("INSERT OR REPLACE INTO retry (key, line, pubtime, destination, due, attempts) "
+                        "VALUES (?,?,?,?,?,?)",
+                        ( key, json_codec.dumps(entry, sort_keys=True), timestr2flt(notice.split()[0]),
+                          destination, due, attempts ))
+        self.served.discard(key)
+
+    def add_msg_to_new_file(self, message):
+        self.open()
+        try:
+           self.put(message)
+           self.commit()
+        except:
+           self.logger.error("failed to add message to retry: %s" % message.body)
+           self.logger.debug('Exception details:', exc_info=True)
+
+    def add_msg_to_state_file(self, message, done=False):
+        self.open()
+        try:
+           if done :
+              topic, headers, notice = self.msgToEntry(message)
+              key = self.entry_key(headers, notice)
+              self.db.execute("DELETE FROM retry WHERE key = ?", (key,))
+              self.served.discard(key)
+              self.destinations.pop(self.destination(notice), None)
+           else :
+              self.put(message)
+           self.commit()
+        except:
+           self.logger.error("failed to update message in retry: %s" % message.body)
+           self.logger.debug('Exception details:', exc_info=True)
+
+    def cleanup(self):
+        self.close()
+        for path in [ self.db_path, self.db_path + '-wal', self.db_path + '-shm' ]:
+            if os.path.exists(path): os.unlink(path)
+        super().cleanup()
+
+    def close(self):
+        if self.db :
+           try   :
+                   self.db.commit()
+                   self.db.close()
+           except:
+                   self.logger.debug('Exception details:', exc_info=True)
+        self.db = None
+
+    def get_retry(self):
+        self.open()
+
+        now = nowflt()
+        row = self.db.execute("SELECT key, line, destination, attempts FROM retry WHERE due <= ? "
+                              "ORDER BY due LIMIT 1", (now,)).fetchone()
+        if not row : return True,None
+
+        key, line, destination, attempts = row
+
+        # destination failing : its retries wait for it
+
+        d_due, d_attempts = self.destinations.get(destination, (now, 0))
+        if d_due > now :
+           self.db.execute("UPDATE retry SET due = ? WHERE destination = ? AND due < ?", (d_due, destination, d_due))
+           return False,None
+
+        message = self.msgFromJSON(line)
+
+        if not message or not self.is_valid(message):
+           self.db.execute("DELETE FROM retry WHERE key = ?", (key,))
+           return False,None
+
+        # not served again before its next attempt, should it not be reported
+
+        self.db.execute("UPDATE retry SET due = ? WHERE key = ?", (now + self.backoff(attempts + 1), key))
+        self.served.add(key)
+
+        message.isRetry = True
+
+        return True,message
+
+    def on_heartbeat(self,parent):
+        self.logger.info("sr_retry_sqlite on_heartbeat")
+
+        now = nowflt()
+        self.open()
+
+        # expired messages
+
+        if self.retry_ttl and self.retry_ttl > 0 :
+           self.db.execute("DELETE FROM retry WHERE pubtime < ?", (now - self.retry_ttl/1000,))
+
+        # served messages, neither done nor failed again, are done with
+
+        self.db.executemany("DELETE FROM retry WHERE key = ?", [ (key,) for key in self.served ])
+        self.served = set()
+        self.commit(force=True)
+
+        N, due = self.db.execute("SELECT COUNT(*), MIN(due) FROM retry").fetchone()
+        if N == 0 :
+           self.logger.info("No retry in list")
+        else:
+           self.logger.info("Number of messages in retry list %d, next due in %f" % (N, max(due-now,0)))
+
+        self.logger.info("sr_retry on_heartbeat elapse %f" % (nowflt()-now))
+
+    def on_start(self,parent):
+        self.logger.info("sr_retry_sqlite on_start")
+        self.open()
+
+
+retry_stores = { 'files': sr_retry, 'sqlite': sr_retry_sqlite }
@@ -31,7 +31,7 @@
 #
 #
 
-import logging, paramiko, os,sys,time
+import inspect, logging, paramiko, os,sys,time
 from   paramiko import *
 from   stat     import *
 from urllib.parse import unquote
@@ -41,6 +41,11 @@ try :
 except :
          from sarra.sr_util      import *
 
+# paramiko >= 3.3 can bound the reads prefetch requests ahead, older ones request the whole file
+
+try    : PREFETCH_BOUNDED = 'max_concurrent_requests' in inspect.signature(SFTPFile.prefetch).parameters
+except : PREFETCH_BOUNDED = False
+
 #============================================================
 # sftp protocol in sarracenia supports/uses :
 #
@@ -77,9 +82,6 @@ class sr_sftp(sr_proto):
         sr_proto.__init__(self,parent)
         self.user_cache_dir = parent.user_cache_dir
 
-        # sftp command times out after 20 secs
-        # this setting is different from the computed iotime (sr_proto)
-
         self.init()
 
         self.ssh_config  = None
@@ -98,11 +100,9 @@ class sr_sftp(sr_proto):
     # cd
     def cd(self, path):
         self.logger.debug("sr_sftp cd %s" % path)
-        alarm_set(self.iotime)
         self.sftp.chdir(self.originalDir)
         self.sftp.chdir(path)
         self.pwd = path
-        alarm_cancel()
 
     # cd forced
     def cd_forced(self,perm,path) :
@@ -110,14 +110,11 @@ class sr_sftp(sr_proto):
 
         # try to go directly to path
 
-        alarm_set(self.iotime)
         self.sftp.chdir(self.originalDir)
         try   :
                 self.sftp.chdir(path)
-                alarm_cancel()
                 return
         except: pass
-        alarm_cancel()
 
         # need to create subdir
 
@@ -128,17 +125,13 @@ class sr_sftp(sr_proto):
             if d == ''   : continue
             # try to go directly to subdir
             try   :
-                    alarm_set(self.iotime)
                     self.sftp.chdir(d)
-                    alarm_cancel()
                     continue
             except: pass
 
             # create and go to subdir
-            alarm_set(self.iotime)
             self.sftp.mkdir(d,self.parent.chmod_dir)
             self.sftp.chdir(d)
-            alarm_cancel()
 
     def check_is_connected(self):
         self.logger.debug("sr_sftp check_is_connected")
@@ -157,9 +150,7 @@ class sr_sftp(sr_proto):
 
         # really connected, getcwd would not work, send_ignore would not work... so chdir used
         try    :
-                 alarm_set(self.iotime)
                  self.sftp.chdir(self.originalDir)
-                 alarm_cancel()
         except :
                  self.close()
                  return False
@@ -169,9 +160,7 @@ class sr_sftp(sr_proto):
     # chmod
     def chmod(self,perm,path):
         self.logger.debug("sr_sftp chmod %s %s" % ( "{0:o}".format(perm),path))
-        alarm_set(self.iotime)
         self.sftp.chmod(path,perm)
-        alarm_cancel()
 
     # close
     def close(self):
@@ -182,12 +171,10 @@ class sr_sftp(sr_proto):
 
         self.init()
 
-        alarm_set(self.iotime)
         try   : old_sftp.close()
         except: pass
         try   : old_ssh.close()
         except: pass
-        alarm_cancel()
 
     # connect...
     def connect(self):
@@ -201,7 +188,6 @@ class sr_sftp(sr_proto):
 
         if not self.credentials() : return False
 
-        alarm_set(self.iotime)
         try:
 
                 logger = logging.getLogger('paramiko')
@@ -212,19 +198,23 @@ class sr_sftp(sr_proto):
                 if self.password:
                    self.ssh.connect(self.host,self.port,self.user, unquote(self.password), \
                                     pkey=None,key_filename=self.ssh_keyfile,\
-                                    timeout=self.timeout,allow_agent=False,look_for_keys=False)
+                                    timeout=self.iotime,banner_timeout=self.iotime,auth_timeout=self.iotime,\
+                                    allow_agent=False,look_for_keys=False)
                 else:
                    self.ssh.connect(self.host,self.port,self.user,self.password, \
                                     pkey=None,key_filename=self.ssh_keyfile,\
-                                    timeout=self.timeout)
+                                    timeout=self.iotime,banner_timeout=self.iotime,auth_timeout=self.iotime)
                 #if ssh_keyfile != None :
                 #  key=DSSKey.from_private_key_file(ssh_keyfile,password=None)
 
-                sftp = self.ssh.open_sftp()
-                if self.timeout != None :
-                   self.logger.debug("sr_sftp connect setting timeout %f" % self.timeout)
-                   channel = sftp.get_channel()
-                   channel.settimeout(self.timeout)
+                # every sftp request and file read or write times out after iotime
+                # the channel window lets the server send sftp_window bytes ahead (pipelined reads)
+
+                window = max(self.window, paramiko.common.DEFAULT_WINDOW_SIZE)
+                sftp = paramiko.SFTPClient.from_transport(self.ssh.get_transport(), window_size=window)
+                self.logger.debug("sr_sftp connect setting timeout %d" % self.iotime)
+                channel = sftp.get_channel()
+                channel.settimeout(self.iotime)
 
                 sftp.chdir('.')
                 self.originalDir = sftp.getcwd()
@@ -239,14 +229,12 @@ class sr_sftp(sr_proto):
                    if os.path.isfile(self.file_index_cache): self.load_file_index()
                    else: self.init_file_index()
 
-                #alarm_cancel()
                 return True
 
         except:
             self.logger.error("sr_sftp/connect: unable to connect to %s (user:%s)" % (self.host, self.user))
             self.logger.debug('Exception details: ', exc_info=True)
 
-        alarm_cancel()
         return False
 
     # credentials...
@@ -301,12 +289,10 @@ class sr_sftp(sr_proto):
     def delete(self, path):
         self.logger.debug("sr_sftp rm %s" % path)
 
-        alarm_set(self.iotime)
         # check if the file is there... if not we are done,no error
         try   :
                 s = self.sftp.lstat(path)
         except: 
-                alarm_cancel()
                 return
 
         # proceed with file/link removal
@@ -319,14 +305,11 @@ class sr_sftp(sr_proto):
            self.logger.debug("sr_sftp rmdir %s" % path)
            self.sftp.rmdir(path)
 
-        alarm_cancel()
 
     # symlink
     def symlink(self, link, path):
         self.logger.debug("sr_sftp symlink %s %s" % (link, path) )
-        alarm_set(self.iotime)
         self.sftp.symlink(link, path)
-        alarm_cancel()
 
     # get 
     def get(self, remote_file, local_file, remote_offset=0, local_offset=0, length=0 ) :
@@ -334,11 +317,18 @@ class sr_sftp(sr_proto):
 
         # read : remote file open, seek if needed
 
-        alarm_set(2*self.iotime)
         rfp = self.sftp.file(remote_file,'rb',self.bufsize)
         if remote_offset != 0 : rfp.seek(remote_offset,0)
         rfp.settimeout(1.0*self.iotime)
-        alarm_cancel()
+
+        # pipelined reads : up to sftp_window bytes requested ahead, instead of
+        # one round trip per request.  for a part, up to its end only.
+
+        if self.window > 0 :
+           end      = remote_offset + length if length != 0 else None
+           requests = max(1, self.window // rfp.MAX_REQUEST_SIZE)
+           if PREFETCH_BOUNDED : rfp.prefetch(end, requests)
+           else                : rfp.prefetch(end)
 
         # read from rfp and write to local_file
 
@@ -346,15 +336,11 @@ class sr_sftp(sr_proto):
 
         # close
 
-        alarm_set(self.iotime)
         rfp.close()
-        alarm_cancel()
 
     # getcwd
     def getcwd(self):
-        alarm_set(self.iotime)
         cwd =  self.sftp.getcwd()
-        alarm_cancel()
         return cwd
 
     # init
@@ -365,6 +351,7 @@ class sr_sftp(sr_proto):
         self.sftp        = None
         self.ssh         = None
         self.seek        = True
+        self.window      = self.parent.sftp_window
 
         self.batch       = 0
 
@@ -375,20 +362,16 @@ class sr_sftp(sr_proto):
         self.logger.debug("sr_sftp listdir(): %s" % dir_fils)
         if dir_fils:
             dir_attr = self.sftp.listdir_attr()
-            alarm_cancel()
             for index in range(len(dir_fils)):
                 attr = dir_attr[index]
                 line = attr.__str__()
                 fil = dir_fils[index]
                 self.ls_file_index(fil,line)
-        else:
-            alarm_cancel()
         if hasattr(self,'file_index'): self.write_file_index()
 
     # load_file_index
     def load_file_index(self):
         self.logger.debug("sr_sftp load_file_index")
-        alarm_cancel()
         try:
             with open(self.file_index_cache,'r') as fp:
                 index = int(fp.read())
@@ -400,10 +383,7 @@ class sr_sftp(sr_proto):
     def ls(self):
         self.logger.debug("sr_sftp ls")
         self.entries  = {}
-        # iotime is at least 30 secs, say we wait for max 5 mins
-        alarm_set( 10 * self.iotime )
         dir_attr = self.sftp.listdir_attr()
-        alarm_cancel()
         for index in range(len(dir_attr)):
             attr = dir_attr[index]
             line = attr.__str__()
@@ -456,9 +436,7 @@ class sr_sftp(sr_proto):
     # mkdir
     def mkdir(self, remote_dir):
         self.logger.debug("sr_sftp mkdir %s" % remote_dir)
-        alarm_set(self.iotime)
         self.sftp.mkdir(remote_dir,self.parent.chmod_dir)
-        alarm_cancel()
 
     # put
     def put(self, local_file, remote_file, local_offset=0, remote_offset=0, length=0 ):
@@ -466,7 +444,6 @@ class sr_sftp(sr_proto):
 
         # simple file
 
-        alarm_set(2*self.iotime)
 
         if length == 0 :
            rfp = self.sftp.file(remote_file,'wb',self.bufsize)
@@ -483,7 +460,10 @@ class sr_sftp(sr_proto):
            rfp.settimeout(1.0*self.iotime)
            if remote_offset != 0 : rfp.seek(remote_offset,0)
 
-        alarm_cancel()
+        # pipelined writes : the writes are not waited for one by one,
+        # their status is checked as they come back, and at close.
+
+        if self.window > 0 : rfp.set_pipelined(True)
 
         # read from local_file and write to rfp
 
@@ -491,37 +471,29 @@ class sr_sftp(sr_proto):
 
         # no sparse file... truncate where we are at
 
-        alarm_set(self.iotime)
         self.fpos = remote_offset + rw_length
         if length != 0 : rfp.truncate(self.fpos)
 
         # close
 
         rfp.close()
-        alarm_cancel()
 
     # rename
     def rename(self,remote_old,remote_new) :
         self.logger.debug("sr_sftp rename %s %s" % (remote_old,remote_new))
         try    : self.delete(remote_new)
         except : pass
-        alarm_set(self.iotime)
         self.sftp.rename(remote_old,remote_new)
-        alarm_cancel()
 
     # rmdir
     def rmdir(self,path) :
         self.logger.debug("sr_sftp rmdir %s " % path)
-        alarm_set(self.iotime)
         self.sftp.rmdir(path)
-        alarm_cancel()
 
     # utime
     def utime(self,path,tup) :
         self.logger.debug("sr_sftp utime %s %s " % (path,tup))
-        alarm_set(self.iotime)
         self.sftp.utime(path,tup)
-        alarm_cancel()
 
     # write_file_index
     def write_file_index(self):
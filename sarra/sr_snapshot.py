@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+#
+# This file is part of sarracenia.
+# The sarracenia suite is Free and is proudly provided by the Government of Canada
+# Copyright (C) Her Majesty The Queen in Right of Canada, Environment Canada, 2008-2015
+#
+# Questions or bugs report: dps-client@ec.gc.ca
+# Sarracenia repository: https://github.com/MetPX/sarracenia
+# Documentation: https://github.com/MetPX/sarracenia
+#
+# sr_snapshot.py : what sr_post/sr_watch last posted for each file of the trees they walk,
+#                  so that a walk at startup only posts the files new or changed since.
+#
+########################################################################
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; version 2 of the License.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307  USA
+#
+#
+
+import os
+import sqlite3
+
+from sarra.sr_util import wallflt
+
+#============================================================
+# sr_snapshot supports/uses :
+#
+# snapshot_file : default ~/.cache/sarra/'pgm'/'cfg'/tree_snapshot_001.sqlite
+#                 one indexed sqlite table : path -> size, mtime (ns), inode, sum
+#                 of the files as they were when posted.
+#
+# changed : True when a file is not in the snapshot, or its size, mtime or inode differ
+# record  : a file was posted (an insert or replace)
+# delete  : a file, or a directory and all under it, was posted as removed
+#
+# the table is updated as files are posted, and committed at most every second while
+# posting, at the end of a walk, before sr_watch sleeps, and on close : a crash reposts,
+# at next start, what was posted during the last second.
+#============================================================
+
+class sr_snapshot():
+
+    def __init__(self, parent):
+        self.parent        = parent
+        self.logger        = parent.logger
+        self.db            = None
+        self.snapshot_file = None
+        self.last_commit   = wallflt()
+
+    # key : paths as posted (watchdog adds /./ in paths of linked directories)
+    def key(self, path):
+        return path.replace( '/./', '/' )
+
+    def changed(self, path, lstat):
+        row = self.db.execute("SELECT size, mtime, ino FROM snapshot WHERE path = ?", (self.key(path),)).fetchone()
+        return row != ( lstat.st_size, lstat.st_mtime_ns, lstat.st_ino )
+
+    def close(self):
+        self.logger.debug("sr_snapshot close")
+        if not self.db : return
+
+        try:
+            self.db.commit()
+            self.db.close()
+        except Exception as err:
+            self.logger.warning('did not close: snapshot_file={}, err={}'.format(self.snapshot_file, err))
+            self.logger.debug('Exception details:', exc_info=True)
+        self.db = None
+
+    def commit(self, force=False):
+        now = wallflt()
+        if not force and now - self.last_commit < 1.0 : return
+        self.last_commit = now
+        self.db.commit()
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM snapshot").fetchone()[0]
+
+    # delete : path, and what is under path when it is a directory
+    #          ( '/' < path < '0' : the paths starting with path + '/', through the index )
+    def delete(self, path):
+        path = self.key(path)
+        self.db.execute("DELETE FROM snapshot WHERE path = ? OR ( path > ? AND path < ? )", (path, path + '/', path + '0'))
+        self.commit()
+
+    def open(self, snapshot_file=None):
+        self.snapshot_file = snapshot_file
+
+        if snapshot_file is None :
+           self.snapshot_file  = self.parent.user_cache_dir + os.sep
+           self.snapshot_file += 'tree_snapshot_%.3d.sqlite' % self.parent.instance
+
+        self.logger.debug("sr_snapshot open %s" % self.snapshot_file)
+
+        self.db = sqlite3.connect(self.snapshot_file)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS snapshot ( path TEXT PRIMARY KEY, size INTEGER, "
+                        "mtime INTEGER, ino INTEGER, sum TEXT ) WITHOUT ROWID")
+
+    def record(self, path, lstat, sumstr):
+        self.db.execute("INSERT OR REPLACE INTO snapshot (path, size, mtime, ino, sum) VALUES (?,?,?,?,?)",
+                        (self.key(path), lstat.st_size, lstat.st_mtime_ns, lstat.st_ino, sumstr))
+        self.commit()
+
+    # reset : forget everything, all files will be posted again
+    def reset(self):
+        self.db.execute("DELETE FROM snapshot")
+        self.db.commit()
@@ -41,7 +41,7 @@
 #
 #============================================================
 
-import json,os,sys,time
+import os,sys,time
 
 from sys import platform as _platform
 
@@ -58,6 +58,7 @@ try :
          from sr_http            import *
          from sr_instances       import *
          from sr_message         import *
+         from sr_transfer        import *
          from sr_util            import *
          from sr_xattr           import *
 except : 
@@ -68,12 +69,16 @@ except :
          from sarra.sr_http      import *
          from sarra.sr_instances import *
          from sarra.sr_message   import *
+         from sarra.sr_transfer  import *
          from sarra.sr_util      import *
          from sarra.sr_xattr     import *
 
 
 class sr_subscribe(sr_instances):
 
+    # transfer workers (sr_transfer), started by connect when transfer_concurrency > 1
+    transfers = None
+
     def check(self):
         self.logger.debug("%s check" % self.program_name)
 
@@ -181,9 +186,12 @@ class sr_subscribe(sr_instances):
         for plugin in self.on_stop_list:
             if not plugin(self): break
 
+        if hasattr(self,'transfers') and self.transfers : self.transfers.close()
+
         if hasattr(self, 'consumer'): self.consumer.close()
 
         if self.post_broker :
+           if hasattr(self,'publisher') and self.msg : self.msg.post_flush(force=True)
            if self.post_broker != self.broker : self.post_hc.close()
 
         if self.save_fp: self.save_fp.close()
@@ -250,6 +258,20 @@ class sr_subscribe(sr_instances):
            self.save_count    = 1
            return
 
+        # =============
+        # http : keep a connection alive per download (worker and range stream)
+        # =============
+
+        http_connections.resize( max(4, self.transfer_concurrency * self.range_streams) )
+
+        # =============
+        # transfer workers : downloads in parallel, if transfer_concurrency is set
+        # =============
+
+        if self.transfer_concurrency > 1 and self.doit_download in self.do_task_list :
+           self.transfers     = sr_transfer(self)
+           self.consumer.idle = self.transfers.wait
+
         # =============
         # publisher : if self.post_broker exists
         # =============
@@ -273,6 +295,8 @@ class sr_subscribe(sr_instances):
            # publisher
 
            self.publisher = Publisher(self.post_hc)
+           self.publisher.set_confirm_window(self.post_confirm_window)
+           self.publisher.set_tx_batch(self.post_tx_batch, self.post_tx_interval)
            self.publisher.build()
            self.msg.publisher = self.publisher
            if self.post_exchange :
@@ -367,13 +391,13 @@ class sr_subscribe(sr_instances):
 
         try :
                 if   scheme in ['http','https'] :
-                     if not hasattr(self,'http_link') :
+                     if getattr(self,'http_link',None) is None :
                         self.http_link = http_transport()
                      ok = self.http_link.download(self)
                      return ok
 
                 elif scheme in ['ftp','ftps'] :
-                     if not hasattr(self,'ftp_link') :
+                     if getattr(self,'ftp_link',None) is None :
                         self.ftp_link = ftp_transport()
                      ok = self.ftp_link.download(self)
                      return ok
@@ -381,7 +405,7 @@ class sr_subscribe(sr_instances):
                 elif scheme == 'sftp' :
                      try    : from sr_sftp       import sftp_transport
                      except : from sarra.sr_sftp import sftp_transport
-                     if not hasattr(self,'sftp_link') :
+                     if getattr(self,'sftp_link',None) is None :
                         self.sftp_link = sftp_transport()
                      ok = self.sftp_link.download(self)
                      return ok
@@ -665,9 +689,9 @@ class sr_subscribe(sr_instances):
             return
 
         if m.post_version == 'v03':
-            json_line = json.dumps( ( m.pubtime, m.baseurl, m.relpath, m.headers ), sort_keys=True )
+            json_line = json_codec.dumps( ( m.pubtime, m.baseurl, m.relpath, m.headers ), sort_keys=True )
         else:
-            json_line = json.dumps( ( m.topic, m.headers, m.notice ), sort_keys=True )
+            json_line = json_codec.dumps( ( m.topic, m.headers, m.notice ), sort_keys=True )
 
         print("%s" % json_line )
 
@@ -1368,6 +1392,8 @@ class sr_subscribe(sr_instances):
         # attempt downloads
         #=================================
 
+        ok = True
+
         if need_download :
 
 
@@ -1379,17 +1405,39 @@ class sr_subscribe(sr_instances):
            if self.msg.sumflg[0] == '0':
                self.msg.sumalgo = None
 
-           # N attempts to download
-           i  = 1
-           while i <= self.attempts :
-                 if i != 1:
-                     self.logger.warning("downloading again, attempt %d" % i)
+           # with transfer workers, the download is completed by sr_transfer
+           # (and so are the tasks that follow doit_download)
+
+           if self.transfers and self.transfers.accepts(self.msg) :
+              self.transfers.submit(oldname)
+              return False
+
+           ok = self.__download_attempts__()
+
+        return self.__download_done__(ok, need_download, oldname)
+
+    # N attempts to download
+
+    def __download_attempts__(self):
 
-                 ok = self.__do_download__()
-                 if ok : break
-                 # dont force on retry 
-                 if self.msg.isRetry : break
-                 i = i + 1
+        i  = 1
+        while i <= self.attempts :
+              if i != 1:
+                  self.logger.warning("downloading again, attempt %d" % i)
+
+              ok = self.__do_download__()
+              if ok : break
+              # dont force on retry 
+              if self.msg.isRetry : break
+              i = i + 1
+
+        return ok
+
+    # after the download (or if none was needed) : on_part, on_file, post...
+
+    def __download_done__(self, ok, need_download, oldname):
+
+        if need_download :
 
            # could not download ...
 
@@ -1548,7 +1596,7 @@ class sr_subscribe(sr_instances):
            # discard option
            if self.discard :
               try    :
-                        os.unlink(self.msg.new_file)
+                        os.unlink(os.path.join(self.msg.new_dir, self.msg.new_file))
                         self.logger.debug("Discarded  %s" % self.msg.new_file)
               except :
                         self.logger.error("Could not discard")
@@ -1637,7 +1685,7 @@ class sr_subscribe(sr_instances):
 
                  count += 1
                  self.msg.exchange = 'save'
-                 jt = json.loads( json_line )
+                 jt = json_codec.loads( json_line )
                  if len(jt) == 3:  # v02 format...
                      ( self.msg.topic, self.msg.headers, self.msg.notice ) = jt
                  elif len(jt) == 1: # v03 format. post ETCTS201902
@@ -1742,9 +1790,16 @@ class sr_subscribe(sr_instances):
                             last  = has_vip
                             self.logger.debug("%s is active on vip=%s" % (self.program_name,self.vip))
 
+                      #  complete the downloads done by transfer workers
+                      if self.transfers :
+                         self.transfers.complete()
+
                       #  consume message
                       ok, self.msg = self.consumer.consume()
-                      if not ok : continue
+                      if not ok :
+                         # idle (or rejected) : complete pipelined publishes
+                         if self.post_broker and self.msg : self.msg.post_flush()
+                         continue
 
                       #  in save mode
 
@@ -1774,7 +1829,7 @@ class sr_subscribe(sr_instances):
 
         self.logger.info("%s saving %d message topic: %s" % ( self.program_name,self.save_count,self.msg.topic))
         self.save_count += 1
-        self.save_fp.write(json.dumps( ( self.msg.pubtime, self.msg.baseurl, self.msg.relpath, self.msg.headers ), sort_keys=True ) + '\n' ) 
+        self.save_fp.write(json_codec.dumps( ( self.msg.pubtime, self.msg.baseurl, self.msg.relpath, self.msg.headers ), sort_keys=True ) + '\n' ) 
         self.save_fp.flush()
 
 
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+#
+# This file is part of sarracenia.
+# The sarracenia suite is Free and is proudly provided by the Government of Canada
+# Copyright (C) Her Majesty The Queen in Right of Canada, Environment Canada, 2008-2015
+#
+# Questions or bugs report: dps-client@ec.gc.ca
+# sarracenia repository: https://github.com/MetPX/sarracenia
+# Documentation: https://github.com/MetPX/sarracenia
+#
+# sr_transfer.py : transfer workers, downloading several files at once for one instance
+#
+########################################################################
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; version 2 of the License.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307  USA
+#
+
+import copy,inspect,os,queue,threading,time
+
+try :
+         from sr_http            import *
+except :
+         from sarra.sr_http      import *
+
+# class transfer_job
+#
+# a message handed to a worker, with what its completion needs.
+# reports are published on the instance's connection, so the worker
+# keeps them until the transfer completes.
+
+class transfer_job():
+
+    def __init__(self, msg, raw_msg, oldname):
+        self.msg     = msg
+        self.raw_msg = raw_msg
+        self.oldname = oldname
+        self.ok      = False
+        self.reports = []
+
+    def report_publish(self, code, message):
+        self.reports.append( (code, message) )
+
+# class transfer_worker
+#
+# what a download running in a worker thread sees as its parent : its own
+# message, destination and protocol links (http_link, ftp_link, sftp_link),
+# everything else is the instance's. The instance's methods are bound to the
+# worker, so that they use the worker's message and links.
+
+class transfer_worker():
+
+    def __init__(self, parent, jobs, done):
+        self.owner   = parent
+        self.jobs    = jobs
+        self.done    = done
+        self.msg     = None
+
+        # the worker's own links, never the instance's
+        self.ftp_link  = None
+        self.http_link = None
+        self.sftp_link = None
+
+        self.thread  = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def __getattr__(self, name):
+        value = getattr(type(self.owner), name, None)
+        if inspect.isfunction(value) : return value.__get__(self)
+        return getattr(self.owner, name)
+
+    def close(self):
+        for link in [ self.ftp_link, self.http_link, self.sftp_link ] :
+            if link : link.close()
+
+    def work(self):
+        while True :
+              job = self.jobs.get()
+              if job == None : break
+
+              self.msg = job.msg
+              try    : job.ok = self.__download_attempts__()
+              except :
+                       self.logger.error("sr_transfer/work: download failed %s" % job.msg.urlstr)
+                       self.logger.debug('Exception details: ', exc_info=True)
+                       job.ok = False
+              self.msg = None
+
+              self.done.put(job)
+
+        self.close()
+
+# class sr_transfer
+#
+# transfer_concurrency workers downloading for an instance.
+# the instance submits the messages to download, and completes them
+# (on_part, on_file, post, ack...) in the order the downloads complete.
+
+class sr_transfer():
+
+    def __init__(self, parent):
+        self.parent  = parent
+        self.logger  = parent.logger
+
+        self.jobs    = queue.Queue()
+        self.done    = queue.Queue()
+        self.ready   = []
+        self.busy    = 0
+
+        self.schemes = [ 'http', 'https', 'ftp', 'ftps', 'sftp' ]
+        self.workers = [ transfer_worker(parent, self.jobs, self.done) for i in range(parent.transfer_concurrency) ]
+
+        self.logger.info("sr_transfer %d workers" % len(self.workers))
+
+    # accepts : downloads by the builtin protocols, plugins and inlined content stay in the instance
+    def accepts(self, msg):
+        scheme = msg.url.scheme
+
+        if not scheme in self.schemes           : return False
+        if scheme in self.parent.do_downloads   : return False
+        if scheme in self.parent.do_gets        : return False
+        if 'content' in msg.headers             : return False
+
+        return True
+
+    def close(self):
+        for worker in self.workers : self.jobs.put(None)
+        for worker in self.workers : worker.thread.join(5)
+        self.workers = []
+
+    # complete : finish the transfers done, waiting for one when all workers are busy
+    def complete(self):
+        while self.busy > 0 :
+              if self.ready :
+                 job = self.ready.pop(0)
+              else :
+                 try    : job = self.done.get(block=self.full())
+                 except queue.Empty : return
+              self.busy -= 1
+              self.completed(job)
+
+    def completed(self, job):
+        parent = self.parent
+        msg    = parent.msg
+
+        # the current message was processed, acknowledge it before taking over
+
+        parent.consumer.ack()
+        parent.consumer.raw_msg = job.raw_msg
+        parent.msg              = job.msg
+
+        del job.msg.report_publish
+
+        # doit_download changed into the directory of the last message submitted,
+        # the completion (and its plugins) runs in the one of this message
+
+        try    : cwd = os.getcwd()
+        except : cwd = None
+
+        try :
+                for code, message in job.reports :
+                    job.msg.report_publish(code, message)
+
+                os.chdir(job.msg.new_dir)
+
+                # complete the download, then the tasks that follow it
+
+                if parent.__download_done__(job.ok, True, job.oldname) :
+                   tasks = parent.do_task_list
+                   for plugin in tasks[tasks.index(parent.doit_download)+1:] :
+                       if not plugin(parent) : break
+
+        except :
+                self.logger.error("sr_transfer/completed: could not complete %s" % job.msg.urlstr)
+                self.logger.debug('Exception details: ', exc_info=True)
+                if parent.retry_mode : parent.consumer.msg_to_retry()
+
+        if cwd :
+           try    : os.chdir(cwd)
+           except : pass
+
+        parent.consumer.ack()
+        parent.msg = msg
+
+    def full(self):
+        return self.busy >= len(self.workers)
+
+    # submit : hand the current message to a worker, parent.msg and its
+    #          raw message are reused for the next message, so they are copied.
+    def submit(self, oldname):
+        parent  = self.parent
+        msg     = copy.copy(parent.msg)
+        raw_msg = copy.copy(parent.consumer.raw_msg)
+
+        raw_msg.delivery_info = dict(raw_msg.delivery_info)
+        raw_msg.properties    = dict(raw_msg.properties)
+
+        if msg.sumalgo : msg.sumalgo = copy.copy(msg.sumalgo)
+
+        job = transfer_job(msg, raw_msg, oldname)
+        msg.report_publish = job.report_publish
+
+        parent.consumer.raw_msg = None
+
+        self.busy += 1
+        self.jobs.put(job)
+
+    # wait : idle sleep of the consumer, woken up when a transfer completes
+    def wait(self, timeout):
+        if self.busy <= len(self.ready) :
+           time.sleep(timeout)
+           return
+
+        try    : self.ready.append(self.done.get(timeout=timeout))
+        except queue.Empty : pass
@@ -35,8 +35,9 @@ from hashlib import md5
 from hashlib import sha512
 
 import sys
+import base64,binascii,json
 import calendar,datetime
-import os,random,signal,stat,sys,time
+import os,queue,random,signal,stat,sys,threading,time
 import urllib
 import urllib.parse
 
@@ -57,16 +58,16 @@ class TimeoutException(Exception):
 
 # alarm_cancel
 def alarm_cancel():
-    if sys.platform != 'win32' :
+    if sys.platform != 'win32' and threading.current_thread() is threading.main_thread() :
         signal.alarm(0)
 
 # alarm_raise
 def alarm_raise(n, f):
     raise TimeoutException("signal alarm timed out")
 
-# alarm_set
+# alarm_set : signals only reach the main thread, transfer workers rely on their connection timeouts
 def alarm_set(time):
-    if sys.platform != 'win32' :
+    if sys.platform != 'win32' and threading.current_thread() is threading.main_thread() :
         signal.signal(signal.SIGALRM, alarm_raise)
         signal.alarm(time)
 
@@ -97,8 +98,120 @@ class raw_message:
                self.logger.debug('Exception details: ', exc_info=True)
 
 
+# =========================================
+# sr_hasher : checksum computed in a thread, overlapping the transfer
+#
+# the transfer takes a free buffer with buffer(), fills it, and hands it
+# over with update(). hashlib releases the GIL on large buffers, so the
+# sum is computed while the next buffer is read and written.
+# =========================================
+
+# transfers smaller than this are summed inline, a thread is not worth it
+HASH_OVERLAP_MIN = 1024*1024
+
+# handing over small buffers costs more than hashing them
+HASH_OVERLAP_BUFSIZE = 256*1024
+
+# and the thread needs a cpu of its own
+if hasattr(os,'sched_getaffinity') : HASH_OVERLAP_CPUS = len(os.sched_getaffinity(0))
+else                               : HASH_OVERLAP_CPUS = os.cpu_count() or 1
+
+class sr_hasher():
+
+    def __init__(self, sumalgo, bufsize, depth=4):
+        self.sumalgo = sumalgo
+        self.error   = None
+        self.free    = queue.Queue()
+        self.chunks  = queue.Queue()
+
+        for i in range(depth) : self.free.put(bytearray(bufsize))
+
+        self.thread  = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def buffer(self):
+        return self.free.get()
+
+    # finish : wait for the sum to be complete
+    def finish(self):
+        self.chunks.put(None)
+        self.thread.join()
+        if self.error : raise self.error
+
+    def update(self, buf, n):
+        self.chunks.put( (buf, n) )
+
+    def work(self):
+        while True :
+              item = self.chunks.get()
+              if item == None : break
+
+              buf, n = item
+              if not self.error :
+                 try    : self.sumalgo.update(bytes(memoryview(buf)[:n]))
+                 except Exception as ex : self.error = ex
+              self.free.put(buf)
+
+# readinto_copy : copy length bytes (up to the end when 0) from src into dst (None : sum only),
+#                 src fills preallocated buffers, dst gets views of them, sumalgo gets bytes
+#                 (sum plugins may keep or hash what they are given).
+#                 sumalgo runs in a sr_hasher when the transfer is long enough.
+#                 Returns the bytes read.
+
+def readinto_copy(src, dst, sumalgo, length=0, bufsize=8192):
+
+    size = length
+    if size == 0 :
+       try    : size = os.fstat(src.fileno()).st_size - src.tell()
+       except : size = 0
+
+    hasher = None
+    if sumalgo and size >= HASH_OVERLAP_MIN and HASH_OVERLAP_CPUS > 1 :
+       bufsize = max(bufsize, HASH_OVERLAP_BUFSIZE)
+       hasher  = sr_hasher(sumalgo, bufsize)
+       buf     = hasher.buffer()
+    else :
+       buf    = bytearray(bufsize)
+
+    update    = sumalgo.update if sumalgo and not hasher else None
+    write     = dst.write if dst else None
+    rw_length = 0
+
+    try :
+            while True :
+                  view = memoryview(buf)
+                  if length == 0 :
+                     n = src.readinto(buf)
+                  else :
+                     want = length - rw_length
+                     if want <= 0 : break
+                     if want >= bufsize : n = src.readinto(buf)
+                     else               : n = src.readinto(view[:want])
+                  if not n : break
+                  chunk = view[:n] if n < bufsize else view
+                  if write  : write(chunk)
+                  if update : update(bytes(chunk))
+                  rw_length += n
+                  if hasher :
+                     hasher.update(buf, n)
+                     buf = hasher.buffer()
+    finally :
+            if hasher : hasher.finish()
+
+    return rw_length
+
+# sum_file : feed length bytes (up to the end when 0) of path at offset to sumalgo
+
+def sum_file(sumalgo, path, offset=0, length=0, bufsize=8192):
+    with open(path,'rb') as fp :
+         if offset != 0 : fp.seek(offset,0)
+         return readinto_copy(fp, None, sumalgo, length, bufsize)
+
 # =========================================
 # sr_proto : one place for throttle, onfly checksum, buffer io timeout
+#
+# iotime is the deadline of each network read or write : the protocols
+# set it as their socket (or channel) timeout, no signal is involved.
 # =========================================
 
 class sr_proto():
@@ -121,6 +234,11 @@ class sr_proto():
         self.data_checksum = None
         self.fpos      = 0
 
+        # resumed downloads : validator of the source (http ETag...) and the one expected
+
+        self.validator = None
+        self.if_range  = None
+
         self.bufsize   = self.parent.bufsize
         self.kbytes_ps = self.parent.kbytes_ps
         self.bytes_ps  = self.kbytes_ps * 1024
@@ -227,18 +345,20 @@ class sr_proto():
         self.tbytes   = 0.0
         self.tbegin   = nowflt()
 
+        # nothing to transform or throttle : copy through one buffer
+
+        if not self.parent.on_data_list and not self.kbytes_ps and hasattr(src,'readinto') :
+           return self.readinto_write(src, dst, length)
 
         # length = 0, transfer entire remote file to local file
 
         if length == 0 :
            while True :
-                 if self.iotime: alarm_set(self.iotime)
                  chunk = src.read(self.bufsize)
                  if chunk :
                     new_chunk = self.__on_data__(chunk)
                     dst.write(new_chunk)
                     rw_length += len(chunk)
-                 alarm_cancel()
                  if not chunk : break
                  if self.sumalgo  : self.sumalgo.update(chunk)
                  if self.kbytes_ps: self.throttle(chunk)
@@ -253,13 +373,11 @@ class sr_proto():
 
         i  = 0
         while i < nc :
-              if self.iotime : alarm_set(self.iotime)
               chunk = src.read(self.bufsize)
               if chunk :
                  new_chunk = self.__on_data__(chunk)
                  rw_length += len(new_chunk)
                  dst.write(new_chunk)
-              alarm_cancel()
               if not chunk : break
               if self.sumalgo  : self.sumalgo.update(chunk)
               if self.kbytes_ps: self.throttle(chunk)
@@ -268,18 +386,20 @@ class sr_proto():
         # remaining
 
         if r > 0 :
-           if self.iotime : alarm_set(self.iotime)
            chunk = src.read(r)
            if chunk :
               new_chunk = self.__on_data__(chunk)
               rw_length += len(new_chunk)
               dst.write(new_chunk)
-           alarm_cancel()
            if self.sumalgo  : self.sumalgo.update(chunk)
            if self.kbytes_ps: self.throttle(chunk)
 
         return rw_length
 
+    # readinto_write : read_write without a new bytes object per chunk (see readinto_copy)
+    def readinto_write(self, src, dst, length=0):
+        return readinto_copy(src, dst, self.sumalgo, length, self.bufsize)
+
     # read_writelocal
     def read_writelocal(self, src_path, src, local_file, local_offset=0, length=0):
         #self.logger.debug("sr_proto read_writelocal")
@@ -352,7 +472,6 @@ class sr_proto():
 
     # throttle
     def throttle(self,buf) :
-        self.logger.debug("sr_proto throttle")
         self.tbytes = self.tbytes + len(buf)
         span  = self.tbytes / self.bytes_ps
         rspan = nowflt() - self.tbegin
@@ -366,14 +485,11 @@ class sr_proto():
     def write_chunk(self,chunk):
         if self.chunk_iow : self.chunk_iow.write(chunk)
         self.rw_length += len(chunk)
-        alarm_cancel()
         if self.sumalgo  : self.sumalgo.update(chunk)
         if self.kbytes_ps: self.throttle(chunk)
-        if self.iotime   : alarm_set(self.iotime)
 
     # write_chunk_end
     def write_chunk_end(self):
-        alarm_cancel()
         self.chunk_iow = None
         return self.rw_length
 
@@ -383,7 +499,6 @@ class sr_proto():
         self.tbytes    = 0.0
         self.tbegin    = nowflt()
         self.rw_length = 0
-        if self.iotime : alarm_set(self.iotime)
 
 # =========================================
 # sr_transport : one place for upload/download common stuff
@@ -421,12 +536,14 @@ class sr_transport():
 
         new_dir     = msg.new_dir
         new_file    = msg.new_file
+        sidecar     = None
 
-        try:    curdir = os.getcwd()
-        except: curdir = None
+        # registered do_get plugins expect new_file relative to new_dir (the instance's
+        # current directory), the builtin protocols work with full paths, so that
+        # downloads can run in transfer workers.
 
-        if curdir != new_dir:
-           os.chdir(new_dir)
+        if self.scheme in parent.do_gets : local_dir = ''
+        else                             : local_dir = new_dir + os.sep
 
         try :
                 parent.destination = msg.baseurl
@@ -471,39 +588,32 @@ class sr_transport():
 
                 proto.set_sumalgo(msg.sumalgo)
 
+                new_path = local_dir + new_file
+
                 if parent.inflight == None or msg.partflg == 'i' :
-                   proto.set_path(new_file)
-                   self.get(remote_file,new_file,remote_offset,msg.local_offset,msg.length)
+                   proto.set_path(new_path)
+                   self.get(remote_file,new_path,remote_offset,msg.local_offset,msg.length)
                    msg.onfly_checksum = proto.get_sumstr()
 
-                elif type(parent.inflight) == str :
-                   if parent.inflight == '.' :
-                       new_lock = '.' + new_file
-                       proto.set_path(new_lock)
-                       self.get(remote_file,new_lock,remote_offset,msg.local_offset,msg.length)
-                       if os.path.isfile(new_file) : os.remove(new_file)
-                       msg.onfly_checksum = proto.get_sumstr()
-                       os.rename(new_lock, new_file)
-                    
-                   elif parent.inflight[-1] == '/' :
+                elif type(parent.inflight) == str and self.inflight_path(local_dir, new_file) :
+                   if parent.inflight[-1] == '/' :
                        try :  
-                              os.mkdir(parent.inflight)
-                              os.chmod(parent.inflight,parent.chmod_dir)
+                              os.mkdir(local_dir + parent.inflight)
+                              os.chmod(local_dir + parent.inflight,parent.chmod_dir)
                        except:pass
-                       new_lock  = parent.inflight + new_file
-                       proto.set_path(new_lock)
-                       self.get(remote_file,new_lock,remote_offset,msg.local_offset,msg.length)
-                       if os.path.isfile(new_file) : os.remove(new_file)
-                       msg.onfly_checksum = proto.get_sumstr()
-                       os.rename(new_lock, new_file)
-
-                   elif parent.inflight[0] == '.' :
-                       new_lock  = new_file + parent.inflight
-                       proto.set_path(new_lock)
-                       self.get(remote_file,new_lock,remote_offset,msg.local_offset,msg.length)
-                       if os.path.isfile(new_file) : os.remove(new_file)
-                       msg.onfly_checksum = proto.get_sumstr()
-                       os.rename(new_lock, new_file)
+                   new_lock = self.inflight_path(local_dir, new_file)
+                   sidecar  = self.resume_path(local_dir, new_file)
+                   proto.set_path(new_lock)
+                   offset   = self.resume_offset(proto, new_lock, sidecar)
+                   if offset > 0 :
+                      if not self.get_resumed(proto, remote_file, new_lock, sidecar, offset) :
+                         return False
+                   else :
+                      self.get(remote_file,new_lock,remote_offset,msg.local_offset,msg.length)
+                      msg.onfly_checksum = proto.get_sumstr()
+                   if os.path.isfile(new_path) : os.remove(new_path)
+                   os.rename(new_lock, new_path)
+                   if os.path.isfile(sidecar) : os.remove(sidecar)
 
                 else:
                     self.logger.error('inflight setting: %s, not for remote.' % parent.inflight )
@@ -516,7 +626,7 @@ class sr_transport():
                    msg.set_parts(partflg='1',chunksize=proto.fpos)
     
                 # fix permission 
-                self.set_local_file_attributes(new_file,msg)
+                self.set_local_file_attributes(new_path,msg)
 
                 msg.report_publish(201,'Downloaded')
     
@@ -530,14 +640,16 @@ class sr_transport():
 
         except:
                 #closing on problem
+                validator = getattr(self.proto, 'validator', None)
                 try    : self.close()
                 except : pass
     
                 msg.logger.error("Download failed 3 %s" % urlstr)
                 msg.logger.debug('Exception details: ', exc_info=True)
                 msg.report_publish(499,'%s download failed' % self.scheme)
-                if os.path.isfile(new_lock) :
+                if os.path.isfile(new_lock) and not self.resume_keep(new_lock, sidecar, validator) :
                     os.remove(new_lock)
+                    if sidecar and os.path.isfile(sidecar) : os.remove(sidecar)
                 return False
         return True
 
@@ -561,6 +673,132 @@ class sr_transport():
               self.logger.debug("sr_util/get ok is None executing this do_get %s" % do_get)
         self.proto.get(remote_file, local_file, remote_offset, local_offset, length)
 
+    # get_resumed : get the rest of remote_file after the offset bytes kept in new_lock.
+    #               the sum of the whole file is computed once the download is done,
+    #               and must be the announced one, otherwise nothing is kept.
+    def get_resumed(self, proto, remote_file, new_lock, sidecar, offset):
+        msg     = self.parent.msg
+        sumalgo = msg.sumalgo
+
+        self.logger.info("%s_transport resuming %s at %d of %d" % (self.scheme,new_lock,offset,msg.length))
+
+        proto.set_sumalgo(None)
+        proto.if_range = self.resume_validator
+        try     : self.get(remote_file,new_lock,offset,offset,msg.length-offset)
+        finally :
+                  proto.if_range = None
+                  proto.set_sumalgo(sumalgo)
+
+        if sumalgo :
+           sumalgo.set_path(remote_file)
+           if sumalgo.reads_data() : sum_file(sumalgo, new_lock, 0, 0, self.parent.bufsize)
+           proto.checksum      = sumalgo.get_value()
+           proto.data_checksum = proto.checksum
+
+        msg.onfly_checksum = proto.get_sumstr()
+
+        if sumalgo and sumalgo.reads_data() and msg.onfly_checksum != msg.sumstr :
+           self.logger.error("%s_transport resumed %s checksum %s differs from %s, discarded" % \
+                            (self.scheme,new_lock,msg.onfly_checksum,msg.sumstr))
+           msg.report_publish(499,'%s resumed download checksum differs' % self.scheme)
+           for path in [ new_lock, sidecar ] :
+               if os.path.isfile(path) : os.remove(path)
+           self.resume_state = None
+           return False
+
+        return True
+
+    # inflight_path : the file written while downloading new_file, according to inflight
+    def inflight_path(self, local_dir, new_file):
+        inflight = self.parent.inflight
+
+        if inflight == '.'     : return local_dir + '.' + new_file
+        if inflight[-1] == '/' : return local_dir + inflight + new_file
+        if inflight[0] == '.'  : return local_dir + new_file + inflight
+
+        return None
+
+    # resume_offset : with resume, how many bytes of new_lock were kept from an interrupted
+    #                 download of the same source, as recorded in its sidecar file.
+    #                 otherwise both are removed, and the download starts from 0.
+    #                 without resume (or not resumable), nothing is looked at nor removed.
+    def resume_offset(self, proto, new_lock, sidecar):
+        msg    = self.parent.msg
+        offset = 0
+
+        self.resume_state     = self.resume_source(proto)
+        self.resume_validator = None
+
+        if not self.resume_state : return 0
+
+        try :
+                if os.path.isfile(sidecar) :
+                   with open(sidecar) as fp : state = json_codec.loads(fp.read())
+                   validator = state.pop('validator', None)
+                   offset    = state.pop('bytes', 0)
+                   if state == self.resume_state :
+                      offset = min(offset, os.path.getsize(new_lock), msg.length - 1)
+                      self.resume_validator = validator
+                   else :
+                      offset = 0
+        except :
+                self.logger.debug("%s_transport unusable resume state %s" % (self.scheme,sidecar))
+                self.logger.debug('Exception details: ', exc_info=True)
+                offset = 0
+
+        if offset > 0 : return offset
+
+        for path in [ new_lock, sidecar ] :
+            if os.path.isfile(path) : os.remove(path)
+
+        return 0
+
+    # resume_keep : on failure, with resume, keep new_lock and record in its sidecar
+    #               what is needed to resume : bytes written and validators of the source.
+    def resume_keep(self, new_lock, sidecar, validator):
+        state = getattr(self, 'resume_state', None)
+        self.resume_state = None
+
+        if not state or not sidecar : return False
+
+        try :
+                # the source changed since the bytes kept were written
+                if self.resume_validator and validator != self.resume_validator : return False
+
+                state = dict(state)
+                state['bytes']     = os.path.getsize(new_lock)
+                state['validator'] = validator
+                if state['bytes'] == 0 : return False
+                with open(sidecar,'w') as fp : fp.write(json_codec.dumps(state))
+                self.logger.info("%s_transport keeping %d bytes of %s to resume" % (self.scheme,state['bytes'],new_lock))
+                return True
+        except :
+                self.logger.error("%s_transport unable to keep %s to resume" % (self.scheme,new_lock))
+                self.logger.debug('Exception details: ', exc_info=True)
+
+        return False
+
+    # resume_path : the sidecar file of new_file, hidden, with a suffix no download would have
+    def resume_path(self, local_dir, new_file):
+        return local_dir + '.' + new_file + '.sr_resume'
+
+    # resume_source : what identifies the source of a resumable download, None if it is not.
+    #                 only whole files, by builtin protocols able to read from an offset
+    #                 (http(s) Range, sftp seek, ftp REST in binary mode), without on_data.
+    def resume_source(self, proto):
+        parent = self.parent
+        msg    = parent.msg
+
+        if not parent.resume or parent.on_data_list : return None
+        if self.scheme in parent.do_gets             : return None
+        if msg.partflg != '1' or not msg.length      : return None
+        if not hasattr(proto,'seek') and not getattr(proto,'binary',False) : return None
+
+        return { 'url'   : msg.baseurl + '/' + msg.relpath,
+                 'size'  : msg.length,
+                 'mtime' : msg.headers.get('mtime'),
+                 'sum'   : msg.headers.get('sum', msg.headers.get('integrity')) }
+
     # generalized put...
     def put(self, local_file, remote_file, local_offset=0, remote_offset=0, length=0 ):
         msg = self.parent.msg
@@ -589,18 +827,11 @@ class sr_transport():
         self.logger.debug("%s_transport send %s %s" % (self.scheme,msg.new_dir, msg.new_file) )
 
         local_path = msg.relpath
-        local_dir  = os.path.dirname( local_path).replace('\\','/')
-        local_file = os.path.basename(local_path).replace('\\','/')
+        local_file = local_path.replace('\\','/')
         new_dir    = msg.new_dir.replace('\\','/')
         new_file   = msg.new_file.replace('\\','/')
         new_lock   = None
 
-        try:    curdir = os.getcwd()
-        except: curdir = None
-
-        if curdir != local_dir:
-           os.chdir(local_dir)
-
         try :
 
                 proto = self.proto
@@ -928,6 +1159,12 @@ def nowflt():
     return timestr2flt(nowstr())
 
 
+# wallflt : the clock, for intervals (commit and batch timers, settling), without the string round trip of nowflt
+
+def wallflt():
+    return time.time()
+
+
 def nowstr():
     return timeflt2str(time.time())
 
@@ -955,3 +1192,143 @@ def timev2tov3str(s):
         return s
     else:
         return s[0:8] + 'T' + s[8:]
+
+
+class sr_json_codec():
+    """
+    json encoding and decoding of messages (bodies, retry and save files), through
+    json_codec.loads( text ) and json_codec.dumps( obj, sort_keys=False ).
+    the codec is chosen with the json_codec option :
+
+    json   : python's json module (default)
+    orjson : orjson, when it can be imported
+    ujson  : ujson, when it can be imported
+
+    the others decode the same, and encode equivalent json, only more compact
+    (no spaces after separators, non ascii characters not escaped).
+    """
+
+    def __init__(self):
+        self.codecs = { 'json' : ( json.loads, self.json_dumps ) }
+
+        try:
+            import orjson
+            self.orjson = orjson
+            self.codecs['orjson'] = ( orjson.loads, self.orjson_dumps )
+        except ImportError:
+            pass
+
+        try:
+            import ujson
+            self.ujson = ujson
+            self.codecs['ujson'] = ( ujson.loads, self.ujson_dumps )
+        except ImportError:
+            pass
+
+        self.set('json')
+
+    def set(self, name):
+        """ use the named codec, return False when it is not available """
+        if name not in self.codecs : return False
+        self.name = name
+        self.loads, self.dumps = self.codecs[name]
+        return True
+
+    def json_dumps(self, obj, sort_keys=False):
+        return json.dumps(obj, sort_keys=sort_keys)
+
+    def orjson_dumps(self, obj, sort_keys=False):
+        return self.orjson.dumps(obj, option=self.orjson.OPT_SORT_KEYS if sort_keys else 0).decode('utf-8')
+
+    def ujson_dumps(self, obj, sort_keys=False):
+        return self.ujson.dumps(obj, sort_keys=sort_keys, ensure_ascii=False, escape_forward_slashes=False)
+
+json_codec = sr_json_codec()
+
+
+"""
+  message body decoding, shared by sr_message (from_amqplib) and sr_retry (msgToEntry)
+
+  v02      : the body is the notice "pubtime baseurl relpath ...", headers are amqp headers.
+  early v03: the body is a json list [ pubtime, baseurl, relpath, headers ]
+  v03      : the body is a json object, the headers, with pubTime, baseUrl, relPath.
+             its integrity is turned into a v02 sum header, and its blocks (or size) into
+             a v02 parts header, in place, so the rest of the code only deals with v02 headers.
+"""
+
+# the builtin methods, the sum plugins loaded (sr_config/load_sums) add theirs
+
+sum_algo_v2tov3 = { "a":"arbitrary", "d":"md5", "s":"sha512", "n":"md5name", "0":"random", "L":"link", "R":"remove", "z":"cod" }
+sum_algo_v3tov2 = { v: k for k, v in sum_algo_v2tov3.items() }
+
+def sum_algo_register(sumflg, method):
+    """ map a v02 sum letter to a v03 integrity method, and back """
+    if not method : return
+    sum_algo_v2tov3[sumflg] = method
+    sum_algo_v3tov2[method] = sumflg
+
+parts_v3tov2    = { 'inplace': 'i', 'partitioned': 'p' }
+
+
+def decode_body(body, headers=None):
+    """
+       return ( pubtime, baseurl, relpath, headers, notice ) for an amqp message body,
+       headers are the amqp headers of a v02 message.
+    """
+    if type(body) == bytes:
+       body = body.decode('utf-8')
+
+    if body[0] == '{' :
+       headers = json_codec.loads(body)
+       pubtime = headers[ "pubTime" ]
+       baseurl = headers[ "baseUrl" ]
+       relpath = headers[ "relPath" ]
+
+       if "integrity" in headers :
+          headers[ "sum" ] = integrity_v3tov2( headers.pop("integrity") )
+
+       if 'blocks' in headers :
+          blocks = headers.pop('blocks')
+          headers.pop('size', None)
+          headers['parts'] = '%s,%d,%d,%d,%d' % ( parts_v3tov2[blocks['method']], int(blocks['size']),
+                                int(blocks['count']), int(blocks['remainder']), int(blocks['number']) )
+       elif 'size' in headers :
+          headers['parts'] = '1,%d,1,0,0' % int(headers.pop('size'))
+
+       return pubtime, baseurl, relpath, headers, "%s %s %s" % ( pubtime, baseurl, relpath )
+
+    if body[0] == '[' :
+       pubtime, baseurl, relpath, headers = json_codec.loads(body)
+       return pubtime, baseurl, relpath, headers, "%s %s %s" % ( pubtime, baseurl, relpath )
+
+    pubtime, baseurl, relpath = body.split(' ')[0:3]
+    return pubtime, baseurl, relpath, headers, body
+
+
+def integrity_v3tov2(integrity):
+    """ return the v02 sum string for a v03 integrity header """
+    if type(integrity) is str:
+       integrity = json_codec.loads(integrity)
+
+    sa = sum_algo_v3tov2[ integrity[ "method" ] ]
+
+    if sa == '0' :
+       sv = integrity[ "value" ]
+    elif sa == 'z' :
+       sv = sum_algo_v3tov2[ integrity[ "value" ] ]
+    else:
+       sv = binascii.a2b_base64( integrity[ "value" ] ).hex()
+
+    return sa + ',' + sv
+
+
+def sum_v2tov3(sumstr):
+    """ return the v03 integrity header for a v02 sum string """
+    sm = sum_algo_v2tov3[ sumstr[0] ]
+    if sm == 'random' :
+       sv = sumstr[2:]
+    elif sm == 'cod' :
+       sv = sum_algo_v2tov3[ sumstr[2:] ]
+    else:
+       sv = base64.encodebytes( bytes.fromhex(sumstr[2:]) ).decode('utf-8').strip()
+    return { "method": sm, "value": sv }
@@ -55,10 +55,10 @@ class sr_winnow(sr_subscribe):
         if self.post_exchange == None and self.post_exchange_suffix :
            self.post_exchange = 'xs_%s' % self.post_broker.username + self.post_exchange_suffix
 
-        # we cannot have more than one instance since we 
-        # need to work with a single cache.
+        # instances need to work with a single cache: 
+        # either shared by all, or one per instance with exchange_split.
 
-        if ( self.nbr_instances > 1 ) and not self.exchange_split :
+        if ( self.nbr_instances > 1 ) and not self.exchange_split and self.cache_store != 'shared' :
             self.logger.debug("instance > 1, forcing exchange_split on, modifying exchange setting.")
             self.exchange_split = True
 
@@ -22,5 +22,8 @@ class checksum_0(sr_checksum):
       def registered_as(self):
           return '0'
 
+      def registered_as_v03(self):
+          return 'random'
+
 self.add_sumalgo=checksum_0()
 
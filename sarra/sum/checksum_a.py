@@ -25,5 +25,8 @@ class checksum_a(sr_checksum):
       def registered_as(self):
           return 'a'
 
+      def registered_as_v03(self):
+          return 'arbitrary'
+
 self.add_sumalgo=checksum_a()
 
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+try :
+         from sr_checksum       import *
+except :
+         from sarra.sr_checksum import *
+
+# ===================================
+# checksum_b class
+# ===================================
+
+class checksum_b(sr_checksum):
+      """
+      The BLAKE2b algorithm (IETF RFC 7693) to checksum the entire file, which is called 'b'.
+      a 512 bit digest like SHA512; tools/bench_hash.py measured it at the speed of MD5 and SHA512.
+      """
+
+      def get_value(self):
+          return self.filehash.hexdigest()
+
+      def registered_as(self):
+          return 'b'
+
+      def registered_as_v03(self):
+          return 'blake2b'
+
+      def set_path(self,path):
+          # plugins are executed by sr_config, their own imports are not visible in methods
+          from hashlib import blake2b
+          self.filehash = blake2b()
+
+      def update(self,chunk):
+          if type(chunk) == str : self.filehash.update(bytes(chunk,'utf-8'))
+          else                  : self.filehash.update(chunk)
+
+self.add_sumalgo=checksum_b()
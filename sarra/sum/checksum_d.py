@@ -22,12 +22,15 @@ class checksum_d(sr_checksum):
       def registered_as(self):
           return 'd'
 
+      def registered_as_v03(self):
+          return 'md5'
+
       def set_path(self,path):
           self.filehash = md5()
 
       def update(self,chunk):
-          if type(chunk) == bytes : self.filehash.update(chunk)
-          else                    : self.filehash.update(bytes(chunk,'utf-8'))
+          if type(chunk) == str : self.filehash.update(bytes(chunk,'utf-8'))
+          else                  : self.filehash.update(chunk)
 
 
 self.add_sumalgo=checksum_d()
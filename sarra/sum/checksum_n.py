@@ -22,6 +22,9 @@ class checksum_n(sr_checksum):
       def registered_as(self):
           return 'n'
 
+      def registered_as_v03(self):
+          return 'md5name'
+
       def set_path(self,path):
           filename   = os.path.basename(path)
           self.value = md5(bytes(filename,'utf-8')).hexdigest()
@@ -22,12 +22,15 @@ class checksum_s(sr_checksum):
       def registered_as(self):
           return 's'
 
+      def registered_as_v03(self):
+          return 'sha512'
+
       def set_path(self,path):
           self.filehash = sha512()
 
       def update(self,chunk):
-          if type(chunk) == bytes : self.filehash.update(chunk)
-          else                    : self.filehash.update(bytes(chunk,'utf-8'))
+          if type(chunk) == str : self.filehash.update(bytes(chunk,'utf-8'))
+          else                  : self.filehash.update(chunk)
 
 self.add_sumalgo=checksum_s()
 
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+try :
+         from sr_checksum       import *
+except :
+         from sarra.sr_checksum import *
+
+try :
+         import xxhash
+         available = hasattr(xxhash,'xxh3_128')
+except :
+         available = False
+
+# ===================================
+# checksum_x class
+# ===================================
+
+class checksum_x(sr_checksum):
+      """
+      The XXH3 128 bits algorithm (non cryptographic, from the xxhash package)
+      to checksum the entire file, which is called 'x'. It detects corruption only :
+      it does not protect against deliberate changes.
+      """
+
+      def get_value(self):
+          return self.filehash.hexdigest()
+
+      def registered_as(self):
+          return 'x'
+
+      def registered_as_v03(self):
+          return 'xxh128'
+
+      def set_path(self,path):
+          # plugins are executed by sr_config, their own imports are not visible in methods
+          from xxhash import xxh3_128
+          self.filehash = xxh3_128()
+
+      def update(self,chunk):
+          if type(chunk) == str : self.filehash.update(bytes(chunk,'utf-8'))
+          else                  : self.filehash.update(chunk)
+
+# without the xxhash package, the algorithm is not available
+if available : self.add_sumalgo=checksum_x()
+else         : self.add_sumalgo=False
@@ -14,6 +14,7 @@ import re
 import json
 import logging
 import os
+import socket
 import unittest
 import urllib.parse
 
@@ -496,6 +497,89 @@ class ConsumerCase(HostConnectBaseCase):
         self.assertEqual(expected, hc.mock_calls, self.hc_assert_msg)
         self.assertErrorInLog(re.escape(errmsg))
 
+    def test_ack__batch(self, hc, chan):
+        # Prepare test
+        hc.use_pika = False
+        self.consumer.hc = hc
+        self.consumer.channel = chan
+        self.consumer.set_batch(3)
+        self.consumer.delivered.extend([Mock(), Mock(), Mock()])
+        # Execute test
+        for tag in range(1, 4):
+            self.consumer.ack(Mock(delivery_tag=tag))
+        # Evaluate results
+        expected = [call.basic_ack(3, multiple=True)]
+        self.assertEqual(expected, chan.mock_calls, self.amqp_channel_assert_msg)
+        self.assertIsNone(self.consumer.unacked_tag)
+        self.assertNoErrorInLog()
+
+    def test_ack__batch_delivered_empty(self, hc, chan):
+        # Prepare test
+        hc.use_pika = False
+        self.consumer.hc = hc
+        self.consumer.channel = chan
+        self.consumer.set_batch(10)
+        # Execute test
+        self.consumer.ack(Mock(delivery_tag=1))
+        # Evaluate results
+        expected = [call.basic_ack(1, multiple=True)]
+        self.assertEqual(expected, chan.mock_calls, self.amqp_channel_assert_msg)
+        self.assertNoErrorInLog()
+
+    def test_consume__batch(self, hc, chan):
+        # Prepare test
+        hc.use_pika = False
+        self.consumer.hc = hc
+        self.consumer.channel = chan
+        self.consumer.set_batch(2)
+        msgs = [Mock(), Mock(), Mock()]
+
+        def drain_events(timeout=None):
+            if not msgs:
+                raise socket.timeout()
+            self.consumer.delivered.append(msgs.pop(0))
+
+        hc.connection.drain_events.side_effect = drain_events
+        # Execute test
+        first = self.consumer.consume(self.qname)
+        second = self.consumer.consume(self.qname)
+        # Evaluate results
+        self.assertEqual(1, chan.basic_consume.call_count)
+        self.assertEqual(2, hc.connection.drain_events.call_count)
+        self.assertFalse(first.isRetry)
+        self.assertIsNot(first, second)
+        self.assertEqual(0, len(self.consumer.delivered))
+        self.assertNoErrorInLog()
+
+    def test_consume__batch_timeout(self, hc, chan):
+        # Prepare test
+        hc.use_pika = False
+        self.consumer.hc = hc
+        self.consumer.channel = chan
+        self.consumer.set_batch(2)
+        hc.connection.drain_events.side_effect = socket.timeout()
+        # Execute test
+        msg = self.consumer.consume(self.qname)
+        # Evaluate results
+        self.assertIsNone(msg)
+        self.assertEqual([], hc.reconnect.mock_calls, self.hc_assert_msg)
+        self.assertNoErrorInLog()
+
+    def test_build__batch_reset(self, hc, chan):
+        # Prepare test
+        hc.new_channel.return_value = chan
+        self.consumer.hc = hc
+        self.consumer.set_batch(2)
+        self.consumer.consumer_tag = 'ctag'
+        self.consumer.delivered.append(Mock())
+        self.consumer.unacked_tag = 5
+        # Execute test
+        self.consumer.build()
+        # Evaluate results
+        self.assertIsNone(self.consumer.consumer_tag)
+        self.assertEqual(0, len(self.consumer.delivered))
+        self.assertIsNone(self.consumer.unacked_tag)
+
 
 @patch('amqp.Channel')
 @patch('sarra.sr_amqp.HostConnect')
@@ -561,6 +645,82 @@ class PublisherCase(HostConnectBaseCase):
         self.assertTrue(ok)
         self.assertNoErrorInLog()
 
+    def test_build__confirm_window(self, hc, chan):
+        # Prepare test
+        hc.use_pika = False
+        hc.use_amqp = True
+        hc.new_channel.return_value = chan
+        self.pub.hc = hc
+        self.pub.set_confirm_window(10)
+        self.pub.unconfirmed[1] = (self.xname, self.pubkey, 'lost', None, 0)
+        # Execute test
+        self.pub.build()
+        # Evaluate results
+        self.assertIn(call.confirm_select(), chan.mock_calls, self.amqp_channel_assert_msg)
+        self.assertNotIn(call.tx_select(), chan.mock_calls, self.amqp_channel_assert_msg)
+        self.assertEqual([(self.xname, self.pubkey, 'lost', None, 0)], self.pub.get_failed())
+        self.assertEqual(0, len(self.pub.unconfirmed))
+        self.assertNoErrorInLog()
+
+    def test_publish__confirm_window(self, hc, chan):
+        # Prepare test
+        hc.use_pika = False
+        hc.use_amqp = True
+        self.pub.hc = hc
+        self.pub.channel = chan
+        self.pub.set_confirm_window(2)
+        hc.connection.drain_events.side_effect = lambda timeout=None: self.pub.__on_ack__(1, False)
+        # Execute test
+        for i in range(3):
+            ok = self.pub.publish(self.xname, self.pubkey, 'message{}'.format(i), None)
+        # Evaluate results
+        self.assertTrue(ok)
+        self.assertEqual(3, chan.basic_publish.call_count)
+        self.assertEqual(0, chan.tx_commit.call_count)
+        self.assertEqual(1, hc.connection.drain_events.call_count)
+        self.assertEqual([2, 3], list(self.pub.unconfirmed.keys()))
+        self.assertNoErrorInLog()
+
+    def test_publish__confirm_nack(self, hc, chan):
+        # Prepare test
+        hc.use_pika = False
+        hc.use_amqp = True
+        self.pub.hc = hc
+        self.pub.channel = chan
+        self.pub.set_confirm_window(10)
+        for i in range(3):
+            self.pub.publish(self.xname, self.pubkey, 'message{}'.format(i), {'h': str(i)})
+        # Execute test
+        self.pub.__on_ack__(1, False)
+        self.pub.__on_nack__(3, True)
+        # Evaluate results
+        expected = [(self.xname, self.pubkey, 'message1', {'h': '1'}, 0),
+                    (self.xname, self.pubkey, 'message2', {'h': '2'}, 0)]
+        self.assertEqual(expected, self.pub.get_failed())
+        self.assertEqual([], self.pub.failed)
+        self.assertEqual(0, len(self.pub.unconfirmed))
+
+    def test_publish__tx_batch(self, hc, chan):
+        # Prepare test
+        hc.use_pika = False
+        hc.use_amqp = True
+        self.pub.hc = hc
+        self.pub.channel = chan
+        self.pub.set_tx_batch(3, 3600)
+        # Execute test
+        for i in range(7):
+            self.pub.publish(self.xname, self.pubkey, 'message{}'.format(i), None)
+        # Evaluate results
+        self.assertEqual(7, chan.basic_publish.call_count)
+        self.assertEqual(2, chan.tx_commit.call_count)
+        self.assertEqual(1, len(self.pub.uncommitted))
+        # Execute test
+        self.pub.flush(force=True)
+        # Evaluate results
+        self.assertEqual(3, chan.tx_commit.call_count)
+        self.assertEqual(0, len(self.pub.uncommitted))
+        self.assertNoErrorInLog()
+
     def test_restore_clear(self, hc, chan):
         # Prepare test
         self.pub.channel = chan
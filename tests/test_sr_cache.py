@@ -18,6 +18,7 @@ Code contributed by:
 """
 import logging
 import os
+import tempfile
 import time
 import unittest
 from enum import Enum, auto
@@ -25,7 +26,7 @@ from io import TextIOWrapper
 from unittest import TestCase
 from unittest.mock import patch, call, Mock, DEFAULT
 
-from sarra.sr_cache import sr_cache
+from sarra.sr_cache import sr_cache, sr_cache_sqlite, sr_cache_compact, sr_cache_shared
 
 KEY_FMT = "{}_{}"
 ENTRY_KEY_FMT = "{}*{}"
@@ -386,28 +387,49 @@ class SrCacheCase(TestCase):
         self.assertEqual(expected, mocked_os.mock_calls, ASSERT_MOCK_CALLS)
 
     @patch('sarra.sr_cache.os')
-    @patch('builtins.open')
     @patch('_io.TextIOWrapper')
-    def test_delete_path(self, fp, mocked_open, mocked_os):
+    def test_delete_path(self, fp, mocked_os):
         # Prepare test
-        mocked_open.return_value = fp
         self.key = self.test_delete_path.__name__
-        self.cache.clean = Mock()
-        fisrt_fp = Mock(spec=TextIOWrapper)
-        self.cache.fp = fisrt_fp
+        self.other_key = KEY_FMT.format(self.key, 'other')
+        self.cache.fp = fp
         self.cache.cache_dict[self.key] = self.cache_entry
-        self.cache.count = 1
+        self.cache.cache_dict[self.other_key] = {ENTRY_KEY_FMT.format('other', self.part): self.now}
+        self.cache.count = 2
         # Execute test
-        self.cache.delete_path(self.path)
+        self.cache.delete_path(self.file)
 
         # Evaluate internal state (attribute values)
-        self.assertNotEqual(fisrt_fp, fp, ASSERT_INVALID_VALUE_FMT.format('sr_cache.fp'))
-        self.assertEqual(mocked_open(), self.cache.fp, ASSERT_INVALID_VALUE_FMT.format('sr_cache.fp'))
+        expected = {self.other_key: {ENTRY_KEY_FMT.format('other', self.part): self.now}}
+        self.assertDictEqual(expected, self.cache.cache_dict, ASSERT_INVALID_VALUE_FMT.format('sr_cache.cache_dict'))
+        self.assertEqual(1, self.cache.count, ASSERT_INVALID_VALUE_FMT.format('sr_cache.count'))
 
         # Evaluate external calls
-        expected = [call.unlink(self.cache.cache_file)]
-        self.assertIn(expected, mocked_os.mock_calls, ASSERT_MOCK_CALLS)
-        self.cache.clean.assert_called_once_with(persist=True, delpath=self.path)
+        expected = [call.write(WRITE_LINE_FMT.format(self.key, 0, self.file, self.part))]
+        self.assertEqual(expected, fp.mock_calls, ASSERT_MOCK_CALLS)
+        self.assertEqual([], mocked_os.mock_calls, ASSERT_MOCK_CALLS)
+
+    @patch('_io.TextIOWrapper')
+    @patch('sarra.sr_cache.nowflt')
+    def test_clean_expired(self, nowflt, fp):
+        # Prepare test
+        self.key = self.test_clean_expired.__name__
+        self.then_key = KEY_FMT.format(self.key, 'expired')
+        self.cache.fp = fp
+        self.cache.expire = 50
+        nowflt.return_value = self.now - 100
+        self.cache.check(self.then_key, self.path, self.part)
+        self.cache.check(self.key, self.path, self.part)
+        nowflt.return_value = self.now
+        self.cache.check(self.key, self.path, self.part)
+        # Execute test
+        self.cache.clean_expired()
+
+        # Evaluate results
+        expected = {self.key: self.cache_entry}
+        self.assertDictEqual(expected, self.cache.cache_dict, ASSERT_INVALID_VALUE_FMT.format('sr_cache.cache_dict'))
+        self.assertEqual([(self.now, self.key, self.entry_key)], self.cache.expiry,
+                         ASSERT_INVALID_VALUE_FMT.format('sr_cache.expiry'))
 
     @patch('sarra.sr_cache.os')
     @patch('builtins.open')
@@ -461,6 +483,29 @@ class SrCacheCase(TestCase):
         # TODO add expire entry
         self.assertEqual(expected, self.cache.cache_dict, ASSERT_INVALID_VALUE_FMT.format('sr_cache.cache_dict'))
 
+    @patch('sarra.sr_cache.nowflt')
+    @patch('sarra.sr_cache.os')
+    @patch('builtins.open')
+    @patch('_io.TextIOWrapper')
+    def test_load__removed(self, fp, mocked_open, mocked_os, nowflt):
+        # Prepare test
+        self.key = self.test_load__removed.__name__
+        nowflt.return_value = self.now
+        mocked_open.return_value = fp
+        fp.readline.return_value = ''
+        fp.readline.side_effect = [
+            WRITE_LINE_FMT.format(self.key, self.now - 10, self.file, self.part),
+            WRITE_LINE_FMT.format(self.key, 0, self.file, self.part),
+            DEFAULT
+        ]
+        self.cache.expire = 100
+        # Execute test
+        self.cache.load()
+
+        # Evaluate results
+        self.assertEqual({}, self.cache.cache_dict, ASSERT_INVALID_VALUE_FMT.format('sr_cache.cache_dict'))
+        self.assertEqual(0, self.cache.count, ASSERT_INVALID_VALUE_FMT.format('sr_cache.count'))
+
     def test_open(self):
         # Prepare test
         self.user_cache_dir = os.path.join('user', 'cache', 'dir')
@@ -499,15 +544,223 @@ class SrCacheCase(TestCase):
         nowflt.return_value = self.now
         self.cache.last_expire = self.now - 1000
         self.cache.expire = 100
-        self.cache.clean = Mock()
+        self.cache.clean_expired = Mock()
         # Execute test
         self.cache.check_expire()
 
         # Evaluate results
-        self.cache.clean.assert_called()
+        self.cache.clean_expired.assert_called()
         self.assertEqual(self.now, self.cache.last_expire, ASSERT_INVALID_VALUE_FMT.format('sr_cache.last_expire'))
 
 
+class SrCacheSqliteCase(TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.user_cache_dir = self.tmpdir.name
+        self.instance = 1
+        self.file = f"{__class__.__name__}.file"
+        self.part = 'p,457,2,24,1'
+        self.path = os.path.join(__class__.__name__, self.file)
+
+        self.logger = logging.getLogger(__class__.__name__)
+        self.cache_basis = CacheBasis.name.name
+        self.cache_store = 'sqlite'
+        self.cache_stat = False
+        self.caching = 10
+        self.cache = sr_cache(self)
+
+    def tearDown(self) -> None:
+        if self.cache.db: self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_init(self):
+        self.assertIsInstance(self.cache, sr_cache_sqlite, ASSERT_INVALID_VALUE_FMT.format('sr_cache'))
+
+    def test_check(self):
+        # Prepare test
+        self.cache.open()
+        # Execute test
+        first = self.cache.check('key', self.path, self.part)
+        second = self.cache.check('key', self.path, self.part)
+
+        # Evaluate results
+        self.assertTrue(first, ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_cache.check'))
+        self.assertFalse(second, ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_cache.check'))
+        self.assertEqual(ENTRY_KEY_FMT.format(self.file, self.part), self.cache.cache_hit)
+
+    @patch('sarra.sr_cache.nowflt')
+    def test_clean(self, nowflt):
+        # Prepare test
+        now = time.time()
+        nowflt.return_value = now
+        self.cache.open()
+        self.cache.check('old', self.path, self.part)
+        nowflt.return_value = now + self.caching / 2
+        self.cache.check('new', self.path, self.part)
+        self.cache.check('deleted', os.path.join('dir', 'deleted'), self.part)
+        nowflt.return_value = now + self.caching + 1
+        # Execute test
+        self.cache.delete_path('deleted')
+
+        # Evaluate results
+        self.assertEqual(1, self.cache.count, ASSERT_INVALID_VALUE_FMT.format('sr_cache.count'))
+        self.assertIsNotNone(self.cache.lookup('new'), ASSERT_INVALID_VALUE_FMT.format('sr_cache'))
+        self.assertIsNone(self.cache.lookup('old'), ASSERT_INVALID_VALUE_FMT.format('sr_cache'))
+
+    def test_count(self):
+        # Prepare test
+        self.cache.open()
+        self.cache.check('key', self.path, self.part)
+        self.cache.check('key', self.path, self.part)
+        self.cache.check('other', self.path, self.part)
+        self.cache.close()
+        # Execute test
+        self.cache.open()
+        self.cache.check('new', self.path, self.part)
+        self.cache.delete_path(self.file)
+
+        # Evaluate results
+        self.assertEqual(0, self.cache.count, ASSERT_INVALID_VALUE_FMT.format('sr_cache.count'))
+        self.cache.check('key', self.path, self.part)
+        self.cache.save()
+        self.assertEqual(1, self.cache.count, ASSERT_INVALID_VALUE_FMT.format('sr_cache.count'))
+
+    def test_open__import_text(self):
+        # Prepare test
+        text_file = os.path.join(self.user_cache_dir, 'recent_files_001.cache')
+        with open(text_file, 'w') as fp:
+            fp.write(WRITE_LINE_FMT.format('key', time.time(), self.file, self.part))
+        # Execute test
+        self.cache.open()
+
+        # Evaluate results
+        self.assertFalse(os.path.exists(text_file), ASSERT_INVALID_VALUE_FMT.format('sr_cache.cache_file'))
+        self.assertEqual(1, self.cache.count, ASSERT_INVALID_VALUE_FMT.format('sr_cache.count'))
+        self.assertFalse(self.cache.check('key', self.path, self.part))
+
+    def test_close__unlink(self):
+        # Prepare test
+        self.cache.open()
+        self.cache.check('key', self.path, self.part)
+        # Execute test
+        self.cache.close(unlink=True)
+
+        # Evaluate results
+        self.assertEqual([], os.listdir(self.user_cache_dir), ASSERT_INVALID_VALUE_FMT.format('sr_cache.cache_file'))
+
+    def test_open__shared(self):
+        # Prepare test
+        self.cache_store = 'shared'
+        self.cache = sr_cache(self)
+        other = sr_cache(self)
+        self.cache.open()
+        other.open()
+        # Execute test
+        first = self.cache.check('key', self.path, self.part)
+        second = other.check('key', self.path, self.part)
+        other.close()
+
+        # Evaluate results
+        self.assertIsInstance(self.cache, sr_cache_shared, ASSERT_INVALID_VALUE_FMT.format('sr_cache'))
+        self.assertTrue(self.cache.cache_file.endswith('recent_files_shared.sqlite'))
+        self.assertTrue(first, ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_cache.check'))
+        self.assertFalse(second, ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_cache.check'))
+
+
+class SrCacheCompactCase(TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.user_cache_dir = self.tmpdir.name
+        self.instance = 1
+        self.file = f"{__class__.__name__}.file"
+        self.part = 'p,457,2,24,1'
+        self.path = os.path.join(__class__.__name__, self.file)
+
+        self.logger = logging.getLogger(__class__.__name__)
+        self.cache_basis = CacheBasis.path.name
+        self.cache_store = 'compact'
+        self.caching = 10
+        self.cache = sr_cache(self)
+        self.cache.open()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_check(self):
+        # Execute test
+        first = self.cache.check('key', self.path, self.part)
+        second = self.cache.check('key', self.path, self.part)
+        other = self.cache.check('key', self.path, 'p,457,2,24,0')
+        resized = self.cache.check('key', self.path, 'p,457,3,2,1')
+
+        # Evaluate results
+        self.assertTrue(first, ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_cache.check'))
+        self.assertFalse(second, ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_cache.check'))
+        self.assertTrue(other, ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_cache.check'))
+        self.assertFalse(resized, ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_cache.check'))
+        self.assertEqual(2, self.cache.count, ASSERT_INVALID_VALUE_FMT.format('sr_cache.count'))
+
+    def test_check__grow(self):
+        # Prepare test
+        self.cache.reset(8)
+        # Execute test
+        for i in range(100):
+            self.cache.check('key', self.path, 'p,457,2,24,{}'.format(i))
+
+        # Evaluate results
+        self.assertEqual(100, self.cache.count, ASSERT_INVALID_VALUE_FMT.format('sr_cache.count'))
+        self.assertEqual(256, self.cache.capacity, ASSERT_INVALID_VALUE_FMT.format('sr_cache.capacity'))
+        for i in range(100):
+            self.assertFalse(self.cache.check('key', self.path, 'p,457,2,24,{}'.format(i)))
+
+    @patch('sarra.sr_cache.nowflt')
+    def test_clean_expired(self, nowflt):
+        # Prepare test
+        nowflt.return_value = self.now = time.time()
+        self.cache.check('old', self.path, self.part)
+        self.cache.check('new', self.path, self.part)
+        nowflt.return_value = self.now + self.caching / 2
+        self.cache.check('new', self.path, self.part)
+        nowflt.return_value = self.now + self.caching + 1
+        # Execute test
+        self.cache.clean_expired()
+
+        # Evaluate results
+        self.assertEqual(1, self.cache.count, ASSERT_INVALID_VALUE_FMT.format('sr_cache.count'))
+        self.assertFalse(self.cache.check('new', self.path, self.part))
+        self.assertTrue(self.cache.check('old', self.path, self.part))
+
+    def test_delete_path(self):
+        # Prepare test
+        self.cache.check('key', self.path, self.part)
+        self.cache.check('other', 'other', self.part)
+        # Execute test
+        self.cache.delete_path(self.path)
+
+        # Evaluate results
+        self.assertEqual(1, self.cache.count, ASSERT_INVALID_VALUE_FMT.format('sr_cache.count'))
+        self.assertTrue(self.cache.check('key', self.path, self.part))
+
+    def test_save(self):
+        # Prepare test
+        self.cache.check('key', self.path, self.part)
+        # Execute test
+        self.cache.save()
+        self.cache.close()
+        self.cache.open()
+
+        # Evaluate results
+        self.assertEqual(1, self.cache.count, ASSERT_INVALID_VALUE_FMT.format('sr_cache.count'))
+        self.assertFalse(self.cache.check('key', self.path, self.part))
+
+    def test_memory(self):
+        # Execute test
+        result = self.cache.memory()
+
+        # Evaluate results
+        self.assertEqual(self.cache.capacity * 24, result, ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_cache.memory'))
+
+
 class CacheBasis(Enum):
     name = auto()
     path = auto()
@@ -521,6 +774,8 @@ def suite():
     """
     sr_amqp_suite = unittest.TestSuite()
     sr_amqp_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(SrCacheCase))
+    sr_amqp_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(SrCacheSqliteCase))
+    sr_amqp_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(SrCacheCompactCase))
     return sr_amqp_suite
 
 
@@ -0,0 +1,119 @@
+""" This file is part of metpx-sarracenia.
+
+metpx-sarracenia
+Documentation: https://github.com/MetPX/sarracenia
+
+test_sr_events.py : test utility tool used for sr_events
+
+Code contributed by:
+ Benoit Lapointe - Shared Services Canada
+"""
+import logging
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+
+from sarra.sr_events import sr_events
+
+ASSERT_INVALID_RETURNED_VALUE_FMT = "{} returned a misleading value"
+ASSERT_INVALID_VALUE_FMT = "{} is invalid"
+
+
+class SrEventsCase(TestCase):
+    def setUp(self) -> None:
+        self.logger = logging.getLogger(__class__.__name__)
+        self.events = sr_events(self)
+
+    def ready(self):
+        return [(event, src, dst) for path, event, src, dst, seq in self.events.ready()]
+
+    def test_add__modify_storm(self):
+        self.events.add('create', '/d/a')
+        for i in range(10):
+            self.events.add('modify', '/d/a')
+        self.events.add('modify', '/d/b')
+
+        self.assertEqual([('create', '/d/a', None), ('modify', '/d/b', None)], self.ready(),
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('ready'))
+        self.assertEqual((12, 10), (self.events.received, self.events.coalesced),
+                         ASSERT_INVALID_VALUE_FMT.format('counters'))
+
+    def test_add__delete_wins(self):
+        self.events.add('create', '/d/a')
+        self.events.add('delete', '/d/a')
+        self.assertEqual([('delete', '/d/a', None)], self.ready(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('ready'))
+
+        self.events.add('create', '/d/a')
+        self.assertEqual([('create', '/d/a', None)], self.ready(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('ready'))
+
+    def test_add__moves(self):
+        self.events.add('modify', '/d/a')
+        self.events.add('modify', '/d/c')
+        self.events.add('move', '/d/a', '/d/b')
+        self.events.add('move', '/d/b', '/d/c')
+        self.events.add('modify', '/d/c')
+
+        self.assertEqual([('move', '/d/a', '/d/c')], self.ready(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('ready'))
+
+        self.events.add('delete', '/d/c')
+        self.assertEqual([('delete', '/d/a', None), ('delete', '/d/c', None)], self.ready(),
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('ready'))
+
+    def test_remove__event_since(self):
+        self.events.add('create', '/d/a')
+        path, event, src, dst, seq = self.events.ready()[0]
+        self.events.add('modify', '/d/a')
+        self.events.remove(path, seq)
+
+        self.assertEqual([('create', '/d/a', None)], self.ready(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('ready'))
+
+        path, event, src, dst, seq = self.events.ready()[0]
+        self.events.remove(path, seq)
+        self.assertEqual(0, len(self.events), ASSERT_INVALID_VALUE_FMT.format('events'))
+
+    @patch('sarra.sr_events.wallflt')
+    def test_ready__settle(self, wallflt):
+        self.events.settle = 5
+        wallflt.return_value = 100
+        self.events.add('create', '/d/a')
+        self.events.add('create', '/d/b')
+        wallflt.return_value = 103
+        self.events.add('modify', '/d/a')
+
+        wallflt.return_value = 104
+        self.assertEqual([], self.ready(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('ready'))
+        wallflt.return_value = 105
+        self.assertEqual([('create', '/d/b', None)], self.ready(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('ready'))
+        wallflt.return_value = 108
+        self.assertEqual([('create', '/d/b', None), ('create', '/d/a', None)], self.ready(),
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('ready'))
+
+    def test_add__overflow(self):
+        self.events.maxlen = 2
+        self.events.add('create', '/d/a')
+        self.events.add('create', '/d/b')
+        self.events.add('modify', '/d/a')
+        self.assertFalse(self.events.take_overflow(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('take_overflow'))
+
+        self.events.add('create', '/d/c')
+        self.assertTrue(self.events.full(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('full'))
+        self.assertEqual(1, self.events.dropped, ASSERT_INVALID_VALUE_FMT.format('dropped'))
+        self.assertTrue(self.events.take_overflow(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('take_overflow'))
+        self.assertFalse(self.events.take_overflow(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('take_overflow'))
+        self.assertEqual([('create', '/d/b', None), ('create', '/d/a', None)], self.ready(),
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('ready'))
+
+
+def suite():
+    """ Create the test suite that include all sr_events test cases
+
+    :return: sr_events test suite
+    """
+    sr_events_suite = unittest.TestSuite()
+    sr_events_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(SrEventsCase))
+    return sr_events_suite
+
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
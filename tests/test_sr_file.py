@@ -0,0 +1,115 @@
+""" This file is part of metpx-sarracenia.
+
+metpx-sarracenia
+Documentation: https://github.com/MetPX/sarracenia
+
+test_sr_file.py : test utility tool used for sr_file
+
+Code contributed by:
+ Benoit Lapointe - Shared Services Canada
+"""
+import errno
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+
+from sarra.sr_checksum import sr_checksum
+from sarra.sr_file import file_copy, file_sum
+
+ASSERT_INVALID_RETURNED_VALUE_FMT = "{} returned a misleading value"
+ASSERT_INVALID_VALUE_FMT = "{} is invalid"
+
+DATA = bytes(range(256)) * 400
+
+
+class Md5(sr_checksum):
+    def set_path(self, path):
+        self.filehash = hashlib.md5()
+
+    def get_value(self):
+        return self.filehash.hexdigest()
+
+    def update(self, chunk):
+        self.filehash.update(chunk)
+
+
+class Names(sr_checksum):
+    pass
+
+
+def unsupported(*args):
+    raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+
+class FileCopyCase(TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmpdir.name, 'src')
+        self.dst = os.path.join(self.tmpdir.name, 'dst')
+        with open(self.src, 'wb') as f:
+            f.write(DATA)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def copy(self, src_offset=0, dst_offset=0, length=0, content=b''):
+        with open(self.dst, 'wb') as f:
+            f.write(content)
+        with open(self.src, 'rb') as src, open(self.dst, 'r+b') as dst:
+            copied = file_copy(src, dst, src_offset, dst_offset, length, 1000)
+        with open(self.dst, 'rb') as f:
+            return copied, f.read()
+
+    def test_file_copy__whole(self):
+        self.assertEqual((len(DATA), DATA), self.copy(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('file_copy'))
+
+    def test_file_copy__range(self):
+        content = b'x' * 3000
+
+        expected = content[:2000] + DATA[500:1500] + content[3000:]
+        self.assertEqual((1000, expected), self.copy(500, 2000, 1000, content),
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('file_copy'))
+
+    def test_file_copy__fallbacks(self):
+        content = b'x' * 3000
+        expected = content[:2000] + DATA[500:5500]
+
+        with patch('os.copy_file_range', unsupported, create=True):
+            self.assertEqual((5000, expected), self.copy(500, 2000, 5000, content),
+                             ASSERT_INVALID_RETURNED_VALUE_FMT.format('file_copy'))
+            with patch('os.sendfile', unsupported, create=True):
+                self.assertEqual((5000, expected), self.copy(500, 2000, 5000, content),
+                                 ASSERT_INVALID_RETURNED_VALUE_FMT.format('file_copy'))
+
+    def test_file_sum(self):
+        chk = Md5()
+        chk.set_path(self.src)
+
+        file_sum(chk, self.src, 100, 2500, 1000)
+
+        self.assertEqual(hashlib.md5(DATA[100:2600]).hexdigest(), chk.get_value(),
+                         ASSERT_INVALID_VALUE_FMT.format('checksum'))
+
+    def test_file_sum__data_not_needed(self):
+        with patch('builtins.open') as opened:
+            file_sum(Names(), self.src, 0, len(DATA), 1000)
+
+        opened.assert_not_called()
+
+
+def suite():
+    """ Create the test suite that include all sr_file test cases
+
+    :return: sr_file test suite
+    """
+    sr_file_suite = unittest.TestSuite()
+    sr_file_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(FileCopyCase))
+    return sr_file_suite
+
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
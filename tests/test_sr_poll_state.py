@@ -0,0 +1,129 @@
+""" This file is part of metpx-sarracenia.
+
+metpx-sarracenia
+Documentation: https://github.com/MetPX/sarracenia
+
+test_sr_poll_state.py : test utility tool used for sr_poll_state
+
+Code contributed by:
+ Benoit Lapointe - Shared Services Canada
+"""
+import datetime
+import logging
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from sarra.sr_poll import sr_poll
+from sarra.sr_poll_state import sr_poll_state
+
+ASSERT_INVALID_RETURNED_VALUE_FMT = "{} returned a misleading value"
+ASSERT_INVALID_VALUE_FMT = "{} is invalid"
+
+LS_LINE_FMT = "-rw-r--r-- 1 user group {} {} {}"
+
+
+def ls_line(name, size):
+    return LS_LINE_FMT.format(size, datetime.datetime.now().strftime('%b %d %H:%M'), name)
+
+
+class Poller(sr_poll):
+    """ sr_poll without configuration, broker nor destination """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__class__.__name__)
+        self.file_time_limit = 60 * 24 * 3600
+        self.ls_file_index = -1
+
+
+class SrPollStateCase(TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.logger = logging.getLogger(__class__.__name__)
+        self.user_cache_dir = self.tmpdir.name
+        self.instance = 1
+        self.state = sr_poll_state(self)
+        self.state.open()
+
+    def tearDown(self) -> None:
+        self.state.close()
+        self.tmpdir.cleanup()
+
+    def fps(self, ls):
+        return dict((name, self.state.fingerprint(line)) for name, line in ls.items())
+
+    def test_open__default_file(self):
+        self.assertEqual(os.path.join(self.user_cache_dir, 'poll_state_001.sqlite'), self.state.state_file,
+                         ASSERT_INVALID_VALUE_FMT.format('state_file'))
+
+    def test_update__changed_entries(self):
+        ls = {'a': ls_line('a', 1), 'b': ls_line('b', 2), 'c': ls_line('c', 3)}
+        self.state.update('ls_data', {}, self.fps(ls))
+        self.state.update('ls_data_sub', {}, self.fps({'a': ls_line('a', 9)}))
+        self.assertEqual(self.fps(ls), self.state.load('ls_data'), ASSERT_INVALID_RETURNED_VALUE_FMT.format('load'))
+
+        ls.pop('a')
+        ls['b'] = ls_line('b', 20)
+        ls['d'] = ls_line('d', 4)
+        self.state.update('ls_data', self.state.load('ls_data'), self.fps(ls))
+
+        self.assertEqual(self.fps(ls), self.state.load('ls_data'), ASSERT_INVALID_RETURNED_VALUE_FMT.format('load'))
+        self.assertEqual(4, self.state.count(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('count'))
+
+    def test_migrate__ls_files(self):
+        poller = Poller()
+        ls = {'a': ls_line('a', 1), 'b c': ls_line('b c', 2)}
+        lspath = os.path.join(self.user_cache_dir, 'ls_data')
+        with open(lspath, 'w') as fp:
+            for name in sorted(ls):
+                fp.write(ls[name] + '\n')
+
+        poller.ls_file_index = 8
+        self.state.migrate(self.user_cache_dir, poller.load_ls_file)
+
+        self.assertFalse(os.path.exists(lspath), ASSERT_INVALID_VALUE_FMT.format('ls file'))
+        self.assertEqual(self.fps(ls), self.state.load('ls_data'), ASSERT_INVALID_RETURNED_VALUE_FMT.format('load'))
+        self.assertTrue(os.path.exists(self.state.state_file), ASSERT_INVALID_VALUE_FMT.format('state_file'))
+
+    def test_reset__after_migrate(self):
+        poller = Poller()
+        lspath = os.path.join(self.user_cache_dir, 'ls_data')
+        with open(lspath, 'w') as fp:
+            fp.write(ls_line('a', 1) + '\n')
+
+        self.state.migrate(self.user_cache_dir, poller.load_ls_file)
+        self.state.reset()
+        self.state.migrate(self.user_cache_dir, poller.load_ls_file)
+
+        self.assertFalse(os.path.exists(lspath), ASSERT_INVALID_VALUE_FMT.format('ls file'))
+        self.assertEqual(0, self.state.count(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('count'))
+
+    def test_differ_ls_file(self):
+        poller = Poller()
+        old = {'a': ls_line('a', 1), 'b': ls_line('b', 2), 'gone': ls_line('gone', 3)}
+        ls = dict(old)
+        ls.pop('gone')
+        ls['b'] = ls_line('b', 20)
+        ls['c'] = ls_line('c', 3)
+
+        filelst, desclst = poller.differ_ls_file(ls, self.fps(ls), self.fps(old))
+
+        self.assertEqual(['b', 'c'], filelst, ASSERT_INVALID_RETURNED_VALUE_FMT.format('differ_ls_file'))
+        self.assertEqual({'b': ls['b'], 'c': ls['c']}, desclst,
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('differ_ls_file'))
+
+
+def suite():
+    """ Create the test suite that include all sr_poll_state test cases
+
+    :return: sr_poll_state test suite
+    """
+    sr_poll_state_suite = unittest.TestSuite()
+    sr_poll_state_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(SrPollStateCase))
+    return sr_poll_state_suite
+
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
@@ -0,0 +1,194 @@
+""" This file is part of metpx-sarracenia.
+
+metpx-sarracenia
+Documentation: https://github.com/MetPX/sarracenia
+
+test_sr_polling.py : test utility tool used for sr_polling
+
+Code contributed by:
+ Benoit Lapointe - Shared Services Canada
+"""
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+from sarra.sr_polling import sr_polling
+
+ASSERT_INVALID_RETURNED_VALUE_FMT = "{} returned a misleading value"
+ASSERT_INVALID_VALUE_FMT = "{} is invalid"
+
+
+class SrPollingCase(TestCase):
+    def setUp(self) -> None:
+        self.logger = logging.getLogger(__class__.__name__)
+        self.sleep = 1
+        self.polling_rescan = 3600
+        self.walk_threads = 1
+        self.events = []
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        os.makedirs(self.path('d/s'))
+        self.write('d/a', b'a')
+        self.write('d/s/b', b'b')
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def on_add(self, event, src, dst):
+        self.events.append((event, src, dst))
+
+    def path(self, relpath):
+        return self.root + '/' + relpath
+
+    def write(self, relpath, data, mode='wb'):
+        with open(self.path(relpath), mode) as fp:
+            fp.write(data)
+
+    def observer(self):
+        observer = sr_polling(self)
+        observer.schedule(None, self.root)
+        return observer
+
+    def poll(self, observer):
+        self.events = []
+        observer.poll()
+        return self.events
+
+    def test_poll__files(self):
+        for walk_threads in [1, 4]:
+            with self.subTest(walk_threads=walk_threads):
+                self.walk_threads = walk_threads
+                observer = self.observer()
+                self.assertEqual([], self.poll(observer), ASSERT_INVALID_VALUE_FMT.format('events'))
+
+                self.write('d/c', b'c')
+                self.assertEqual([('create', self.path('d/c'), None)], self.poll(observer),
+                                 ASSERT_INVALID_VALUE_FMT.format('events'))
+                self.assertEqual([], self.poll(observer), ASSERT_INVALID_VALUE_FMT.format('events'))
+
+                self.write('d/c', b'cc', 'ab')
+                self.assertEqual([('modify', self.path('d/c'), None)], self.poll(observer),
+                                 ASSERT_INVALID_VALUE_FMT.format('events'))
+
+                os.rename(self.path('d/c'), self.path('d/s/e'))
+                self.assertEqual([('move', self.path('d/c'), self.path('d/s/e'))], self.poll(observer),
+                                 ASSERT_INVALID_VALUE_FMT.format('events'))
+
+                os.unlink(self.path('d/s/e'))
+                self.assertEqual([('delete', self.path('d/s/e'), None)], self.poll(observer),
+                                 ASSERT_INVALID_VALUE_FMT.format('events'))
+                observer.stop()
+
+    def test_poll__directories(self):
+        observer = self.observer()
+
+        os.makedirs(self.path('n/m'))
+        self.write('n/m/f', b'f')
+        self.assertEqual([('create', self.path('n'), None), ('create', self.path('n/m'), None),
+                          ('create', self.path('n/m/f'), None)], self.poll(observer),
+                         ASSERT_INVALID_VALUE_FMT.format('events'))
+
+        os.rename(self.path('n'), self.path('d/n'))
+        self.assertEqual([('move', self.path('n'), self.path('d/n'))], self.poll(observer),
+                         ASSERT_INVALID_VALUE_FMT.format('events'))
+
+        self.write('d/n/m/g', b'g')
+        self.assertEqual([('create', self.path('d/n/m/g'), None)], self.poll(observer),
+                         ASSERT_INVALID_VALUE_FMT.format('events'))
+
+        shutil.rmtree(self.path('d'))
+        self.assertEqual(sorted([('delete', self.path(p), None) for p in
+                                 ['d', 'd/a', 'd/s', 'd/s/b', 'd/n', 'd/n/m', 'd/n/m/f', 'd/n/m/g']]),
+                         sorted(self.poll(observer)), ASSERT_INVALID_VALUE_FMT.format('events'))
+        self.assertEqual([self.root], list(observer.dirs), ASSERT_INVALID_VALUE_FMT.format('dirs'))
+
+    def replace(self, relpath, make):
+        """ replace relpath by what make creates, made while it still exists (no inode reused) """
+        with tempfile.TemporaryDirectory() as outside:
+            make(os.path.join(outside, 'new'))
+            shutil.rmtree(self.path(relpath))
+            os.rename(os.path.join(outside, 'new'), self.path(relpath))
+
+    def make_tree(self, path):
+        os.makedirs(os.path.join(path, 't'))
+        with open(os.path.join(path, 'b'), 'wb') as fp:
+            fp.write(b'b')
+
+    def make_file(self, path):
+        with open(path, 'wb') as fp:
+            fp.write(b's')
+
+    def test_poll__directory_replaced(self):
+        observer = self.observer()
+
+        self.replace('d/s', self.make_tree)
+        self.assertEqual([('delete', self.path('d/s/b'), None), ('delete', self.path('d/s'), None),
+                          ('create', self.path('d/s'), None), ('create', self.path('d/s/b'), None),
+                          ('create', self.path('d/s/t'), None)], self.poll(observer),
+                         ASSERT_INVALID_VALUE_FMT.format('events'))
+
+        self.replace('d/s', self.make_file)
+        self.assertEqual([('delete', self.path('d/s/t'), None), ('delete', self.path('d/s/b'), None), ('delete', self.path('d/s'), None),
+                          ('create', self.path('d/s'), None)], self.poll(observer),
+                         ASSERT_INVALID_VALUE_FMT.format('events'))
+        self.assertEqual([self.root, self.path('d')], sorted(observer.dirs), ASSERT_INVALID_VALUE_FMT.format('dirs'))
+
+    def test_poll__directory_moved_over(self):
+        observer = self.observer()
+        os.makedirs(self.path('n'))
+        self.write('n/f', b'f')
+        self.poll(observer)
+
+        shutil.rmtree(self.path('d/s'))
+        os.rename(self.path('n'), self.path('d/s'))
+        self.assertEqual([('move', self.path('n'), self.path('d/s'))], self.poll(observer),
+                         ASSERT_INVALID_VALUE_FMT.format('events'))
+        self.assertEqual({'f'}, set(observer.dirs[self.path('d/s')][1]), ASSERT_INVALID_VALUE_FMT.format('dirs'))
+
+        self.write('d/s/g', b'g')
+        self.assertEqual([('create', self.path('d/s/g'), None)], self.poll(observer),
+                         ASSERT_INVALID_VALUE_FMT.format('events'))
+
+    def test_poll__modified_in_place(self):
+        self.polling_rescan = 0
+        os.utime(self.path('d/s/b'), (1000000000, 1000000000))
+        observer = self.observer()
+        self.assertEqual([], self.poll(observer), ASSERT_INVALID_VALUE_FMT.format('events'))
+
+        self.write('d/s/b', b'bb', 'ab')
+        os.utime(self.path('d/s/b'), (1000000001, 1000000001))
+        self.assertEqual([('modify', self.path('d/s/b'), None)], self.poll(observer),
+                         ASSERT_INVALID_VALUE_FMT.format('events'))
+        self.assertEqual([], self.poll(observer), ASSERT_INVALID_VALUE_FMT.format('events'))
+
+    def test_poll__rescan(self):
+        os.utime(self.path('d/a'), (1000000000, 1000000000))
+        observer = self.observer()
+
+        self.write('d/a', b'aa', 'ab')
+        os.utime(self.path('d/a'), (1000000001, 1000000001))
+        self.assertEqual([], self.poll(observer), ASSERT_INVALID_VALUE_FMT.format('events'))
+
+        observer.rescan = 1
+        observer.last_full = 0
+        self.assertEqual([('modify', self.path('d/a'), None)], self.poll(observer),
+                         ASSERT_INVALID_VALUE_FMT.format('events'))
+
+
+def suite():
+    """ Create the test suite that include all sr_polling test cases
+
+    :return: sr_polling test suite
+    """
+    sr_polling_suite = unittest.TestSuite()
+    sr_polling_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(SrPollingCase))
+    return sr_polling_suite
+
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
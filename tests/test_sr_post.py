@@ -0,0 +1,176 @@
+""" This file is part of metpx-sarracenia.
+
+metpx-sarracenia
+Documentation: https://github.com/MetPX/sarracenia
+
+test_sr_post.py : test utility tool used for sr_post
+
+Code contributed by:
+ Benoit Lapointe - Shared Services Canada
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import TestCase
+
+from sarra.sr_post import sr_post
+from sarra.sr_snapshot import sr_snapshot
+
+ASSERT_INVALID_RETURNED_VALUE_FMT = "{} returned a misleading value"
+ASSERT_INVALID_VALUE_FMT = "{} is invalid"
+
+
+class Walker(sr_post):
+    """ sr_post without configuration nor broker, recording what it posts """
+
+    def __init__(self, walk_threads):
+        self.logger = logging.getLogger(__class__.__name__)
+        self.realpath_post = False
+        self.follow_symlinks = False
+        self.walk_threads = walk_threads
+        self.snapshot = None
+        self.posted = []
+
+    def post_file(self, path, lstat):
+        self.posted.append(('file', path, lstat.st_size))
+        if self.snapshot:
+            self.snapshot.record(path, lstat, None)
+
+    def post_link(self, path):
+        self.posted.append(('link', path))
+
+
+def listdir_walk(src, posted):
+    """ the order of the walk done with os.listdir """
+    for x in os.listdir(src):
+        path = src + '/' + x
+        if os.path.isdir(path):
+            listdir_walk(path, posted)
+        elif os.path.exists(path) and os.path.islink(path):
+            posted.append(('link', path))
+        elif os.path.exists(path):
+            posted.append(('file', path, os.stat(path).st_size))
+
+
+class TreeCase(TestCase):
+    """ a tree of 5 directories of 3 subdirectories of 4 files, a link and a broken link """
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        for d in range(5):
+            for sd in range(3):
+                os.makedirs(os.path.join(self.root, 'd%d' % d, 's%d' % sd))
+                for f in range(4):
+                    with open(os.path.join(self.root, 'd%d' % d, 's%d' % sd, 'f%d' % f), 'wb') as fp:
+                        fp.write(b'x' * (d * 100 + sd * 10 + f))
+            with open(os.path.join(self.root, 'd%d' % d, 'top'), 'wb') as fp:
+                fp.write(b'y')
+        os.symlink(os.path.join(self.root, 'd0', 'top'), os.path.join(self.root, 'link'))
+        os.symlink(os.path.join(self.root, 'missing'), os.path.join(self.root, 'broken'))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+
+class WalkCase(TreeCase):
+    def walk(self, walk_threads):
+        walker = Walker(walk_threads)
+        walker.walk(self.root)
+        return walker.posted
+
+    def test_walk__listdir_order(self):
+        expected = []
+        listdir_walk(self.root, expected)
+
+        for walk_threads in [1, 4]:
+            with self.subTest(walk_threads=walk_threads):
+                self.assertEqual(expected, self.walk(walk_threads), ASSERT_INVALID_VALUE_FMT.format('posts'))
+
+    def test_walk__vanished(self):
+        walker = Walker(1)
+        post_file = walker.post_file
+
+        def vanishing(path, lstat):
+            if path.endswith('f1'):
+                raise FileNotFoundError(path)
+            post_file(path, lstat)
+
+        walker.post_file = vanishing
+        walker.walk(self.root)
+
+        self.assertEqual(5 * 3 * 3 + 5 + 1, len(walker.posted), ASSERT_INVALID_VALUE_FMT.format('posts'))
+
+
+class SnapshotCase(TreeCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.walker = Walker(1)
+        self.walker.snapshot = sr_snapshot(self.walker)
+        self.walker.snapshot.open(os.path.join(self.root, os.pardir, os.path.basename(self.root) + '.sqlite'))
+
+    def tearDown(self) -> None:
+        self.walker.snapshot.close()
+        os.unlink(self.walker.snapshot.snapshot_file)
+        super().tearDown()
+
+    def walk_again(self):
+        self.walker.posted = []
+        self.walker.walk(self.root)
+        return self.walker.posted
+
+    def test_walk__unchanged_skipped(self):
+        self.assertEqual(5 * 3 * 4 + 5 + 1, len(self.walk_again()), ASSERT_INVALID_VALUE_FMT.format('posts'))
+        self.assertEqual(5 * 3 * 4 + 5, self.walker.snapshot.count(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('count'))
+        self.assertEqual([('link', os.path.join(self.root, 'link'))], self.walk_again(),
+                         ASSERT_INVALID_VALUE_FMT.format('posts'))
+
+    def test_walk__committed(self):
+        self.walk_again()
+
+        db = sqlite3.connect(self.walker.snapshot.snapshot_file)
+        self.assertEqual(5 * 3 * 4 + 5, db.execute("SELECT COUNT(*) FROM snapshot").fetchone()[0],
+                         ASSERT_INVALID_VALUE_FMT.format('snapshot_file'))
+        db.close()
+
+    def test_walk__changed_posted(self):
+        self.walk_again()
+        modified = os.path.join(self.root, 'd1', 's2', 'f3')
+        with open(modified, 'ab') as fp:
+            fp.write(b'z')
+        created = os.path.join(self.root, 'd4', 'new')
+        with open(created, 'wb') as fp:
+            fp.write(b'new')
+
+        posted = [p for p in self.walk_again() if p[0] == 'file']
+        self.assertEqual([('file', modified, 124), ('file', created, 3)], sorted(posted),
+                         ASSERT_INVALID_VALUE_FMT.format('posts'))
+
+    def test_delete__directory(self):
+        self.walk_again()
+        self.walker.snapshot.delete(os.path.join(self.root, 'd1'))
+        self.assertEqual(4 * (3 * 4 + 1), self.walker.snapshot.count(),
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('count'))
+
+        posted = [p for p in self.walk_again() if p[0] == 'file']
+        self.assertEqual(3 * 4 + 1, len(posted), ASSERT_INVALID_VALUE_FMT.format('posts'))
+        self.assertTrue(all(p[1].startswith(os.path.join(self.root, 'd1') + '/') for p in posted),
+                        ASSERT_INVALID_VALUE_FMT.format('posts'))
+
+
+def suite():
+    """ Create the test suite that include all sr_post test cases
+
+    :return: sr_post test suite
+    """
+    sr_post_suite = unittest.TestSuite()
+    sr_post_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(WalkCase))
+    sr_post_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(SnapshotCase))
+    return sr_post_suite
+
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
@@ -0,0 +1,195 @@
+""" This file is part of metpx-sarracenia.
+
+metpx-sarracenia
+Documentation: https://github.com/MetPX/sarracenia
+
+test_sr_retry.py : test utility tool used for sr_retry
+
+Code contributed by:
+ Benoit Lapointe - Shared Services Canada
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+
+from sarra.sr_retry import sr_retry, sr_retry_sqlite
+from sarra.sr_util import raw_message, timeflt2str
+
+ASSERT_INVALID_RETURNED_VALUE_FMT = "{} returned a misleading value"
+ASSERT_INVALID_VALUE_FMT = "{} is invalid"
+
+
+class SrRetrySqliteCase(TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.retry_path = os.path.join(self.tmpdir.name, 'sr_subscribe_test_01.retry')
+        self.retry_store = 'sqlite'
+        self.retry_ttl = None
+        self.retry_backoff_min = 10
+        self.retry_backoff_max = 100
+        self.destination = None
+        self.exchange = 'xpublic'
+        self.now = time.time()
+        self.logger = logging.getLogger(__class__.__name__)
+        self.retry = sr_retry(self)
+
+    def tearDown(self) -> None:
+        self.retry.close()
+        self.tmpdir.cleanup()
+
+    def message(self, i, pubtime=None):
+        message = raw_message(self.logger)
+        message.pubtime = timeflt2str(pubtime or self.now)
+        message.baseurl = "xyz://user@host"
+        message.relpath = '/my/path%.10d' % i
+        message.body = '%s %s %s' % (message.pubtime, message.baseurl, message.relpath)
+        message.delivery_info['exchange'] = self.exchange
+        message.delivery_info['routing_key'] = 'v02.post.my.path'
+        message.properties['application_headers'] = {'sum': 'd,%d' % i}
+        return message
+
+    def relpaths(self):
+        relpaths = []
+        while True:
+            message = self.retry.get()
+            if not message: return relpaths
+            relpaths.append(message.relpath)
+
+    def test_init__files_ignores_backoff(self):
+        self.retry_store = 'files'
+        with self.assertLogs(self.logger, 'WARNING') as logs:
+            retry = sr_retry(self)
+        retry.close()
+
+        self.assertNotIsInstance(retry, sr_retry_sqlite, ASSERT_INVALID_VALUE_FMT.format('sr_retry'))
+        self.assertIn('retry_store sqlite', logs.output[0], ASSERT_INVALID_VALUE_FMT.format('warning'))
+
+    def test_init(self):
+        self.assertIsInstance(self.retry, sr_retry_sqlite, ASSERT_INVALID_VALUE_FMT.format('sr_retry'))
+
+    @patch('sarra.sr_retry.nowflt')
+    def test_get__due(self, nowflt):
+        # Prepare test
+        nowflt.return_value = self.now
+        for i in range(3):
+            self.retry.add_msg_to_new_file(self.message(i))
+        # Execute test
+        before = self.relpaths()
+        nowflt.return_value = self.now + self.retry_backoff_min
+        due = self.relpaths()
+
+        # Evaluate results
+        self.assertEqual([], before, ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_retry.get'))
+        self.assertEqual(['/my/path%.10d' % i for i in range(3)], due,
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_retry.get'))
+
+    @patch('sarra.sr_retry.nowflt')
+    def test_get__backoff(self, nowflt):
+        # Prepare test
+        nowflt.return_value = self.now
+        self.retry.add_msg_to_new_file(self.message(0))
+        nowflt.return_value = self.now + self.retry_backoff_min
+        message = self.retry.get()
+        # Execute test
+        self.retry.add_msg_to_state_file(message)
+
+        # Evaluate results
+        due, attempts = self.retry.db.execute("SELECT due, attempts FROM retry").fetchone()
+        self.assertEqual(2, attempts, ASSERT_INVALID_VALUE_FMT.format('sr_retry attempts'))
+        self.assertEqual(self.now + 3 * self.retry_backoff_min, due, ASSERT_INVALID_VALUE_FMT.format('sr_retry due'))
+        nowflt.return_value = self.now + 3 * self.retry_backoff_min - 1
+        self.assertIsNone(self.retry.get(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_retry.get'))
+
+    @patch('sarra.sr_retry.nowflt')
+    def test_get__destination(self, nowflt):
+        # Prepare test
+        nowflt.return_value = self.now
+        self.retry.add_msg_to_new_file(self.message(0))
+        self.retry.add_msg_to_new_file(self.message(1))
+        self.retry.db.execute("UPDATE retry SET due = ?", (self.now,))
+        # Execute test
+        blocked = self.relpaths()
+
+        # Evaluate results
+        self.assertEqual([], blocked, ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_retry.get'))
+        dues = self.retry.db.execute("SELECT due FROM retry").fetchall()
+        self.assertEqual([(self.now + self.retry_backoff_min,)] * 2, dues, ASSERT_INVALID_VALUE_FMT.format('sr_retry due'))
+        self.retry.destination_worked(self.message(2))
+        self.assertEqual({}, self.retry.destinations, ASSERT_INVALID_VALUE_FMT.format('sr_retry.destinations'))
+
+    @patch('sarra.sr_retry.nowflt')
+    def test_add_msg_to_state_file__done(self, nowflt):
+        # Prepare test
+        nowflt.return_value = self.now
+        for i in range(3):
+            self.retry.add_msg_to_new_file(self.message(i))
+        nowflt.return_value = self.now + self.retry_backoff_min
+        # Execute test
+        self.retry.add_msg_to_state_file(self.message(2), done=True)
+
+        # Evaluate results
+        self.assertEqual(['/my/path%.10d' % i for i in range(2)], self.relpaths(),
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_retry.get'))
+
+    @patch('sarra.sr_retry.nowflt')
+    def test_on_heartbeat(self, nowflt):
+        # Prepare test
+        nowflt.return_value = self.now
+        self.retry.retry_ttl = 60 * 1000
+        self.retry.add_msg_to_new_file(self.message(0, self.now - 120))
+        self.retry.add_msg_to_new_file(self.message(1))
+        self.retry.add_msg_to_new_file(self.message(2))
+        nowflt.return_value = self.now + self.retry_backoff_min
+        self.retry.get()
+        # Execute test
+        self.retry.on_heartbeat(self)
+
+        # Evaluate results
+        keys = self.retry.db.execute("SELECT key FROM retry").fetchall()
+        key = 'xyz://user@host//my/path%.10d d,2 xyz://user@host//my/path%.10d' % (2, 2)
+        self.assertEqual([(key,)], keys, ASSERT_INVALID_VALUE_FMT.format('sr_retry.db'))
+
+    def test_open__import_files(self):
+        # Prepare test
+        files = sr_retry(self, 'files')
+        for i in range(3):
+            files.add_msg_to_new_file(self.message(i))
+        files.add_msg_to_state_file(self.message(0), done=True)
+        files.close()
+        self.assertTrue(os.path.exists(self.retry_path + '.new'))
+        # Execute test
+        self.retry.open()
+
+        # Evaluate results
+        self.assertFalse(os.path.exists(self.retry_path + '.new'), ASSERT_INVALID_VALUE_FMT.format('sr_retry.new_path'))
+        self.assertEqual(['/my/path%.10d' % i for i in range(1, 3)], self.relpaths(),
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_retry.get'))
+
+    def test_cleanup(self):
+        # Prepare test
+        self.retry.add_msg_to_new_file(self.message(0))
+        # Execute test
+        self.retry.cleanup()
+
+        # Evaluate results
+        self.assertEqual([], os.listdir(self.tmpdir.name), ASSERT_INVALID_VALUE_FMT.format('sr_retry.db_path'))
+
+
+def suite():
+    """ Create the test suite that include all sr_retry test cases
+
+    :return: sr_retry test suite
+    """
+    sr_retry_suite = unittest.TestSuite()
+    sr_retry_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(SrRetrySqliteCase))
+    return sr_retry_suite
+
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
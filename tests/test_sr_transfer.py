@@ -0,0 +1,261 @@
+""" This file is part of metpx-sarracenia.
+
+metpx-sarracenia
+Documentation: https://github.com/MetPX/sarracenia
+
+test_sr_transfer.py : test utility tool used for sr_transfer
+
+Code contributed by:
+ Benoit Lapointe - Shared Services Canada
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from unittest import TestCase
+from unittest.mock import Mock
+
+from sarra.sr_subscribe import sr_subscribe
+from sarra.sr_transfer import sr_transfer
+from sarra.sr_util import raw_message
+
+ASSERT_INVALID_RETURNED_VALUE_FMT = "{} returned a misleading value"
+ASSERT_INVALID_VALUE_FMT = "{} is invalid"
+
+
+class Message:
+    def __init__(self, urlstr):
+        self.urlstr = urlstr
+        self.url = urllib.parse.urlparse(urlstr)
+        self.headers = {}
+        self.sumalgo = None
+        self.reports = []
+        self.new_dir = os.getcwd()
+
+    def report_publish(self, code, message):
+        self.reports.append((code, message, threading.current_thread()))
+
+
+class Consumer:
+    def __init__(self):
+        self.raw_msg = None
+        self.acked = []
+        self.retried = []
+
+    def ack(self):
+        if self.raw_msg is not None:
+            self.acked.append(self.raw_msg.body)
+        self.raw_msg = None
+
+    def msg_to_retry(self):
+        self.retried.append(self.raw_msg.body)
+
+
+class Subscriber:
+    """ what sr_transfer needs from sr_subscribe """
+
+    def __init__(self, concurrency):
+        self.logger = logging.getLogger(__class__.__name__)
+        self.transfer_concurrency = concurrency
+        self.range_streams = 1
+        self.retry_mode = True
+        self.do_downloads = {}
+        self.do_gets = {}
+        self.consumer = Consumer()
+        self.msg = None
+        self.do_task_list = [self.doit_download, self.after_download]
+        self.done = []
+        self.reports = []
+        self.after = []
+        self.threads = set()
+        self.links = []
+
+    def doit_download(self, parent=None):
+        return False
+
+    def after_download(self, parent):
+        self.after.append(self.msg.urlstr)
+        return True
+
+    def __download_attempts__(self):
+        self.threads.add(threading.current_thread())
+        self.links.append(self.http_link)
+        delay = float(self.msg.url.query or 0)
+        time.sleep(delay)
+        self.msg.report_publish(201, 'Downloaded')
+        return 'fail' not in self.msg.urlstr
+
+    def __download_done__(self, ok, need_download, oldname):
+        self.done.append((self.msg.urlstr, ok, self.consumer.raw_msg.body))
+        self.reports.extend(self.msg.reports)
+        if not ok:
+            self.consumer.msg_to_retry()
+        return ok
+
+    def receive(self, urlstr):
+        self.msg = Message(urlstr)
+        self.msg.reports = []
+        self.consumer.raw_msg = raw_message(self.logger)
+        self.consumer.raw_msg.body = urlstr
+        self.consumer.raw_msg.isRetry = False
+
+
+class Discarder(Subscriber):
+    """ downloads new_file into new_dir, and completes with sr_subscribe's discard """
+
+    __download_done__ = sr_subscribe.__download_done__
+
+    def __init__(self, concurrency):
+        super().__init__(concurrency)
+        self.discard = True
+        self.inplace = False
+        self.inline = False
+        self.post_version = 'v02'
+        self.reportback = False
+        self.on_part_list = []
+        self.on_file_list = []
+
+    def __download_attempts__(self):
+        with open(os.path.join(self.msg.new_dir, self.msg.new_file), 'w') as fp:
+            fp.write(self.msg.urlstr)
+        return True
+
+    def receive(self, urlstr, new_dir=None):
+        super().receive(urlstr)
+        self.msg.new_dir = new_dir
+        self.msg.new_file = os.path.basename(self.msg.url.path)
+        self.msg.partflg = '1'
+        self.msg.event = 'modify'
+        self.msg.onfly_checksum = None
+        self.msg.isRetry = False
+
+
+class SrTransferCase(TestCase):
+    def setUp(self) -> None:
+        self.parent = Subscriber(3)
+        self.transfers = sr_transfer(self.parent)
+
+    def tearDown(self) -> None:
+        self.transfers.close()
+
+    def submit(self, urlstr):
+        self.parent.receive(urlstr)
+        self.transfers.submit(None)
+
+    def test_accepts(self):
+        self.parent.do_gets['ftp'] = None
+        inline = Message('http://host/a')
+        inline.headers['content'] = {}
+
+        self.assertTrue(self.transfers.accepts(Message('https://host/a')),
+                        ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_transfer.accepts'))
+        self.assertFalse(self.transfers.accepts(Message('file:/a')),
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_transfer.accepts'))
+        self.assertFalse(self.transfers.accepts(Message('ftp://host/a')),
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_transfer.accepts'))
+        self.assertFalse(self.transfers.accepts(inline), ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_transfer.accepts'))
+
+    def test_submit__hands_over_message(self):
+        self.submit('http://host/a')
+
+        self.assertIsNone(self.parent.consumer.raw_msg, ASSERT_INVALID_VALUE_FMT.format('consumer.raw_msg'))
+        self.assertEqual(1, self.transfers.busy, ASSERT_INVALID_VALUE_FMT.format('sr_transfer.busy'))
+
+    def test_complete__completion_order(self):
+        for urlstr in ['http://host/a?0.3', 'http://host/b?0.1', 'http://host/c?0.2']:
+            self.submit(urlstr)
+        self.parent.receive('http://host/current')
+        current = self.parent.msg
+
+        self.assertTrue(self.transfers.full(), ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_transfer.full'))
+        while self.transfers.busy:
+            self.transfers.complete()
+
+        self.assertEqual([('http://host/b?0.1', True, 'http://host/b?0.1'),
+                          ('http://host/c?0.2', True, 'http://host/c?0.2'),
+                          ('http://host/a?0.3', True, 'http://host/a?0.3')], self.parent.done,
+                         ASSERT_INVALID_VALUE_FMT.format('completions'))
+        self.assertEqual(['http://host/current', 'http://host/b?0.1', 'http://host/c?0.2', 'http://host/a?0.3'],
+                         self.parent.consumer.acked, ASSERT_INVALID_VALUE_FMT.format('acknowledgements'))
+        self.assertEqual(['http://host/b?0.1', 'http://host/c?0.2', 'http://host/a?0.3'], self.parent.after,
+                         ASSERT_INVALID_VALUE_FMT.format('tasks after doit_download'))
+        self.assertIs(current, self.parent.msg, ASSERT_INVALID_VALUE_FMT.format('parent.msg'))
+        self.assertEqual(3, len(self.parent.threads), ASSERT_INVALID_VALUE_FMT.format('worker threads'))
+        self.assertNotIn(threading.current_thread(), self.parent.threads,
+                         ASSERT_INVALID_VALUE_FMT.format('worker threads'))
+
+    def test_complete__reports_from_instance(self):
+        self.submit('http://host/a')
+        self.parent.receive('http://host/current')
+        self.transfers.wait(5)
+
+        self.transfers.complete()
+
+        self.assertEqual(0, self.transfers.busy, ASSERT_INVALID_VALUE_FMT.format('sr_transfer.busy'))
+        self.assertEqual([(201, 'Downloaded', threading.current_thread())], self.parent.reports,
+                         ASSERT_INVALID_VALUE_FMT.format('reports'))
+        self.assertEqual([], self.parent.msg.reports, ASSERT_INVALID_VALUE_FMT.format('reports'))
+
+    def test_complete__own_links(self):
+        self.parent.http_link = Mock()
+        self.submit('http://host/a')
+        self.transfers.wait(5)
+        self.transfers.complete()
+        self.transfers.close()
+
+        self.assertEqual([None], self.parent.links, ASSERT_INVALID_VALUE_FMT.format('worker http_link'))
+        self.parent.http_link.close.assert_not_called()
+
+    def test_complete__failed_to_retry(self):
+        self.submit('http://host/fail')
+        self.submit('http://host/b')
+        self.transfers.wait(5)
+        self.transfers.wait(5)
+
+        self.transfers.complete()
+
+        self.assertEqual(['http://host/fail'], self.parent.consumer.retried,
+                         ASSERT_INVALID_VALUE_FMT.format('retries'))
+        self.assertEqual(['http://host/b'], self.parent.after, ASSERT_INVALID_VALUE_FMT.format('tasks after doit_download'))
+        self.assertEqual(2, len(self.parent.consumer.acked), ASSERT_INVALID_VALUE_FMT.format('acknowledgements'))
+
+    def test_complete__discard_in_message_dir(self):
+        self.transfers.close()
+        self.parent = Discarder(2)
+        self.transfers = sr_transfer(self.parent)
+        cwd = os.getcwd()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dirs = [os.path.join(tmpdir, d) for d in ['a', 'b']]
+            for d in dirs:
+                os.mkdir(d)
+                self.parent.receive('http://host/%s/f' % os.path.basename(d), d)
+                self.transfers.submit(None)
+            os.chdir(dirs[-1])
+            try:
+                while self.transfers.busy:
+                    self.transfers.wait(5)
+                    self.transfers.complete()
+                self.assertEqual(dirs[-1], os.getcwd(), ASSERT_INVALID_VALUE_FMT.format('cwd'))
+            finally:
+                os.chdir(cwd)
+
+            self.assertEqual([[], []], [os.listdir(d) for d in dirs], ASSERT_INVALID_VALUE_FMT.format('discarded files'))
+
+
+def suite():
+    """ Create the test suite that include all sr_transfer test cases
+
+    :return: sr_transfer test suite
+    """
+    sr_transfer_suite = unittest.TestSuite()
+    sr_transfer_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(SrTransferCase))
+    return sr_transfer_suite
+
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
@@ -0,0 +1,220 @@
+""" This file is part of metpx-sarracenia.
+
+metpx-sarracenia
+Documentation: https://github.com/MetPX/sarracenia
+
+test_sr_util.py : test utility tool used for sr_util
+
+Code contributed by:
+ Benoit Lapointe - Shared Services Canada
+"""
+import hashlib
+import io
+import json
+import logging
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+
+import sarra.sr_util
+from sarra.sr_util import decode_body, json_codec, sr_proto, sum_algo_register, sum_file, sum_v2tov3
+
+ASSERT_INVALID_RETURNED_VALUE_FMT = "{} returned a misleading value"
+
+PUBTIME = '20200101120000.123'
+BASEURL = 'http://host/'
+RELPATH = 'a/b/c.txt'
+MD5 = 'd41d8cd98f00b204e9800998ecf8427e'
+SHA512 = 'cf83e1357eefb8bdf1542850d66d8007d620e4050b5715dc83f4a921d36ce9ce47d0d13c5d85f2b0ff8318d2877eec2f63b931bd47417a81a538327af927da3e'
+
+
+class DecodeBodyCase(TestCase):
+    def setUp(self) -> None:
+        self.headers = {'sum': 'd,' + MD5, 'parts': '1,10,1,0,0'}
+        self.notice = '%s %s %s' % (PUBTIME, BASEURL, RELPATH)
+
+    def test_decode_body__v02(self):
+        result = decode_body(self.notice.encode('utf-8'), self.headers)
+
+        expected = (PUBTIME, BASEURL, RELPATH, self.headers, self.notice)
+        self.assertEqual(expected, result, ASSERT_INVALID_RETURNED_VALUE_FMT.format('decode_body'))
+
+    def test_decode_body__early_v03(self):
+        result = decode_body(json.dumps([PUBTIME, BASEURL, RELPATH, self.headers]))
+
+        expected = (PUBTIME, BASEURL, RELPATH, self.headers, self.notice)
+        self.assertEqual(expected, result, ASSERT_INVALID_RETURNED_VALUE_FMT.format('decode_body'))
+
+    def test_decode_body__v03(self):
+        body = {'pubTime': PUBTIME, 'baseUrl': BASEURL, 'relPath': RELPATH, 'size': '10',
+                'integrity': {'method': 'md5', 'value': '1B2M2Y8AsgTpgAmY7PhCfg=='}}
+
+        result = decode_body(json.dumps(body))
+
+        expected = {'pubTime': PUBTIME, 'baseUrl': BASEURL, 'relPath': RELPATH, 'sum': 'd,' + MD5,
+                    'parts': '1,10,1,0,0'}
+        self.assertEqual((PUBTIME, BASEURL, RELPATH, expected, self.notice), result,
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('decode_body'))
+
+    def test_decode_body__v03_blocks(self):
+        body = {'pubTime': PUBTIME, 'baseUrl': BASEURL, 'relPath': RELPATH, 'size': '4',
+                'blocks': {'method': 'inplace', 'size': '4', 'count': '3', 'remainder': '2', 'number': '1'},
+                'integrity': json.dumps({'method': 'cod', 'value': 'sha512'})}
+
+        headers = decode_body(json.dumps(body))[3]
+
+        self.assertEqual('z,s', headers['sum'], ASSERT_INVALID_RETURNED_VALUE_FMT.format('decode_body'))
+        self.assertEqual('i,4,3,2,1', headers['parts'], ASSERT_INVALID_RETURNED_VALUE_FMT.format('decode_body'))
+        self.assertNotIn('size', headers, ASSERT_INVALID_RETURNED_VALUE_FMT.format('decode_body'))
+
+    def test_sum_v2tov3__round_trip(self):
+        for sumstr in ['d,' + MD5, 's,' + SHA512, 'z,d', '0,1234', 'n,' + MD5]:
+            integrity = sum_v2tov3(sumstr)
+            body = {'pubTime': PUBTIME, 'baseUrl': BASEURL, 'relPath': RELPATH, 'integrity': integrity}
+            self.assertEqual(sumstr, decode_body(json.dumps(body))[3]['sum'],
+                             ASSERT_INVALID_RETURNED_VALUE_FMT.format('sum_v2tov3'))
+
+    @patch.dict(sarra.sr_util.sum_algo_v3tov2)
+    @patch.dict(sarra.sr_util.sum_algo_v2tov3)
+    def test_sum_v2tov3__registered(self):
+        sum_algo_register('b', 'blake2b')
+        sumstr = 'b,' + SHA512
+
+        integrity = sum_v2tov3(sumstr)
+        body = {'pubTime': PUBTIME, 'baseUrl': BASEURL, 'relPath': RELPATH, 'integrity': integrity}
+
+        self.assertEqual('blake2b', integrity['method'], ASSERT_INVALID_RETURNED_VALUE_FMT.format('sum_v2tov3'))
+        self.assertEqual(sumstr, decode_body(json.dumps(body))[3]['sum'],
+                         ASSERT_INVALID_RETURNED_VALUE_FMT.format('decode_body'))
+
+
+class JsonCodecCase(TestCase):
+    def setUp(self) -> None:
+        self.headers = {'sum': 'd,' + MD5, 'parts': '1,10,1,0,0', 'to_clusters': 'ALL', 'from_cluster': 'DDSR',
+                        'mtime': '20200101115959.5', 'atime': '20200101115959.5', 'mode': '644',
+                        'filename': 'c.txt', 'note': 'café / "quoted" \\ tab\t'}
+        self.notice = '%s %s %s' % (PUBTIME, BASEURL, RELPATH)
+        body = dict(self.headers, pubTime=PUBTIME, baseUrl=BASEURL, relPath=RELPATH,
+                    integrity={'method': 'md5', 'value': '1B2M2Y8AsgTpgAmY7PhCfg=='})
+        # shapes written by sr_message (v03 body, json outlet), sr_retry and save_message
+        self.objects = [
+            (body, False),
+            (('v02.post.a.b', self.headers, self.notice), True),
+            ([self.headers, self.notice, 1.5], True),
+            ((PUBTIME, BASEURL, RELPATH, self.headers), True),
+            ({'method': 'md5', 'value': '1B2M2Y8AsgTpgAmY7PhCfg=='}, False),
+        ]
+
+    def tearDown(self) -> None:
+        json_codec.set('json')
+
+    def test_default__byte_for_byte(self):
+        self.assertEqual('json', json_codec.name, ASSERT_INVALID_RETURNED_VALUE_FMT.format('json_codec.name'))
+        for obj, sort_keys in self.objects:
+            self.assertEqual(json.dumps(obj, sort_keys=sort_keys), json_codec.dumps(obj, sort_keys=sort_keys),
+                             ASSERT_INVALID_RETURNED_VALUE_FMT.format('json_codec.dumps'))
+            text = json.dumps(obj, sort_keys=sort_keys)
+            self.assertEqual(json.loads(text), json_codec.loads(text),
+                             ASSERT_INVALID_RETURNED_VALUE_FMT.format('json_codec.loads'))
+
+    def test_set__unknown(self):
+        self.assertFalse(json_codec.set('nosuchcodec'), ASSERT_INVALID_RETURNED_VALUE_FMT.format('json_codec.set'))
+        self.assertEqual('json', json_codec.name, ASSERT_INVALID_RETURNED_VALUE_FMT.format('json_codec.name'))
+
+    def test_fast_codecs__compatible(self):
+        for name in ['orjson', 'ujson']:
+            with self.subTest(codec=name):
+                if not json_codec.set(name):
+                    continue
+                for obj, sort_keys in self.objects:
+                    text = json_codec.dumps(obj, sort_keys=sort_keys)
+                    expected = json.loads(json.dumps(obj))
+                    self.assertIsInstance(text, str, ASSERT_INVALID_RETURNED_VALUE_FMT.format('json_codec.dumps'))
+                    self.assertEqual(expected, json.loads(text),
+                                     ASSERT_INVALID_RETURNED_VALUE_FMT.format('json_codec.dumps'))
+                    self.assertEqual(expected, json_codec.loads(json.dumps(obj, sort_keys=sort_keys)),
+                                     ASSERT_INVALID_RETURNED_VALUE_FMT.format('json_codec.loads'))
+                    if sort_keys:
+                        self.assertEqual(json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False),
+                                         text, ASSERT_INVALID_RETURNED_VALUE_FMT.format('json_codec.dumps'))
+                self.assertEqual((PUBTIME, BASEURL, RELPATH, self.headers, self.notice),
+                                 decode_body(json_codec.dumps([PUBTIME, BASEURL, RELPATH, self.headers])),
+                                 ASSERT_INVALID_RETURNED_VALUE_FMT.format('decode_body'))
+
+
+class Md5:
+    def __init__(self):
+        self.filehash = hashlib.md5()
+
+    def get_value(self):
+        return self.filehash.hexdigest()
+
+    def set_path(self, path):
+        self.filehash = hashlib.md5()
+
+    def update(self, chunk):
+        self.filehash.update(chunk)
+
+
+class SrProtoCase(TestCase):
+    def setUp(self) -> None:
+        self.logger = logging.getLogger(__class__.__name__)
+        self.bufsize = 1000
+        self.kbytes_ps = 0
+        self.timeout = 0
+        self.on_data_list = []
+        self.data = bytes(range(256)) * 20
+
+    def copy(self, length=0):
+        proto = sr_proto(self)
+        proto.set_sumalgo(Md5())
+        dst = io.BytesIO()
+        rw_length = proto.read_write(io.BytesIO(self.data), dst, length)
+        return rw_length, dst.getvalue(), proto.sumalgo.get_value()
+
+    def test_read_write__fast_path(self):
+        for length in [0, 1000, 2500, len(self.data)]:
+            with self.subTest(length=length):
+                expected = self.data[:length] if length else self.data
+                self.assertEqual((len(expected), expected, hashlib.md5(expected).hexdigest()), self.copy(length),
+                                 ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_proto.read_write'))
+
+    def test_read_write__on_data(self):
+        fast = self.copy(2500)
+        self.on_data_list = [lambda proto, chunk: chunk]
+
+        self.assertEqual(fast[:2], self.copy(2500)[:2], ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_proto.read_write'))
+
+    @patch.multiple(sarra.sr_util, HASH_OVERLAP_MIN=1, HASH_OVERLAP_CPUS=2, HASH_OVERLAP_BUFSIZE=1)
+    def test_read_write__hasher_thread(self):
+        for length in [0, 2500]:
+            with self.subTest(length=length):
+                expected = self.data[:length] if length else self.data
+                self.assertEqual((len(expected), expected, hashlib.md5(expected).hexdigest()), self.copy(length),
+                                 ASSERT_INVALID_RETURNED_VALUE_FMT.format('sr_proto.read_write'))
+
+    @patch.multiple(sarra.sr_util, HASH_OVERLAP_MIN=1, HASH_OVERLAP_CPUS=2, HASH_OVERLAP_BUFSIZE=1)
+    def test_sum_file__hasher_error(self):
+        class Broken(Md5):
+            def update(self, chunk):
+                raise ValueError('broken')
+
+        with self.assertRaises(ValueError):
+            sum_file(Broken(), __file__, 0, 0, self.bufsize)
+
+
+def suite():
+    """ Create the test suite that include all sr_util test cases
+
+    :return: sr_util test suite
+    """
+    sr_util_suite = unittest.TestSuite()
+    sr_util_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(DecodeBodyCase))
+    sr_util_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(JsonCodecCase))
+    sr_util_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(SrProtoCase))
+    return sr_util_suite
+
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
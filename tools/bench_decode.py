@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#
+# bench_decode.py : micro-benchmark of message decoding, in messages per second, for
+#                   v02, early v03 and v03 bodies, through sr_message.from_amqplib
+#                   (consumers) and sr_retry.msgToJSON (retry persistence), once with
+#                   each json_codec available.
+#
+# usage: bench_decode.py [count]
+#
+
+import json, os, sys, tempfile, time
+
+try :
+         from sr_config          import *
+         from sr_message         import *
+         from sr_retry           import *
+except :
+         from sarra.sr_config    import *
+         from sarra.sr_message   import *
+         from sarra.sr_retry     import *
+
+pubtime = '20200101120000.123'
+baseurl = 'http://hpfx.collab.science.gc.ca/'
+relpath = '20200101/WXO-DD/observations/swob-ml/20200101/CXAG/2020-01-01-1200-CXAG-AUTO-swob.xml'
+md5     = 'd41d8cd98f00b204e9800998ecf8427e'
+headers = { 'sum': 'd,' + md5, 'parts': '1,5120,1,0,0', 'from_cluster': 'DDSR.CMC',
+            'source': 'WXO-DD', 'to_clusters': 'DDSR.CMC,DDI.CMC', 'mtime': pubtime }
+
+v03     = { 'pubTime': '20200101T120000.123', 'baseUrl': baseurl, 'relPath': relpath,
+            'integrity': { 'method': 'md5', 'value': '1B2M2Y8AsgTpgAmY7PhCfg==' }, 'size': 5120,
+            'from_cluster': 'DDSR.CMC', 'source': 'WXO-DD', 'to_clusters': 'DDSR.CMC,DDI.CMC',
+            'mtime': '20200101T120000.123' }
+
+bodies  = [ ( 'v02',       'v02.post.' + relpath.replace('/','.'), '%s %s %s' % (pubtime, baseurl, relpath), headers ),
+            ( 'early v03', 'v03.post.' + relpath.replace('/','.'), json.dumps([pubtime, baseurl, relpath, headers]), {} ),
+            ( 'v03',       'v03.post.' + relpath.replace('/','.'), json.dumps(v03), {} ) ]
+
+
+def raw(logger, topic, body, hdrs):
+    msg = raw_message(logger)
+    msg.delivery_info['exchange']         = 'xpublic'
+    msg.delivery_info['routing_key']      = topic
+    msg.properties['application_headers'] = dict(hdrs)
+    msg.body                              = body
+    msg.isRetry                           = False
+    return msg
+
+
+def rate(count, f):
+    start = time.perf_counter()
+    for i in range(count): f()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    cfg = sr_config()
+    cfg.configure()
+    cfg.option(['loglevel', 'error'])
+    cfg.retry_path = tempfile.mkdtemp() + os.sep + 'bench.retry'
+
+    message = sr_message(cfg)
+    retry   = sr_retry(cfg, 'files')
+
+    print("%-8s %-10s %15s %15s" % ( 'codec', 'format', 'from_amqplib/s', 'msgToJSON/s' ))
+    for codec in json_codec.codecs :
+        json_codec.set(codec)
+        for name, topic, body, hdrs in bodies :
+            decoded = rate(count, lambda: message.from_amqplib(raw(cfg.logger, topic, body, hdrs)))
+            encoded = rate(count, lambda: retry.msgToJSON(raw(cfg.logger, topic, body, hdrs)))
+            print("%-8s %-10s %15.0f %15.0f" % ( codec, name, decoded, encoded ))
+
+
+if __name__ == "__main__":
+    main()
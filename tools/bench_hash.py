@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#
+# bench_hash.py : GB/s of each checksum algorithm available (sum plugins reading the data),
+#                 then large file checksum (sum_file) and copy (readinto_copy) in MB/s,
+#                 with the sum computed inline and in a sr_hasher thread,
+#                 for md5 ('d') and sha512 ('s') at a few bufsizes.
+#                 the thread is forced, even when the instance has a single cpu.
+#
+# usage: bench_hash.py [size_mb]
+#
+
+import os, sys, tempfile, time
+
+try :
+         import sr_util
+         from sr_config          import *
+except :
+         import sarra.sr_util as sr_util
+         from sarra.sr_config    import *
+
+
+def rate(size, f):
+    start = time.perf_counter()
+    f()
+    return size / (time.perf_counter() - start) / 1e6
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+
+    cfg = sr_config()
+    cfg.configure()
+    cfg.option(['loglevel', 'error'])
+
+    tmpdir = tempfile.mkdtemp()
+    src    = tmpdir + os.sep + 'src'
+    dst    = tmpdir + os.sep + 'dst'
+
+    block  = os.urandom(1024*1024)
+    with open(src,'wb') as f :
+         for i in range(size_mb) : f.write(block)
+    size   = os.path.getsize(src)
+
+    def copy(sumalgo, bufsize):
+        with open(src,'rb') as s, open(dst,'wb') as d :
+             sr_util.readinto_copy(s, d, sumalgo, 0, bufsize)
+
+    overlap = sr_util.HASH_OVERLAP_MIN
+    cpus    = sr_util.HASH_OVERLAP_CPUS
+    sr_util.HASH_OVERLAP_CPUS = 2
+
+    print("%d MB file, %d cpus" % ( size_mb, cpus ))
+
+    try :
+            # algorithms, on data in memory and on the file
+
+            sr_util.HASH_OVERLAP_MIN = size+1
+            print("%-4s %-10s %12s %12s" % ( 'sum', 'v03', 'memory GB/s', 'file GB/s' ))
+            for flg in sorted(cfg.sumalgos) :
+                sumalgo = cfg.sumalgos[flg]
+                if not sumalgo.reads_data() : continue
+                sumalgo.set_path(src)
+                inmem   = rate(len(block)*64, lambda: [ sumalgo.update(block) for i in range(64) ]) / 1000
+                sumalgo.set_path(src)
+                summed  = rate(size, lambda: sr_util.sum_file(sumalgo, src, 0, 0, 1024*1024)) / 1000
+                print("%-4s %-10s %12.2f %12.2f" % ( flg, sumalgo.registered_as_v03(), inmem, summed ))
+            print()
+
+            print("%-4s %8s %-6s %10s %10s" % ( 'sum', 'bufsize', 'hash', 'sum MB/s', 'copy MB/s' ))
+            for flg in [ 'd', 's' ] :
+                cfg.set_sumalgo(flg)
+                sumalgo = cfg.sumalgo
+                for bufsize in [ 8192, 65536, 1024*1024 ] :
+                    for mode in [ 'inline', 'thread' ] :
+                        sr_util.HASH_OVERLAP_MIN = overlap if mode == 'thread' else size+1
+                        sumalgo.set_path(src)
+                        summed = rate(size, lambda: sr_util.sum_file(sumalgo, src, 0, 0, bufsize))
+                        copied = rate(size, lambda: copy(sumalgo, bufsize))
+                        print("%-4s %8d %-6s %10.0f %10.0f" % ( flg, bufsize, mode, summed, copied ))
+    finally :
+            sr_util.HASH_OVERLAP_MIN  = overlap
+            sr_util.HASH_OVERLAP_CPUS = cpus
+            for f in [ src, dst ] :
+                if os.path.exists(f) : os.unlink(f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#
+# bench_polling.py : seconds per pass of the force_polling observers on a generated tree,
+#                    watchdog's PollingObserver (a DirectorySnapshot of the whole tree per pass)
+#                    against sr_polling, with nothing changed, and with a few files created,
+#                    with 1 and 4 walk_threads, and a rescan (polling_rescan 0 : every pass).
+#
+# usage: bench_polling.py [directories] [files_per_directory]
+#
+
+import logging, os, shutil, sys, tempfile, time
+
+from watchdog.utils.dirsnapshot import DirectorySnapshot
+
+try :
+         from sr_polling         import *
+except :
+         from sarra.sr_polling   import *
+
+
+class parent:
+    logger         = logging.getLogger('bench_polling')
+    sleep          = 5
+    polling_rescan = 3600
+
+    def __init__(self, walk_threads):
+        self.walk_threads = walk_threads
+        self.events       = 0
+
+    def on_add(self, event, src, dst):
+        self.events += 1
+
+
+def generate(root, dirs, files):
+    for d in range(dirs):
+        path = os.path.join(root, 'd%03d' % (d % 20), 's%05d' % d)
+        os.makedirs(path)
+        for f in range(files):
+            with open(os.path.join(path, 'f%05d' % f), 'wb') as fp : fp.write(b'x')
+
+
+def timed(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def main():
+    dirs  = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    root = tempfile.mkdtemp()
+    generate(root, dirs, files)
+
+    print("%d directories, %d files" % ( dirs, dirs * files ))
+    print("%-24s %8s %10s" % ( 'observer', 'threads', 'seconds' ))
+
+    try :
+            elapsed = timed(lambda: DirectorySnapshot(root, recursive=True))
+            print("%-24s %8d %10.3f" % ( 'watchdog, per pass', 1, elapsed ))
+
+            for threads in [ 1, 4 ] :
+                observer = sr_polling(parent(threads))
+                elapsed = timed(lambda: observer.schedule(None, root))
+                print("%-24s %8d %10.3f" % ( 'sr_polling, schedule', threads, elapsed ))
+
+                # tree as it would be after a while (directories and files older than POLL_RACY and POLL_HOT)
+                observer.hot.clear()
+                observer.dirs = { d : ( os.stat(d).st_mtime_ns, e ) for d, ( m, e ) in observer.dirs.items() }
+
+                elapsed = timed(observer.poll)
+                print("%-24s %8d %10.3f" % ( 'sr_polling, unchanged', threads, elapsed ))
+
+                for i in range(10) :
+                    with open(os.path.join(root, 'd%03d' % i, 's%05d' % i, 'new%d' % threads), 'wb') as fp : fp.write(b'x')
+                elapsed = timed(observer.poll)
+                print("%-24s %8d %10.3f" % ( 'sr_polling, 10 created', threads, elapsed ))
+
+                observer.rescan = 0
+                elapsed = timed(observer.poll)
+                print("%-24s %8d %10.3f" % ( 'sr_polling, rescan', threads, elapsed ))
+                observer.stop()
+    finally :
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
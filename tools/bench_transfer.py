@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+#
+# bench_transfer.py : throughput of the sr_proto copy loop, in MB/s and CPU seconds per GB,
+#                     for a local file, a local http server and (optionally) an sftp server,
+#                     with the readinto fast path and with the general read loop
+#                     (forced by a pass-through on_data plugin).
+#
+# usage: bench_transfer.py [size_mb] [bufsize] [sftp://user@host/path/of/remote/file]
+#
+#        the sftp file is read as is, credentials come from credentials.conf or ~/.ssh
+#
+
+import os, socket, subprocess, sys, tempfile, time
+
+try :
+         from sr_config          import *
+         from sr_http            import *
+         from sr_sftp            import *
+except :
+         from sarra.sr_config    import *
+         from sarra.sr_http      import *
+         from sarra.sr_sftp      import *
+
+
+def passthrough(proto, chunk):
+    return chunk
+
+
+def measure(cfg, mode, size, transfer):
+    cfg.on_data_list = [ passthrough ] if mode == 'read' else []
+
+    wall = time.perf_counter()
+    cpu  = time.process_time()
+    transfer()
+    wall = time.perf_counter() - wall
+    cpu  = time.process_time() - cpu
+
+    return size / wall / 1e6, cpu / (size / 1e9)
+
+
+def prepare(proto, cfg):
+    cfg.set_sumalgo('d')
+    proto.set_sumalgo(cfg.sumalgo)
+    # data_sumalgo is the same object, keep on_data from summing twice
+    proto.data_sumalgo = None
+
+
+def local(cfg, src, dst):
+    proto = sr_proto(cfg)
+    prepare(proto, cfg)
+    proto.read_writelocal(src, open(src,'rb'), dst)
+
+
+def http_get(cfg, port, dst):
+    cfg.destination = 'http://127.0.0.1:%d' % port
+    proto = sr_http(cfg)
+    proto.connect()
+    proto.cd('bench')
+    prepare(proto, cfg)
+    proto.get('src', dst)
+    proto.close()
+
+
+def sftp_get(cfg, url, dst):
+    cfg.destination = '%s://%s' % (url.scheme, url.netloc)
+    proto = sr_sftp(cfg)
+    proto.connect()
+    proto.cd(os.path.dirname(url.path))
+    prepare(proto, cfg)
+    proto.get(os.path.basename(url.path), dst)
+    proto.close()
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    bufsize = sys.argv[2] if len(sys.argv) > 2 else None
+    sftp    = urllib.parse.urlparse(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    cfg = sr_config()
+    cfg.configure()
+    cfg.option(['loglevel', 'error'])
+    if bufsize : cfg.option(['bufsize', bufsize])
+
+    tmpdir = tempfile.mkdtemp()
+    os.mkdir(tmpdir + os.sep + 'bench')
+    src    = tmpdir + os.sep + 'bench' + os.sep + 'src'
+    dst    = tmpdir + os.sep + 'dst'
+
+    block  = os.urandom(1024*1024)
+    with open(src,'wb') as f :
+         for i in range(size_mb) : f.write(block)
+    size   = os.path.getsize(src)
+
+    s = socket.socket()
+    s.bind(('127.0.0.1',0))
+    port = s.getsockname()[1]
+    s.close()
+    server = subprocess.Popen([ sys.executable, '-m', 'http.server', '--bind', '127.0.0.1', '--directory', tmpdir, str(port) ],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1)
+
+    cases = [ ( 'local', lambda: local(cfg, src, dst) ),
+              ( 'http',  lambda: http_get(cfg, port, dst) ) ]
+    if sftp :
+       cases.append( ( 'sftp', lambda: sftp_get(cfg, sftp, dst) ) )
+
+    try :
+            print("%-6s %-9s %10s %12s" % ( 'source', 'loop', 'MB/s', 'CPU s/GB' ))
+            for name, transfer in cases :
+                for mode in [ 'read', 'readinto' ] :
+                    if name == 'sftp' :
+                       transfer()
+                       size = os.path.getsize(dst)
+                    rate, cpu = measure(cfg, mode, size, transfer)
+                    print("%-6s %-9s %10.0f %12.3f" % ( name, mode, rate, cpu ))
+    finally :
+            server.terminate()
+            for f in [ src, dst ] :
+                if os.path.exists(f) : os.unlink(f)
+
+
+if __name__ == "__main__":
+    main()
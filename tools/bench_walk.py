@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+#
+# bench_walk.py : files/s of the sr_post walk (post_on_start) on a generated tree,
+#                 the previous os.listdir walk against the os.scandir walk,
+#                 with 1 to 8 walk_threads.  posting itself is replaced by a counter.
+#
+# usage: bench_walk.py [directories] [files_per_directory] [tree_root]
+#
+#        the tree is generated (two levels of directories) unless tree_root is given.
+#
+
+import logging, os, shutil, sys, tempfile, time
+
+try :
+         from sr_post            import *
+except :
+         from sarra.sr_post      import *
+
+
+class counting_walker(sr_post):
+
+    def __init__(self, walk_threads):
+        self.logger          = logging.getLogger('bench_walk')
+        self.realpath_post   = False
+        self.follow_symlinks = False
+        self.walk_threads    = walk_threads
+        self.snapshot        = None
+        self.count           = 0
+
+    def post_file(self, path, lstat):
+        self.count += 1
+
+    def post_link(self, path):
+        self.count += 1
+
+    # the walk before os.scandir, for reference
+    def listdir_walk(self, src):
+        for x in os.listdir(src):
+            path = src + '/' + x
+            if os.path.isdir(path):
+               self.listdir_walk(path)
+               continue
+            if os.path.exists(path):
+                self.post1file(path,os.stat(path))
+
+
+def generate(root, dirs, files):
+    per_level = max(1, int(dirs ** 0.5))
+    for d in range(dirs):
+        path = os.path.join(root, 'd%03d' % (d % per_level), 's%05d' % d)
+        os.makedirs(path)
+        for f in range(files):
+            with open(os.path.join(path, 'f%05d' % f), 'wb') as fp : fp.write(b'x')
+
+
+def main():
+    dirs  = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    root  = sys.argv[3] if len(sys.argv) > 3 else None
+
+    tmpdir = None
+    if not root :
+       tmpdir = tempfile.mkdtemp()
+       root   = tmpdir
+       generate(root, dirs, files)
+
+    print("%-8s %8s %10s %10s" % ( 'walk', 'threads', 'files', 'files/s' ))
+
+    try :
+            for name, threads in [ ('listdir',1), ('scandir',1), ('scandir',2), ('scandir',4), ('scandir',8) ] :
+                walker = counting_walker(threads)
+                start  = time.perf_counter()
+                if name == 'listdir' : walker.listdir_walk(root)
+                else                 : walker.walk(root)
+                elapsed = time.perf_counter() - start
+                print("%-8s %8d %10d %10.0f" % ( name, threads, walker.count, walker.count / elapsed ))
+    finally :
+            if tmpdir : shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()